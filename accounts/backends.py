@@ -0,0 +1,58 @@
+"""
+Authentication backend that resolves ``request.user`` from the cache.
+
+Django loads the session and then the user row on every authenticated
+request. Sessions come from the cache through the ``cached_db`` engine
+(see ``SESSION_ENGINE``). This backend does the same for users: a plain
+copy of each user's row is kept under ``accounts:user:<id>``.
+
+The copy is written through by the ``User`` signals in
+``accounts.signals``, so logins (which save ``last_login``) and profile or
+role changes show up on the next request. A save drops the old copy at
+once and caches the new one when its transaction commits, so a rolled
+back change is never served. Changes that bypass ``save()`` are picked up
+when the entry expires after ``USER_CACHE_TTL`` seconds. All of this
+assumes one cache shared by every worker; ``accounts.checks`` refuses a
+per-process one.
+"""
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from .models import User
+
+USER_CACHE_TTL = 5 * 60
+
+
+def user_cache_key(user_id):
+    return f'accounts:user:{user_id}'
+
+
+def remember_user(user):
+    """Cache a copy of ``user`` holding only its column values, once the current transaction commits"""
+    key = user_cache_key(user.pk)
+    cache.delete(key)
+    fields = [field.attname for field in User._meta.concrete_fields]
+    values = vars(user)
+    if not all(name in values for name in fields):
+        return  # Deferred fields would cost a query on every request; the next lookup loads the row
+    # A fresh instance leaves caches of related objects and permissions behind
+    copy = User.from_db(user._state.db, fields, [values[name] for name in fields])
+    transaction.on_commit(lambda: cache.set(key, copy, USER_CACHE_TTL), using=user._state.db)
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` whose ``get_user`` reads the cache first"""
+
+    def get_user(self, user_id):
+        user = cache.get(user_cache_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                remember_user(user)
+            return user
+        return user if self.user_can_authenticate(user) else None
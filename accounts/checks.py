@@ -0,0 +1,29 @@
+"""
+Refuse a cache that only one worker process can see.
+
+Sessions (``cached_db``), ``CachedModelBackend`` and the versions behind
+fragments and the reference registries rely on every worker reading the
+same cache. With a per-process cache a logout, a deactivated account or a
+saved row is only seen by the worker that handled it.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [Error(
+        f'The default cache ({backend}) is not shared between worker processes.',
+        hint='Use Redis, Memcached or a file-based cache all workers can reach.',
+        obj='CACHES',
+        id='accounts.E001',
+    )]
@@ -1,3 +1,107 @@
-from django.test import TestCase
+import os
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.test import TestCase, override_settings
+from smartcity.cache import FileCache
+from smartcity.testing import in_another_process, isolated_cache
+from .backends import CachedModelBackend, forget_user, user_cache_key
+from .models import User
+
+
+class CachedUserTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+
+    def test_user_is_served_from_the_cache_after_first_lookup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.backend.get_user(self.citizen.pk), self.citizen)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.citizen.pk)
+        self.assertEqual(user.role, 'citizen')
+
+    def test_saves_are_written_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.backend.get_user(self.citizen.pk)
+            self.citizen.role = 'emergency_operator'
+            self.citizen.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.citizen.pk).role, 'emergency_operator')
+
+    def test_uncommitted_save_only_drops_the_entry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.backend.get_user(self.citizen.pk)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.citizen.phone_number = '9000000000'
+            self.citizen.save()
+        self.assertIsNone(cache.get(user_cache_key(self.citizen.pk)))
+
+    def test_inactive_and_deleted_users_are_refused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.citizen.is_active = False
+            self.citizen.save()
+        self.assertIsNone(self.backend.get_user(self.citizen.pk))
+
+        self.citizen.delete()
+        self.assertIsNone(cache.get(user_cache_key(self.citizen.pk)))
+        self.assertIsNone(self.backend.get_user(self.citizen.pk))
+
+    def test_login_requests_skip_session_and_user_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        with self.assertNumQueries(0):
+            response = self.client.get('/accounts/profile/')
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
+
+    def test_changes_made_by_another_worker_are_seen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+            self.backend.get_user(self.citizen.pk)
+        session_key = self.client.session.session_key
+
+        # Another worker deactivates the user, dropping the cached copy
+        User.objects.filter(pk=self.citizen.pk).update(is_active=False)
+        in_another_process(forget_user, self.citizen.pk)
+        self.assertIsNone(self.backend.get_user(self.citizen.pk))
+
+        # ... or logs the session out
+        Session.objects.filter(session_key=session_key).delete()
+        in_another_process(cache.delete, KEY_PREFIX + session_key)
+        response = self.client.get('/accounts/profile/')
+        self.assertRedirects(response, '/accounts/login/?next=/accounts/profile/', fetch_redirect_response=False)
+
+    def test_process_local_cache_is_refused(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertIn('accounts.E001', [message.id for message in run_checks(tags=['caches'])])
+        self.assertNotIn('accounts.E001', [message.id for message in run_checks(tags=['caches'])])
+
+    def test_tests_have_a_cache_of_their_own(self):
+        # cache.clear() in a test must never log out the users of the real cache
+        location = str(settings.CACHES['default']['LOCATION'])
+        self.assertTrue(os.path.basename(location).startswith('smartcity-cache-'))
+        self.assertFalse(location.startswith(str(settings.BASE_DIR)))
+
+    def test_file_cache_counts_its_files_every_so_many_writes(self):
+        with isolated_cache() as directory, mock.patch('smartcity.cache.CULL_EVERY', 10):
+            with override_settings(CACHES={'default': {
+                **settings.CACHES['default'], 'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_FREQUENCY': 2},
+            }}):
+                listing = mock.patch.object(
+                    FileCache, '_list_cache_files', autospec=True, side_effect=FileCache._list_cache_files,
+                )
+                with listing as listed:
+                    for n in range(20):
+                        cache.set(f'key-{n}', n)
+                self.assertEqual(listed.call_count, 2)
+                self.assertLess(len(os.listdir(directory)), 20)
@@ -0,0 +1,77 @@
+"""
+Per-citizen change versions behind the citizen status API.
+
+Each ``CitizenCounter`` row (one per citizen and domain) also carries a
+``version`` and a ``changed_at``. Whenever one of the citizen's records
+in that domain is saved, deleted or changed in bulk, ``bump`` adds one to
+the version and moves ``changed_at`` up to the time of the change. It
+does this in the transaction that changes the record, so every worker
+sees the new version exactly when it sees the new data. Saves, deletes
+and ``QuerySet.update()`` changes are bumped through
+``dashboard.transitions`` along with the rollups and counters. ``counters.rebuild`` starts the rows again from
+the latest ``updated_at`` of each citizen's records.
+
+``validators`` reads the row with one lookup on the ``(user, domain)``
+key and turns it into an ETag and a Last-Modified time. The API views
+answer a matching ``If-None-Match`` or ``If-Modified-Since`` with 304
+before they read any listing. HTTP dates only have whole seconds, so
+Last-Modified is left out while the second of the last change is still
+under way. Otherwise a second change in that same second would look
+unchanged to a client that only sends ``If-Modified-Since``.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from smartcity import fragments
+from .models import CitizenCounter
+
+
+def bump(domain, citizen_ids, at=None):
+    """New versions for ``citizen_ids`` in ``domain``, changed at ``at`` (now by default)"""
+    ids = sorted({citizen_id for citizen_id in citizen_ids if citizen_id is not None})
+    if not ids:
+        return
+    at = at or timezone.now()
+    CitizenCounter.objects.filter(domain=domain, user_id__in=ids).update(
+        version=F('version') + 1,
+        # Never backwards, or a client's If-Modified-Since would cover the change
+        changed_at=Greatest(Coalesce('changed_at', Value(at)), Value(at)),
+    )
+
+
+def validators(domain, citizen_id, variant='', depends=()):
+    """
+    ``(etag, last_modified)`` of a citizen's listing in ``domain``; either
+    may be None. ``variant`` tells apart listings of the same version (a
+    page cursor). ``depends`` are ``(label, pk)`` fragment versions the
+    listing also shows, such as a reference table under ``fragments.ALL``.
+    """
+    row = CitizenCounter.objects.filter(user_id=citizen_id, domain=domain).values_list('pk', 'version', 'changed_at').first()
+    if row is None:
+        return None, None  # Nothing filed yet, or the counters are being rebuilt
+    pk, version, changed_at = row
+    dependency_keys = [fragments.version_key(label, pk) for label, pk in depends]
+    found = cache.get_many(dependency_keys) if dependency_keys else {}
+    # The row id changes when the counters are rebuilt, which restarts the version
+    parts = [str(pk), str(version), variant, *(str(found.get(key)) for key in dependency_keys)]
+    etag = '"%s"' % hashlib.md5('|'.join(parts).encode()).hexdigest()
+    last_modified = None
+    if changed_at is not None and int(changed_at.timestamp()) < int(timezone.now().timestamp()):
+        last_modified = int(changed_at.timestamp())
+    return etag, last_modified
+
+
+def stamp(response, etag, last_modified):
+    """Put the validators on a listing or 304 response; clients must revalidate before reusing it"""
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
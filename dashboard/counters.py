@@ -0,0 +1,143 @@
+"""
+Per-citizen counters behind the citizen dashboard.
+
+Every citizen has one ``CitizenCounter`` row per domain (emergencies,
+complaints) holding how many records they filed and how many of those are
+pending and resolved. Creating, deleting or changing the status of a
+record moves it between counts through ``dashboard.transitions``, called
+by the model signals and by code that changes statuses with
+``QuerySet.update()``. ``EmergencyRequest.save`` and ``Complaint.save``
+wrap the write in a transaction, so a counter never changes without its
+row (deletes run in one already). The dashboard reads both domains with
+one lookup on the ``(user, domain)`` key instead of counting.
+
+Bulk loads should call ``rebuild()``; ``reconcile()`` repairs just the
+rows that drifted.
+"""
+
+from collections import Counter
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from .models import CitizenCounter
+
+# domain -> model label
+DOMAINS = {
+    'emergency': 'emergency.EmergencyRequest',
+    'complaint': 'utilities.Complaint',
+}
+FIELDS = ('pending', 'resolved', 'total')
+
+
+def state(values):
+    """``(citizen_id, status)`` of a record's field ``values``, or None if either is missing"""
+    if 'citizen_id' not in values or 'status' not in values:
+        return None
+    return values['citizen_id'], values['status']
+
+
+def counts(status):
+    """What one record in ``status`` adds to its citizen's counters"""
+    return {'pending': int(status == 'pending'), 'resolved': int(status == 'resolved'), 'total': 1}
+
+
+def changes(old, new):
+    """``{(citizen_id, field): delta}`` for a record moving from ``old`` to ``new`` (either may be None)"""
+    deltas = Counter()
+    for current, sign in ((old, -1), (new, 1)):
+        if current is None or current[0] is None:
+            continue
+        citizen_id, status = current
+        for field, n in counts(status).items():
+            deltas[(citizen_id, field)] += sign * n
+    return deltas
+
+
+def apply(domain, deltas):
+    """Add ``deltas`` (``{(citizen_id, field): n}``) to the citizens' rows"""
+    by_citizen = {}
+    for (citizen_id, field), delta in deltas.items():
+        if delta:
+            by_citizen.setdefault(citizen_id, {})[field] = delta
+    if not by_citizen:
+        return
+    with transaction.atomic():
+        # A fixed order keeps concurrent writers from waiting on each other in a cycle
+        for citizen_id in sorted(by_citizen):
+            change = by_citizen[citizen_id]
+            row = CitizenCounter.objects.filter(user_id=citizen_id, domain=domain)
+            if row.update(**{field: F(field) + delta for field, delta in change.items()}):
+                continue
+            if any(delta < 0 for delta in change.values()):
+                continue  # Nothing counted to take from (or the citizen is being deleted); reconcile() settles it
+            try:
+                with transaction.atomic():
+                    CitizenCounter.objects.create(user_id=citizen_id, domain=domain, **change)
+            except IntegrityError:
+                # Another writer created the row first
+                row.update(**{field: F(field) + delta for field, delta in change.items()})
+
+
+def compute(domain):
+    """``{citizen_id: {field: n}}`` counted from the source table"""
+    rows = apps.get_model(DOMAINS[domain]).objects.order_by().values('citizen_id').annotate(
+        pending=Count('id', filter=Q(status='pending')),
+        resolved=Count('id', filter=Q(status='resolved')),
+        total=Count('id'),
+    )
+    return {row['citizen_id']: {field: row[field] for field in FIELDS} for row in rows.iterator()}
+
+
+def rebuild(domains=DOMAINS):
+    """Replace the counters of ``domains`` with freshly computed ones"""
+    with transaction.atomic():
+        for domain in domains:
+            CitizenCounter.objects.filter(domain=domain).delete()
+            # Change versions (dashboard.changes) start again from the latest change
+            changed = dict(
+                apps.get_model(DOMAINS[domain]).objects.order_by().values('citizen_id')
+                .annotate(latest=Max('updated_at')).values_list('citizen_id', 'latest')
+            )
+            CitizenCounter.objects.bulk_create(
+                (
+                    CitizenCounter(user_id=citizen_id, domain=domain, changed_at=changed.get(citizen_id), **values)
+                    for citizen_id, values in compute(domain).items()
+                ),
+                batch_size=5000,
+            )
+
+
+def drift(domain):
+    """``{citizen_id: (stored, actual)}`` for every citizen whose counters disagree with the source table"""
+    stored = {
+        row['user_id']: {field: row[field] for field in FIELDS}
+        for row in CitizenCounter.objects.filter(domain=domain).values('user_id', *FIELDS).iterator()
+    }
+    actual = compute(domain)
+    empty = dict.fromkeys(FIELDS, 0)
+    return {
+        citizen_id: (stored.get(citizen_id, empty), actual.get(citizen_id, empty))
+        for citizen_id in stored.keys() | actual.keys()
+        if stored.get(citizen_id, empty) != actual.get(citizen_id, empty)
+    }
+
+
+def reconcile(domain):
+    """Rewrite the rows of citizens whose counters drifted; returns how many were repaired"""
+    with transaction.atomic():
+        drifted = drift(domain)
+        for citizen_id, (_, actual) in drifted.items():
+            if not any(actual.values()):
+                CitizenCounter.objects.filter(user_id=citizen_id, domain=domain).delete()
+            else:
+                CitizenCounter.objects.update_or_create(user_id=citizen_id, domain=domain, defaults=actual)
+    return len(drifted)
+
+
+def for_citizen(user):
+    """``{domain: {field: n}}`` of one citizen, read in a single query"""
+    result = {domain: dict.fromkeys(FIELDS, 0) for domain in DOMAINS}
+    for row in CitizenCounter.objects.filter(user=user).values('domain', *FIELDS):
+        result[row['domain']] = {field: row[field] for field in FIELDS}
+    return result
@@ -0,0 +1,184 @@
+"""
+Streaming extracts of complaints, emergencies and dispatches.
+
+``stream`` reads a dataset through ``QuerySet.iterator()``, which fetches
+``CHUNK_SIZE`` rows at a time from one cursor (a server-side cursor where
+the database has them), and encodes the rows as CSV or NDJSON into pieces
+of about ``PIECE_BYTES``. It can gzip them on the fly. Memory stays at one
+chunk of rows and one piece of output however many rows a month holds.
+The authority export view and the ``export_records`` command both consume
+the stream.
+
+Type names come from the registries rather than joins; columns that need
+another table (the vehicle number of a dispatch) are joined in the same
+query.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.apps import apps
+from django.utils import timezone
+from emergency.registry import emergency_types
+from utilities.registry import utility_types
+
+CHUNK_SIZE = 2000  # rows per fetch
+PIECE_BYTES = 64 * 1024
+GZIP_LEVEL = 6
+# Spreadsheets open CSV text starting with these as a formula (citizens write the titles)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+# Formatters are prepared once per extract: each returns the function that maps a column's values
+
+def _type_name(registry):
+    def prepare():
+        return {found.pk: found.name for found in registry.all()}.get
+    return prepare
+
+
+def _department():
+    return {found.pk: found.department for found in utility_types.all()}.get
+
+
+# dataset -> (model label, creation time field, [(column, field, formatter or None)])
+DATASETS = {
+    'complaints': ('utilities.Complaint', 'created_at', [
+        ('complaint_id', 'complaint_id', None),
+        ('created_at', 'created_at', None),
+        ('utility_type', 'utility_type_id', _type_name(utility_types)),
+        ('department', 'utility_type_id', _department),
+        ('priority', 'priority', None),
+        ('status', 'status', None),
+        ('title', 'title', None),
+        ('address', 'address', None),
+        ('location_lat', 'location_lat', None),
+        ('location_lng', 'location_lng', None),
+        ('citizen_id', 'citizen_id', None),
+        ('assigned_officer_id', 'assigned_officer_id', None),
+        ('assigned_at', 'assigned_at', None),
+        ('resolved_at', 'resolved_at', None),
+        ('escalated_at', 'escalated_at', None),
+        ('duplicate_of', 'parent__complaint_id', None),
+        ('duplicate_count', 'duplicate_count', None),
+        ('satisfaction_rating', 'satisfaction_rating', None),
+    ]),
+    'emergencies': ('emergency.EmergencyRequest', 'created_at', [
+        ('id', 'id', None),
+        ('created_at', 'created_at', None),
+        ('emergency_type', 'emergency_type_id', _type_name(emergency_types)),
+        ('priority', 'priority', None),
+        ('status', 'status', None),
+        ('address', 'address', None),
+        ('location_lat', 'location_lat', None),
+        ('location_lng', 'location_lng', None),
+        ('citizen_id', 'citizen_id', None),
+        ('assigned_at', 'assigned_at', None),
+        ('resolved_at', 'resolved_at', None),
+    ]),
+    'dispatches': ('emergency.DispatchRecord', 'assigned_at', [
+        ('id', 'id', None),
+        ('assigned_at', 'assigned_at', None),
+        ('emergency_id', 'emergency_request_id', None),
+        ('vehicle_number', 'vehicle__vehicle_number', None),
+        ('vehicle_type', 'vehicle__vehicle_type', None),
+        ('assigned_by_id', 'assigned_by_id', None),
+        ('status', 'status', None),
+    ]),
+}
+
+
+def month_bounds(month):
+    """Local ``[start, end)`` of the month ``month`` (any date in it)"""
+    start = timezone.make_aware(datetime.combine(month.replace(day=1), time.min))
+    following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return start, timezone.make_aware(datetime.combine(following, time.min))
+
+
+def filename(dataset, fmt, month=None, compress=False):
+    parts = [dataset] + ([f'{month:%Y-%m}'] if month else [])
+    return '-'.join(parts) + f'.{FORMATS[fmt][1]}' + ('.gz' if compress else '')
+
+
+def rows(dataset, month=None):
+    """``(header, row iterator)`` of a dataset, oldest first, optionally of one month"""
+    label, time_field, columns = DATASETS[dataset]
+    queryset = apps.get_model(label).objects.order_by(time_field, 'pk')
+    if month is not None:
+        start, end = month_bounds(month)
+        queryset = queryset.filter(**{f'{time_field}__gte': start, f'{time_field}__lt': end})
+    values = queryset.values_list(*(field for _, field, _ in columns))
+
+    def iterate():
+        formatters = [formatter() if formatter else _plain for _, _, formatter in columns]
+        for row in values.iterator(chunk_size=CHUNK_SIZE):
+            yield [formatter(value) for formatter, value in zip(formatters, row)]
+
+    return [column for column, _, _ in columns], iterate()
+
+
+def _plain(value):
+    kind = type(value)
+    if kind is datetime:
+        return value.isoformat()
+    if kind is Decimal:
+        return float(value)
+    return value
+
+
+def _csv_cell(value):
+    """A text cell a spreadsheet would run as a formula, made plain text with a leading quote"""
+    if type(value) is str and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv(header, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for record in records:
+        writer.writerow([_csv_cell(value) for value in record])
+        if buffer.tell() >= PIECE_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _ndjson(header, records):
+    lines, size = [], 0
+    for record in records:
+        line = json.dumps(dict(zip(header, record)), separators=(',', ':'))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= PIECE_BYTES:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines, size = [], 0
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def _gzip(pieces):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream(dataset, fmt='csv', month=None, compress=False):
+    """Encoded pieces of a dataset extract; nothing is read until the first piece is asked for"""
+    header, records = rows(dataset, month)
+    pieces = (_csv if fmt == 'csv' else _ndjson)(header, records)
+    return _gzip(pieces) if compress else pieces
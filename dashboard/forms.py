@@ -0,0 +1,22 @@
+from django import forms
+from . import exports
+
+
+class ExportForm(forms.Form):
+    """Which extract the government dashboard downloads"""
+    
+    dataset = forms.ChoiceField(
+        choices=[(name, name.title()) for name in exports.DATASETS],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    month = forms.DateField(
+        required=False,
+        input_formats=['%Y-%m'],
+        help_text='Leave empty for every month.',
+        widget=forms.DateInput(attrs={'type': 'month', 'class': 'form-control'}, format='%Y-%m'),
+    )
+    format = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    gzip = forms.BooleanField(required=False, label='Gzip', widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
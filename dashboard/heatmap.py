@@ -0,0 +1,303 @@
+"""
+Density heatmaps of where complaints and emergencies are reported.
+
+Each layer keeps a columnar ``Snapshot`` of its located records in NumPy
+arrays: id, Web Mercator position, creation time, type and status code.
+A heatmap is a boolean mask over those columns for the filters and time
+window, followed by one ``bincount`` of the matching points' tiles at
+``MAX_ZOOM``. The coarser zoom levels are summed from the finer ones, so a
+whole pyramid costs about as much as one level. Cells are slippy-map
+tiles (``x``, ``y`` at ``zoom``), which map libraries draw directly.
+
+Pyramids are cached in the shared cache per layer, filters and window.
+Windows end on a ``TILE_TTL`` boundary, so every pan and zoom within that
+period is cropped from the cached pyramid without touching the columns.
+Other processes' snapshots of the same moment are alike, so one process's
+pyramid serves them all.
+
+A snapshot is loaded on first use. Every ``REFRESH_INTERVAL`` seconds it
+re-reads the rows whose ``updated_at`` moved since the previous refresh
+(``QuerySet.update()`` callers set it too) and every ``RELOAD_INTERVAL``
+seconds it is reloaded whole, which also drops deleted records. Bulk
+loads call ``reset()``.
+
+NumPy is optional for the rest of the site; without it ``available()`` is
+false and the endpoint says so.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only where NumPy is missing
+    np = None
+
+# layer -> (model label, type foreign key attname)
+LAYERS = {
+    'complaint': ('utilities.Complaint', 'utility_type_id'),
+    'emergency': ('emergency.EmergencyRequest', 'emergency_type_id'),
+}
+WINDOWS = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '365d': timedelta(days=365),
+}
+MIN_ZOOM = 8  # A whole region in a couple of tiles
+MAX_ZOOM = 17  # ~300 m cells at the equator
+
+REFRESH_INTERVAL = 30  # seconds
+RELOAD_INTERVAL = 15 * 60
+TILE_TTL = 60
+LOAD_CHUNK = 50000
+GONE = -1  # Status code of records that lost their location since the last reload
+GENERATION_KEY = 'heatmap:generation'
+
+
+def available():
+    return np is not None
+
+
+def mercator(lat, lng):
+    """Web Mercator position of degree arrays, both in [0, 1) from the top-left corner"""
+    lat = np.clip(lat, -85.05112878, 85.05112878)
+    mx = (lng + 180.0) / 360.0
+    my = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    return np.clip(mx, 0.0, math.nextafter(1.0, 0.0)), np.clip(my, 0.0, math.nextafter(1.0, 0.0))
+
+
+def status_codes(layer):
+    """``{status: code}`` of a layer; the codes index its status choices"""
+    model = apps.get_model(LAYERS[layer][0])
+    return {value: code for code, (value, _) in enumerate(model.STATUS_CHOICES)}
+
+
+class Snapshot:
+    """Columns of one layer's located records, ordered by id"""
+
+    def __init__(self, ids, mx, my, created, types, statuses):
+        self.ids = ids
+        self.mx = mx
+        self.my = my
+        self.created = created  # Unix seconds
+        self.types = types
+        self.statuses = statuses
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows, codes):
+        """Build from ``(id, lat, lng, created_at, type_id, status)`` rows; a None position marks the record ``GONE``"""
+        ids, lats, lngs, created, types, statuses = [], [], [], [], [], []
+        for record_id, lat, lng, created_at, type_id, status in rows:
+            ids.append(record_id)
+            lats.append(0.0 if lat is None else lat)
+            lngs.append(0.0 if lng is None else lng)
+            created.append(created_at.timestamp())
+            types.append(type_id)
+            statuses.append(GONE if lat is None or lng is None else codes.get(status, GONE))
+        mx, my = mercator(np.array(lats, dtype=np.float64), np.array(lngs, dtype=np.float64))
+        return cls(
+            np.array(ids, dtype=np.int64), mx, my, np.array(created, dtype=np.float64),
+            np.array(types, dtype=np.int32), np.array(statuses, dtype=np.int8),
+        )
+
+    @classmethod
+    def concatenate(cls, parts):
+        columns = ('ids', 'mx', 'my', 'created', 'types', 'statuses')
+        return cls(*(np.concatenate([getattr(part, column) for part in parts]) for column in columns))
+
+    def merge(self, changed):
+        """A new snapshot with ``changed`` (ordered by id) replacing or adding to these records"""
+        if not len(changed):
+            return self
+        positions = np.searchsorted(self.ids, changed.ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == changed.ids[found]
+
+        merged = Snapshot.concatenate([self, changed.subset(~found)])
+        for column in ('mx', 'my', 'created', 'types', 'statuses'):
+            getattr(merged, column)[positions[found]] = getattr(changed, column)[found]
+        if len(merged.ids) > len(self.ids) and len(self.ids) and merged.ids[len(self.ids)] < self.ids[-1]:
+            merged = merged.subset(np.argsort(merged.ids, kind='stable'))
+        return merged
+
+    def subset(self, selector):
+        return Snapshot(self.ids[selector], self.mx[selector], self.my[selector], self.created[selector],
+                        self.types[selector], self.statuses[selector])
+
+    def select(self, since, until, type_id=None, status_code=None):
+        """Mask of the records created in ``[since, until)`` (Unix seconds) matching the filters"""
+        mask = (self.created >= since) & (self.created < until)
+        if status_code is None:
+            mask &= self.statuses != GONE
+        else:
+            mask &= self.statuses == status_code
+        if type_id is not None:
+            mask &= self.types == type_id
+        return mask
+
+    def pyramid(self, mask, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        """``{zoom: (xs, ys, counts)}`` of the non-empty tiles of the masked records"""
+        scale = 1 << max_zoom
+        xs = (self.mx[mask] * scale).astype(np.int64)
+        ys = (self.my[mask] * scale).astype(np.int64)
+        levels = {}
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            if zoom == max_zoom:
+                xs, ys, counts = histogram(xs, ys)
+            else:
+                xs, ys, counts = histogram(xs >> 1, ys >> 1, counts)
+            levels[zoom] = (xs, ys, counts)
+        return levels
+
+
+def histogram(xs, ys, weights=None):
+    """Distinct ``(x, y)`` tiles with their (weighted) counts"""
+    if not len(xs):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    x0, y0 = xs.min(), ys.min()
+    width, height = int(xs.max() - x0) + 1, int(ys.max() - y0) + 1
+    keys = (xs - x0) * height + (ys - y0)
+    if width * height <= max(4 * len(keys), 1 << 20):
+        # The points cover a compact block of tiles (a city): count them in one pass
+        counts = np.bincount(keys, weights=weights, minlength=width * height)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights)
+    return keys // height + x0, keys % height + y0, counts.astype(np.int64)
+
+
+class SnapshotStore:
+    """One layer's snapshot, kept current by refreshing what changed"""
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.loaded_at = None  # monotonic
+        self.refreshed_at = None  # monotonic
+        self.synced_at = None  # wall clock the next refresh reads changes from
+
+    def _queryset(self):
+        label, type_attname = LAYERS[self.layer]
+        return apps.get_model(label).objects.order_by('id').annotate(
+            lat=Cast('location_lat', FloatField()), lng=Cast('location_lng', FloatField()),
+        ).values_list('id', 'lat', 'lng', 'created_at', type_attname, 'status')
+
+    def _read(self, queryset):
+        codes = status_codes(self.layer)
+        parts, chunk = [], []
+        for row in queryset.iterator(chunk_size=LOAD_CHUNK):
+            chunk.append(row)
+            if len(chunk) == LOAD_CHUNK:
+                parts.append(Snapshot.from_rows(chunk, codes))
+                chunk = []
+        parts.append(Snapshot.from_rows(chunk, codes))
+        return Snapshot.concatenate(parts)
+
+    def get(self):
+        """The current snapshot, loading or refreshing it first if it is due"""
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.refreshed_at <= REFRESH_INTERVAL:
+            return self.snapshot
+        with self.lock:
+            now = time.monotonic()
+            if self.loaded_at is None or now - self.loaded_at > RELOAD_INTERVAL:
+                self.reload()
+            elif now - self.refreshed_at > REFRESH_INTERVAL:
+                self.refresh()
+            return self.snapshot
+
+    def reload(self):
+        synced_at = timezone.now()
+        self.snapshot = self._read(self._queryset().filter(location_lat__isnull=False, location_lng__isnull=False))
+        self.loaded_at = self.refreshed_at = time.monotonic()
+        self.synced_at = synced_at
+
+    def refresh(self):
+        # Overlapping by a whole interval catches writes that committed after the last read
+        synced_at = timezone.now()
+        changed = self._read(self._queryset().filter(updated_at__gte=self.synced_at - timedelta(seconds=REFRESH_INTERVAL)))
+        self.snapshot = self.snapshot.merge(changed)
+        self.refreshed_at = time.monotonic()
+        self.synced_at = synced_at
+
+    def reset(self):
+        with self.lock:
+            self.snapshot = self.loaded_at = self.refreshed_at = self.synced_at = None
+
+
+stores = {layer: SnapshotStore(layer) for layer in LAYERS}
+
+
+def reset():
+    """Forget every snapshot and cached pyramid, e.g. after a bulk load that left ``updated_at`` in the past"""
+    for store in stores.values():
+        store.reset()
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def window_bounds(window, now=None):
+    """``(since, until)`` of a named window, ending on a ``TILE_TTL`` boundary"""
+    now = (now or timezone.now()).timestamp()
+    until = math.floor(now / TILE_TTL) * TILE_TTL + TILE_TTL
+    return until - WINDOWS[window].total_seconds(), until
+
+
+def _pyramid(layer, window, type_id, status, now):
+    since, until = window_bounds(window, now)
+    generation = cache.get(GENERATION_KEY, 0)
+    key = 'heatmap:' + hashlib.md5(f'{generation}:{layer}:{window}:{type_id}:{status}:{until}'.encode()).hexdigest()
+    levels = cache.get(key)
+    if levels is None:
+        snapshot = stores[layer].get()
+        status_code = None if status is None else status_codes(layer)[status]
+        levels = snapshot.pyramid(snapshot.select(since, until, type_id, status_code))
+        cache.set(key, levels, TILE_TTL * 2)
+    return since, until, levels
+
+
+def tiles(layer, zoom, window, type_id=None, status=None, bbox=None, now=None):
+    """
+    Heatmap cells of ``layer`` at ``zoom`` for the records created in
+    ``window``, optionally of one type and status and cropped to ``bbox``
+    (``(west, south, east, north)`` in degrees). Returns a JSON-ready dict
+    with ``cells`` as ``[x, y, count]`` tiles.
+    """
+    since, until, levels = _pyramid(layer, window, type_id, status, now)
+    xs, ys, counts = levels[zoom]
+    if bbox is not None:
+        west, south, east, north = bbox
+        left, top = mercator(np.float64(north), np.float64(west))
+        right, bottom = mercator(np.float64(south), np.float64(east))
+        scale = 1 << zoom
+        inside = (
+            (xs >= int(left * scale)) & (xs <= int(right * scale))
+            & (ys >= int(top * scale)) & (ys <= int(bottom * scale))
+        )
+        xs, ys, counts = xs[inside], ys[inside], counts[inside]
+    return {
+        'layer': layer,
+        'zoom': zoom,
+        'window': window,
+        'since': datetime.fromtimestamp(since, dt_timezone.utc).isoformat(),
+        'until': datetime.fromtimestamp(until, dt_timezone.utc).isoformat(),
+        'total': int(counts.sum()),
+        'max': int(counts.max()) if len(counts) else 0,
+        'cells': np.column_stack([xs, ys, counts]).tolist(),
+    }
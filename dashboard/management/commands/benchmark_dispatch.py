@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from accounts.models import User
+from emergency.dispatch import DispatchError, dispatch_vehicle, dispatch_vehicles
+from emergency.models import EmergencyRequest, EmergencyVehicle, DispatchRecord
+from emergency.registry import emergency_types
+from smartcity.benchmarking import isolated_database
+
+
+class Command(BaseCommand):
+    help = 'Race parallel operators over the same vehicles and compare single and batch dispatch throughput (uses a throwaway database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=400, help='Vehicles (and emergencies) per round')
+        parser.add_argument('--workers', type=int, default=8, help='Parallel operators')
+        parser.add_argument('--batch-size', type=int, default=25, help='Pairs per batch dispatch')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['vehicles'] < options['workers']:
+            raise CommandError('Need at least one worker and one vehicle per worker')
+        self.rng = random.Random(options['seed'])
+
+        with isolated_database():
+            self.operator = User.objects.create_user('bench_operator', password='bench', role='emergency_operator')
+            self.citizen = User.objects.create_user('bench_citizen', password='bench', role='citizen')
+
+            self.stdout.write(f'{"round":<12} {"workers":>8} {"dispatched":>11} {"refused":>8} {"seconds":>8} {"per sec":>9}')
+            self.run_round('single', options, batch_size=None)
+            self.run_round('batch', options, batch_size=options['batch_size'])
+            # Every operator goes after every vehicle; exactly one may win each
+            self.run_round('contended', options, batch_size=options['batch_size'], contended=True)
+
+        self.stdout.write(self.style.SUCCESS('\n✅ No vehicle was dispatched twice'))
+
+    def run_round(self, name, options, batch_size, contended=False):
+        vehicles, emergencies = self.seed(options['vehicles'])
+        pairs = list(zip(emergencies, vehicles))
+        workers = options['workers']
+        if contended:
+            work = [self.rng.sample(pairs, len(pairs)) for _ in range(workers)]
+        else:
+            work = [pairs[worker::workers] for worker in range(workers)]
+
+        dispatched, refused = Counter(), Counter()
+
+        def operate(worker, assignments):
+            try:
+                if batch_size is None:
+                    for emergency_id, vehicle_id in assignments:
+                        try:
+                            dispatch_vehicle(emergency_id, vehicle_id, self.operator)
+                            dispatched[worker] += 1
+                        except DispatchError:
+                            refused[worker] += 1
+                else:
+                    for start in range(0, len(assignments), batch_size):
+                        made, errors = dispatch_vehicles(assignments[start:start + batch_size], self.operator)
+                        dispatched[worker] += len(made)
+                        refused[worker] += len(errors)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=operate, args=(worker, assignments)) for worker, assignments in enumerate(work)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = sum(dispatched.values())
+        self.stdout.write(
+            f'{name:<12} {workers:>8} {total:>11} {sum(refused.values()):>8} {elapsed:>8.2f} {total / elapsed:>9.1f}'
+        )
+
+        booked = Counter(DispatchRecord.objects.filter(vehicle_id__in=vehicles).values_list('vehicle_id', flat=True))
+        doubled = [vehicle_id for vehicle_id, times in booked.items() if times > 1]
+        if doubled or total != len(vehicles):
+            raise CommandError(
+                f'{name}: {len(doubled)} vehicle(s) dispatched more than once, {total} dispatches for {len(vehicles)} vehicles'
+            )
+
+    def seed(self, count):
+        """``count`` fresh available vehicles and pending emergencies"""
+        tag = EmergencyVehicle.objects.count()
+        types = emergency_types.all()
+        vehicles = EmergencyVehicle.objects.bulk_create(
+            EmergencyVehicle(
+                vehicle_type='ambulance', vehicle_number=f'BENCH-{tag + i}',
+                driver_name='Bench Driver', driver_contact='9000000000',
+            )
+            for i in range(count)
+        )
+        emergencies = EmergencyRequest.objects.bulk_create(
+            EmergencyRequest(
+                citizen=self.citizen, emergency_type=types[i % len(types)], description='Benchmark',
+                address=f'{i} Benchmark Street', contact_number='9000000000',
+            )
+            for i in range(count)
+        )
+        return [vehicle.pk for vehicle in vehicles], [emergency.pk for emergency in emergencies]
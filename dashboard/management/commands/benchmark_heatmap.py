@@ -0,0 +1,78 @@
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from smartcity.benchmarking import isolated_database, percentile
+from dashboard import heatmap
+
+CENTER = (12.9716, 77.5946)
+YEAR = 365 * 24 * 3600
+
+
+class Command(BaseCommand):
+    help = 'Measure heatmap aggregation over a synthetic snapshot and snapshot loading from a generated city'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=5000000, help='Points in the synthetic snapshot')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed runs per aggregation')
+        parser.add_argument('--scale', type=float, default=0.01,
+                            help='generate_city_data scale to time snapshot loads at (0 skips; uses a throwaway database)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not heatmap.available():
+            raise CommandError('Heatmaps need NumPy, which is not installed.')
+        np = heatmap.np
+        rng = np.random.default_rng(options['seed'])
+        points, now = options['points'], time.time()
+
+        started = time.perf_counter()
+        mx, my = heatmap.mercator(rng.normal(CENTER[0], 0.08, points), rng.normal(CENTER[1], 0.08, points))
+        snapshot = heatmap.Snapshot(
+            np.arange(1, points + 1, dtype=np.int64), mx, my, now - rng.uniform(0, YEAR, points),
+            rng.integers(1, 8, points).astype(np.int32), rng.integers(0, 6, points).astype(np.int8),
+        )
+        self.stdout.write(f'{points:,} synthetic points in {time.perf_counter() - started:.1f}s\n')
+
+        aggregations = [
+            ('365d, everything', now - YEAR, None, None),
+            ('30d, everything', now - 30 * 86400, None, None),
+            ('7d, one type', now - 7 * 86400, 3, None),
+            ('365d, one status', now - YEAR, None, 0),
+        ]
+        self.stdout.write(f'{"aggregation":<20} {"points":>10} {"tiles z17":>10} {"p50 ms":>8} {"p95 ms":>8}')
+        for label, since, type_id, status_code in aggregations:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                mask = snapshot.select(since, now, type_id, status_code)
+                levels = snapshot.pyramid(mask)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f'{label:<20} {int(mask.sum()):>10,} {len(levels[heatmap.MAX_ZOOM][0]):>10,} '
+                f'{percentile(timings, 50):>8.1f} {percentile(timings, 95):>8.1f}'
+            )
+
+        changed = snapshot.subset(np.arange(0, points, 100))
+        started = time.perf_counter()
+        snapshot.merge(changed)
+        self.stdout.write(f'\nMerging {len(changed):,} changed rows: {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        if options['scale']:
+            with isolated_database():
+                call_command('generate_city_data', scale=options['scale'], stdout=StringIO())
+                for layer, store in heatmap.stores.items():
+                    started = time.perf_counter()
+                    store.reload()
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'Loading the {layer} snapshot: {len(store.snapshot):,} rows in {elapsed:.2f}s '
+                        f'({len(store.snapshot) / elapsed:,.0f} rows/s)'
+                    )
+                    started = time.perf_counter()
+                    store.refresh()
+                    self.stdout.write(f'Refreshing it: {(time.perf_counter() - started) * 1000:.1f} ms')
+            heatmap.reset()
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark complete'))
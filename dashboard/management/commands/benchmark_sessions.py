@@ -0,0 +1,84 @@
+import time
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from smartcity.benchmarking import isolated_database
+from smartcity.view_benchmarks import ROUTES, QueryCounter, seed_route_data
+
+# Read-only pages every role opens most
+DASHBOARDS = [
+    'dashboard:citizen', 'dashboard:gov', 'dashboard:utility', 'dashboard:emergency', 'dashboard:driver',
+    'emergency:my_requests', 'emergency:operator_dashboard', 'utilities:my_complaints', 'utilities:officer_dashboard',
+]
+
+CONFIGURATIONS = [
+    ('database', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    }),
+    ('cached', {}),  # The project settings
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second of the dashboards with database and cache-backed sessions (uses a throwaway database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.01, help='generate_city_data scale to measure at')
+        parser.add_argument('--requests', type=int, default=100, help='Timed requests per page, configuration and round')
+        parser.add_argument('--rounds', type=int, default=3, help='Rounds per page; the fastest one counts')
+
+    def handle(self, *args, **options):
+        routes = [route for route in ROUTES if route.name in DASHBOARDS]
+        setup_test_environment()
+        try:
+            with isolated_database():
+                call_command('generate_city_data', scale=options['scale'], stdout=StringIO())
+                data = seed_route_data()
+                results = {label: {} for label, _ in CONFIGURATIONS}
+                for route in routes:
+                    # Configurations take turns so drift on the machine hits both alike
+                    for _ in range(options['rounds']):
+                        for label, overrides in CONFIGURATIONS:
+                            cache.clear()
+                            with override_settings(**overrides):
+                                rate, queries = self.measure(route, data, options['requests'])
+                            best = results[label].get(route.name, (0, queries))
+                            results[label][route.name] = (max(rate, best[0]), queries)
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(f'{"page":<30} {"db req/s":>9} {"queries":>8} {"cached req/s":>13} {"queries":>8} {"speedup":>8}')
+        for route in routes:
+            before, after = results['database'][route.name], results['cached'][route.name]
+            self.stdout.write(
+                f'{route.name:<30} {before[0]:>9.0f} {before[1]:>8} {after[0]:>13.0f} {after[1]:>8} '
+                f'{after[0] / before[0]:>7.2f}x'
+            )
+        total = {label: len(routes) / sum(1 / rate for rate, _ in pages.values()) for label, pages in results.items()}
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✅ Mixed dashboard traffic: {total["database"]:.0f} → {total["cached"]:.0f} req/s '
+            f'({total["cached"] / total["database"]:.2f}x)'
+        ))
+
+    def measure(self, route, data, requests):
+        """``(requests per second, queries per request)`` for one page, after a warm-up request"""
+        client = Client()  # Middleware is loaded on the first request, under the current settings
+        client.force_login(data['users'][route.role])
+        url = route.url(data, client)
+        client.get(url)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            for _ in range(requests):
+                response = client.get(url)
+            elapsed = time.perf_counter() - started
+        if response.status_code != route.status:
+            raise AssertionError(f'{route.name} returned {response.status_code}, expected {route.status}')
+        return requests / elapsed, counter.count // requests
@@ -0,0 +1,97 @@
+import json
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from accounts.models import User
+from emergency.models import EmergencyVehicle, VehicleTrack
+from emergency.telemetry import telemetry_buffer
+from smartcity.benchmarking import isolated_database
+
+START = (12.9716, 77.5946)
+SPEED_KMH = 40
+
+
+class Command(BaseCommand):
+    help = 'Measure GPS ping ingestion through the telemetry buffer and the HTTP endpoint (uses a throwaway database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=500)
+        parser.add_argument('--seconds', type=int, default=120, help='Simulated driving time, one ping per second')
+        parser.add_argument('--batch', type=int, default=10, help='Pings per device upload')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        setup_test_environment()
+        try:
+            with isolated_database():
+                self.stdout.write(f'{"path":<8} {"pings":>9} {"requests":>9} {"seconds":>8} {"pings/s":>10} {"tracks":>7} {"bytes/ping":>11}')
+                for path in ('buffer', 'http'):
+                    vehicles = self.create_fleet(path, options['vehicles'])
+                    uploads = self.drive(vehicles, options['seconds'], options['batch'], rng)
+                    self.run(path, vehicles, uploads)
+        finally:
+            teardown_test_environment()
+            telemetry_buffer.reset()
+
+    def create_fleet(self, tag, count):
+        drivers = User.objects.bulk_create(
+            User(username=f'bench_{tag}_driver_{n}', role='vehicle_driver') for n in range(count)
+        )
+        return EmergencyVehicle.objects.bulk_create(
+            EmergencyVehicle(
+                vehicle_type='ambulance', vehicle_number=f'{tag.upper()}-{n:05d}', driver_name='Bench Driver',
+                driver_contact='9000000000', driver=driver,
+            )
+            for n, driver in enumerate(drivers)
+        )
+
+    def drive(self, vehicles, seconds, batch, rng):
+        """Uploads as ``(vehicle, [[t, lat, lng], ...])``, interleaved the way devices would send them"""
+        started = time.time() - seconds
+        step = SPEED_KMH / 3600 / 111.32  # degrees per second, roughly
+        tracks = []
+        for vehicle in vehicles:
+            heading = rng.uniform(0, 2 * math.pi)
+            lat, lng = START[0] + rng.uniform(-0.05, 0.05), START[1] + rng.uniform(-0.05, 0.05)
+            pings = []
+            for second in range(seconds):
+                pings.append([started + second, lat, lng])
+                lat, lng = lat + step * math.cos(heading), lng + step * math.sin(heading)
+            tracks.append([(vehicle, pings[i:i + batch]) for i in range(0, seconds, batch)])
+        return [upload for uploads in zip(*tracks) for upload in uploads]
+
+    def run(self, path, vehicles, uploads):
+        pings = sum(len(batch) for _, batch in uploads)
+        clients = {}
+        if path == 'http':
+            for vehicle in vehicles:
+                clients[vehicle.pk] = Client()
+                clients[vehicle.pk].force_login(vehicle.driver)
+
+        started = time.perf_counter()
+        for vehicle, batch in uploads:
+            if path == 'buffer':
+                telemetry_buffer.ingest(vehicle.pk, [tuple(ping) for ping in batch])
+            else:
+                response = clients[vehicle.pk].post(
+                    '/emergency/vehicles/telemetry/', json.dumps({'pings': batch}), content_type='application/json',
+                )
+                assert response.status_code == 202, response.content
+        telemetry_buffer.flush()
+        elapsed = time.perf_counter() - started
+
+        tracks = VehicleTrack.objects.filter(vehicle__in=vehicles)
+        stored = tracks.aggregate(points=Sum('point_count'))['points'] or 0
+        size = sum(len(points) for points in tracks.values_list('points', flat=True))
+        self.stdout.write(
+            f'{path:<8} {pings:>9} {len(uploads):>9} {elapsed:>8.2f} {pings / elapsed:>10.0f} '
+            f'{tracks.count():>7} {size / max(stored, 1):>11.1f}'
+        )
+        if stored != pings:
+            self.stdout.write(self.style.WARNING(f'⚠️  {pings - stored} ping(s) were not stored'))
@@ -0,0 +1,76 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from smartcity.benchmarking import isolated_database
+from smartcity.view_benchmarks import (
+    BUDGETS_FILE, ROUTES, UNBENCHMARKED, check_budgets, load_budgets, measure_routes,
+    route_names, save_budgets, seed_route_data,
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure latency, queries and memory of every page as the database grows (uses a throwaway database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='0.001,0.01,0.05',
+                            help='Comma separated generate_city_data scales to measure at')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per route and scale')
+        parser.add_argument('--budgets', default=str(BUDGETS_FILE), help='Budget file to check against')
+        parser.add_argument('--update-budgets', action='store_true',
+                            help='Write the measured worst case (with headroom) as the new budgets')
+        parser.add_argument('--queries-only', action='store_true',
+                            help='Only enforce query budgets; latency and memory depend on the machine')
+
+    def handle(self, *args, **options):
+        missing = route_names() - UNBENCHMARKED - {route.name for route in ROUTES}
+        if missing:
+            raise CommandError(f'Routes without a benchmark: {", ".join(sorted(missing))}')
+
+        scales = sorted(float(scale) for scale in options['scales'].split(','))
+        budgets = load_budgets(options['budgets'])
+        metrics = ('queries',) if options['queries_only'] else ('queries', 'p95_ms', 'memory_kb')
+
+        results, failures = [], []
+        setup_test_environment()
+        try:
+            with isolated_database():
+                generated = 0.0
+                for step, scale in enumerate(scales):
+                    # Grow the same database to the next size with a fresh seed
+                    call_command('generate_city_data', scale=scale - generated, seed=step + 1, stdout=StringIO())
+                    generated = scale
+
+                    measurements = measure_routes(seed_route_data(), options['repeat'])
+                    results.append(measurements)
+                    self.report(scale, measurements, budgets)
+                    failures.extend((scale, *failure) for failure in check_budgets(measurements, budgets, metrics))
+        finally:
+            teardown_test_environment()
+
+        if options['update_budgets']:
+            save_budgets(results, options['budgets'])
+            self.stdout.write(self.style.SUCCESS(f'\n✅ Budgets written to {options["budgets"]}'))
+            return
+
+        if failures:
+            for scale, name, metric, measured, budget in failures:
+                if metric == 'budget':
+                    self.stdout.write(self.style.ERROR(f'✗ scale {scale}: {name} has no budget'))
+                else:
+                    self.stdout.write(self.style.ERROR(
+                        f'✗ scale {scale}: {name} {metric} {measured} over budget {budget}'
+                    ))
+            raise CommandError(f'{len(failures)} budget(s) exceeded')
+        self.stdout.write(self.style.SUCCESS('\n✅ Every view is within budget'))
+
+    def report(self, scale, measurements, budgets):
+        self.stdout.write(f'\nscale {scale}')
+        self.stdout.write(f'{"route":<40} {"p50 ms":>8} {"p95 ms":>8} {"queries":>8} {"budget":>7} {"mem KB":>9}')
+        for name, measured in measurements.items():
+            budget = budgets.get(name, {}).get('queries', '-')
+            self.stdout.write(
+                f'{name:<40} {measured["p50_ms"]:>8.2f} {measured["p95_ms"]:>8.2f} '
+                f'{measured["queries"]:>8} {budget:>7} {measured["memory_kb"]:>9.1f}'
+            )
@@ -0,0 +1,45 @@
+import sys
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import exports
+
+
+def month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f'Expected a month as YYYY-MM, got "{value}"')
+
+
+class Command(BaseCommand):
+    help = 'Write a streamed extract of complaints, emergencies or dispatches as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--month', type=month, help='Only records of this month (YYYY-MM, local time)')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--output', help='File to write, "-" for standard output (default: a name like complaints-2026-09.csv)')
+
+    def handle(self, *args, **options):
+        name = options['output'] or exports.filename(
+            options['dataset'], options['format'], month=options['month'], compress=options['gzip'],
+        )
+        pieces = exports.stream(options['dataset'], options['format'], month=options['month'], compress=options['gzip'])
+
+        started, written = time.perf_counter(), 0
+        if name == '-':
+            for piece in pieces:
+                sys.stdout.buffer.write(piece)
+                written += len(piece)
+            sys.stdout.buffer.flush()
+            return
+        with open(name, 'wb') as output:
+            for piece in pieces:
+                output.write(piece)
+                written += len(piece)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Wrote {written:,} bytes to {name} in {time.perf_counter() - started:.1f}s'
+        ))
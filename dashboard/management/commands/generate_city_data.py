@@ -0,0 +1,411 @@
+import math
+import random
+import time
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User
+from dashboard import counters, heatmap, rollups, sketches
+from emergency.models import EmergencyRequest, EmergencyVehicle, DispatchRecord
+from emergency.registry import emergency_types
+from emergency.spatial import vehicle_index
+from emergency.stats import invalidate_operator_stats
+from smartcity import fragments
+from utilities.duplicates import incident_index
+from utilities.models import Complaint, ComplaintUpdate
+from utilities.registry import utility_types
+from utilities.sequences import reserve_complaint_ids
+
+# Rows generated at --scale 1: a city of a few million people after a year of use
+POPULATION = {
+    'citizens': 1_000_000,
+    'officers': 200,
+    'operators': 50,
+    'vehicles': 5_000,
+    'complaints': 3_000_000,
+    'emergencies': 500_000,
+}
+
+# District centres, spread (km) and share of the population
+DISTRICTS = [
+    ('Central', 12.9716, 77.5946, 2.5, 0.22),
+    ('North Zone', 13.0358, 77.5970, 3.5, 0.18),
+    ('South Zone', 12.9063, 77.5857, 3.5, 0.18),
+    ('East Zone', 12.9698, 77.7500, 4.0, 0.16),
+    ('West Zone', 12.9784, 77.5090, 3.5, 0.14),
+    ('Industrial Area', 13.0280, 77.5210, 2.0, 0.07),
+    ('Airport Road', 13.1006, 77.6400, 3.0, 0.05),
+]
+
+STREETS = ['MG Road', 'Church Street', 'Park Avenue', 'Lake View Road', 'Station Road', 'Market Street',
+           'Temple Road', 'Hospital Road', 'Ring Road', 'Main Road', '1st Cross', '2nd Main', '4th Block']
+FIRST_NAMES = ['Aarav', 'Ananya', 'Rahul', 'Priya', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Meera',
+               'John', 'Sarah', 'Mike', 'Emily', 'David', 'Anna', 'Chris', 'Tom', 'Fatima', 'Imran']
+LAST_NAMES = ['Sharma', 'Rao', 'Iyer', 'Khan', 'Reddy', 'Nair', 'Gupta', 'Singh', 'Das', 'Menon',
+              'Smith', 'Johnson', 'Brown', 'Wilson', 'Taylor', 'Lee']
+
+# Relative volume of reports in each hour of the day (local to the city)
+HOURLY_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 9, 9, 8, 8, 8, 8, 9, 9, 8, 7, 5, 4, 3, 2]
+
+COMPLAINT_PRIORITIES = (['high', 'medium', 'low'], [20, 55, 25])
+EMERGENCY_PRIORITIES = (['critical', 'high', 'medium', 'low'], [10, 25, 45, 20])
+VEHICLE_TYPES = (['ambulance', 'fire_truck', 'police_car', 'rescue_vehicle'], [40, 20, 30, 10])
+VEHICLE_PREFIXES = {'ambulance': 'AMB', 'fire_truck': 'FIRE', 'police_car': 'POL', 'rescue_vehicle': 'RES'}
+VEHICLE_FOR_EMERGENCY = {
+    'Medical Emergency': 'ambulance',
+    'Fire': 'fire_truck',
+    'Accident': 'rescue_vehicle',
+    'Crime': 'police_car',
+}
+UPDATE_TEXTS = ['Inspection scheduled.', 'Crew dispatched to the location.', 'Work in progress.',
+                'Waiting for spare parts.', 'Issue identified, repair under way.', 'Citizen contacted for details.',
+                'Still facing the issue, please check.', 'Temporary fix applied.']
+ACTIVE_DISPATCH_STATUSES = {'assigned', 'en_route', 'on_scene'}
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let ``bulk_create`` keep generated values for auto_now/auto_now_add fields"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def lognormal(rng, median, sigma=1.0):
+    """Skewed duration around ``median`` (a timedelta): most are quick, a few take far longer"""
+    return median * rng.lognormvariate(0, sigma)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic city population in bulk for load and scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.01,
+                            help='Fraction of a full-size city (1 = %s citizens, %s complaints)'
+                                 % (f"{POPULATION['citizens']:,}", f"{POPULATION['complaints']:,}"))
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed; also namespaces usernames and vehicle numbers')
+        parser.add_argument('--days', type=int, default=365, help='History window to spread records over')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per bulk_create')
+        parser.add_argument('--password', default='smartcity123', help='Password for every generated user')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.window = timedelta(days=options['days'])
+        self.tag = f"sim{options['seed']}"
+
+        counts = {name: max(1, round(rows * options['scale'])) for name, rows in POPULATION.items()}
+        if User.objects.filter(username__startswith=f'{self.tag}_').exists():
+            raise CommandError(f'Data for --seed {options["seed"]} already exists; pick another seed.')
+        if not utility_types.all() or not emergency_types.all():
+            raise CommandError('No utility or emergency types found; run "manage.py migrate" first.')
+
+        self.password = make_password(options['password'])  # Hash once, not per user
+        self.districts = [district[:4] for district in DISTRICTS]
+        self.district_weights = [district[4] for district in DISTRICTS]
+
+        started = time.perf_counter()
+        with explicit_timestamps(User, Complaint, ComplaintUpdate, EmergencyRequest,
+                                 EmergencyVehicle, DispatchRecord):
+            self.citizens = self.step('citizens', lambda: self.create_users('citizen', counts['citizens']))
+            self.officers = self.step('utility officers', lambda: self.create_users('utility_officer', counts['officers']))
+            self.operators = self.step('operators', lambda: self.create_users('emergency_operator', counts['operators']))
+            # One driver account per vehicle, for their device's telemetry
+            self.drivers = self.step('drivers', lambda: self.create_users('vehicle_driver', counts['vehicles']))
+            self.step('vehicles', lambda: self.create_vehicles(counts['vehicles']))
+            self.step('complaints (+ update threads)', lambda: self.create_complaints(counts['complaints']))
+            self.step('emergencies (+ dispatches)', lambda: self.create_emergencies(counts['emergencies']))
+
+        # Nothing above sent signals, so refresh the derived views of the data
+        rollups.rebuild()
+        counters.rebuild()
+        sketches.rebuild()
+        fragments.invalidate_all()
+        invalidate_operator_stats()
+        vehicle_index.rebuild()
+        incident_index.rebuild()
+        heatmap.reset()
+        self.stdout.write(self.style.SUCCESS(f'\n✅ City generated in {time.perf_counter() - started:.1f}s'))
+
+    def step(self, label, create):
+        started = time.perf_counter()
+        result = create()
+        self.stdout.write(f'✓ {label}: {len(result):,} in {time.perf_counter() - started:.1f}s')
+        return result
+
+    # Building blocks
+
+    def chunks(self, total):
+        """Yield ``(start, size)`` pairs covering ``total`` rows"""
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def point(self):
+        """A location clustered around a district centre"""
+        name, lat, lng, spread_km = self.rng.choices(self.districts, self.district_weights)[0]
+        lat += self.rng.gauss(0, spread_km / 111.0)
+        lng += self.rng.gauss(0, spread_km / (111.0 * math.cos(math.radians(lat))))
+        return name, Decimal(f'{lat:.6f}'), Decimal(f'{lng:.6f}')
+
+    def address(self, district):
+        return f'{self.rng.randint(1, 999)}, {self.rng.choice(STREETS)}, {district}'
+
+    def phone(self):
+        return f'9{self.rng.randrange(10 ** 9):09d}'
+
+    def timeline(self, total):
+        """
+        Creation times for ``total`` rows in ascending order, so ids grow with
+        time as they do in production, weighted towards daytime hours.
+        """
+        start = self.now - self.window
+        slice_length = self.window / math.ceil(total / self.batch_size)
+        peak = max(HOURLY_WEIGHTS)
+        for chunk, (_, size) in enumerate(self.chunks(total)):
+            slice_start = start + slice_length * chunk
+            times = []
+            while len(times) < size:
+                moment = slice_start + slice_length * self.rng.random()
+                if self.rng.random() * peak < HOURLY_WEIGHTS[moment.hour]:
+                    times.append(min(moment, self.now))
+            yield sorted(times)
+
+    # Generators
+
+    def create_users(self, role, total):
+        ids = array('q')
+        for start, size in self.chunks(total):
+            users = []
+            for n in range(start, start + size):
+                first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+                district, _, _ = self.point()
+                joined = self.now - self.window * self.rng.random()
+                users.append(User(
+                    username=f'{self.tag}_{role}_{n}',
+                    password=self.password,
+                    first_name=first,
+                    last_name=last,
+                    email=f'{role}{n}@{self.tag}.example.com',
+                    role=role,
+                    phone_number=self.phone(),
+                    address=self.address(district),
+                    date_joined=joined,
+                ))
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+            ids.extend(user.pk for user in users)
+        return ids
+
+    def create_vehicles(self, total):
+        # Busy vehicles are the ones active dispatches get attached to
+        self.vehicles = defaultdict(lambda: {'free': array('q'), 'busy': array('q')})
+        self.fleet = array('q')
+        types, weights = VEHICLE_TYPES
+        rows = []
+        for start, size in self.chunks(total):
+            vehicles = []
+            for n in range(start, start + size):
+                vehicle_type = self.rng.choices(types, weights)[0]
+                district, lat, lng = self.point()
+                vehicles.append(EmergencyVehicle(
+                    vehicle_type=vehicle_type,
+                    vehicle_number=f'{VEHICLE_PREFIXES[vehicle_type]}-{self.tag[3:]}-{n:05d}',
+                    driver_name=f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                    driver_contact=self.phone(),
+                    driver_id=self.drivers[n],
+                    is_available=self.rng.random() < 0.7,
+                    current_location=district,
+                    location_lat=lat,
+                    location_lng=lng,
+                    last_updated=self.now - timedelta(minutes=self.rng.randint(0, 120)),
+                ))
+            with transaction.atomic():
+                EmergencyVehicle.objects.bulk_create(vehicles)
+            self.fleet.extend(vehicle.pk for vehicle in vehicles)
+            for vehicle in vehicles:
+                self.vehicles[vehicle.vehicle_type]['free' if vehicle.is_available else 'busy'].append(vehicle.pk)
+            rows.extend(vehicles)
+        return rows
+
+    def create_complaints(self, total):
+        types = utility_types.all()
+        prefixes = {utility_type.pk: utility_type.name[:3].upper() for utility_type in types}
+        priorities, priority_weights = COMPLAINT_PRIORITIES
+        created = 0
+        updates_created = 0
+        for times in self.timeline(total):
+            complaints = [self.complaint(created_at, types, priorities, priority_weights) for created_at in times]
+
+            # Same per-prefix sequences Complaint.save() draws from
+            by_prefix = defaultdict(list)
+            for complaint in complaints:
+                by_prefix[prefixes[complaint.utility_type_id]].append(complaint)
+            for prefix, group in by_prefix.items():
+                for complaint, complaint_id in zip(group, reserve_complaint_ids(prefix, len(group))):
+                    complaint.complaint_id = complaint_id
+
+            with transaction.atomic():
+                Complaint.objects.bulk_create(complaints)
+                updates = [update for complaint in complaints for update in self.complaint_updates(complaint)]
+                ComplaintUpdate.objects.bulk_create(updates, batch_size=self.batch_size)
+            created += len(complaints)
+            updates_created += len(updates)
+        self.stdout.write(f'  {updates_created:,} complaint updates')
+        return range(created)
+
+    def complaint(self, created_at, types, priorities, priority_weights):
+        """One complaint whose status follows from how long ago it was filed"""
+        rng = self.rng
+        utility_type = rng.choice(types)
+        district, lat, lng = self.point()
+        complaint = Complaint(
+            citizen_id=rng.choice(self.citizens),
+            utility_type_id=utility_type.pk,
+            title=f'{utility_type.name} issue near {rng.choice(STREETS)}',
+            description=f'Reported {utility_type.name.lower()} problem in {district}.',
+            priority=rng.choices(priorities, priority_weights)[0],
+            status='pending',
+            location_lat=lat,
+            location_lng=lng,
+            address=self.address(district),
+            created_at=created_at,
+            updated_at=created_at,
+        )
+
+        # A few complaints are never picked up; the rest are claimed within hours
+        if rng.random() < 0.02:
+            return complaint
+        assigned_at = created_at + lognormal(rng, timedelta(hours=6))
+        if assigned_at > self.now:
+            return complaint
+        complaint.assigned_officer_id = rng.choice(self.officers)
+        complaint.assigned_at = complaint.updated_at = assigned_at
+
+        resolved_at = assigned_at + lognormal(rng, timedelta(days=2), sigma=1.2)
+        if resolved_at <= self.now:
+            if rng.random() < 0.05:
+                complaint.status = 'rejected'
+                complaint.resolution_notes = 'Not within the department\'s jurisdiction.'
+            else:
+                complaint.status = 'resolved'
+                complaint.resolved_at = resolved_at
+                complaint.resolution_notes = 'Issue fixed and verified on site.'
+                if rng.random() < 0.4:
+                    complaint.satisfaction_rating = rng.choices(range(1, 6), [5, 8, 17, 35, 35])[0]
+            complaint.updated_at = resolved_at
+        elif self.now - created_at > timedelta(days=7) and rng.random() < 0.3:
+            complaint.status = 'escalated'
+            complaint.priority = 'high'
+            complaint.escalated_at = complaint.updated_at = created_at + timedelta(days=7)
+        else:
+            complaint.status = rng.choice(['assigned', 'in_progress'])
+        return complaint
+
+    def complaint_updates(self, complaint):
+        """A short comment thread between the officer and the citizen"""
+        if complaint.assigned_officer_id is None:
+            return []
+        end = complaint.resolved_at or complaint.escalated_at or self.now
+        span = (end - complaint.assigned_at).total_seconds()
+        updates = []
+        for _ in range(self.rng.randint(1, 4)):
+            author = complaint.citizen_id if self.rng.random() < 0.2 else complaint.assigned_officer_id
+            updates.append(ComplaintUpdate(
+                complaint_id=complaint.pk,
+                updated_by_id=author,
+                update_text=self.rng.choice(UPDATE_TEXTS),
+                created_at=complaint.assigned_at + timedelta(seconds=span * self.rng.random()),
+            ))
+        return updates
+
+    def create_emergencies(self, total):
+        types = emergency_types.all()
+        priorities, priority_weights = EMERGENCY_PRIORITIES
+        created = 0
+        dispatches_created = 0
+        for times in self.timeline(total):
+            emergencies = [self.emergency(created_at, types, priorities, priority_weights) for created_at in times]
+            with transaction.atomic():
+                EmergencyRequest.objects.bulk_create(emergencies)
+                dispatches = [dispatch for dispatch in map(self.dispatch, emergencies) if dispatch]
+                DispatchRecord.objects.bulk_create(dispatches, batch_size=self.batch_size)
+            created += len(emergencies)
+            dispatches_created += len(dispatches)
+        self.stdout.write(f'  {dispatches_created:,} dispatch records')
+        return range(created)
+
+    def emergency(self, created_at, types, priorities, priority_weights):
+        """One emergency, moved along its lifecycle as far as its age allows"""
+        rng = self.rng
+        emergency_type = rng.choice(types)
+        district, lat, lng = self.point()
+        emergency = EmergencyRequest(
+            citizen_id=rng.choice(self.citizens),
+            emergency_type_id=emergency_type.pk,
+            priority=rng.choices(priorities, priority_weights)[0],
+            status='pending',
+            location_lat=lat,
+            location_lng=lng,
+            address=self.address(district),
+            description=f'{emergency_type.name} reported in {district}.',
+            contact_number=self.phone(),
+            created_at=created_at,
+            updated_at=created_at,
+        )
+        emergency.vehicle_type = VEHICLE_FOR_EMERGENCY.get(emergency_type.name) or rng.choice(VEHICLE_TYPES[0])
+
+        if rng.random() < 0.05:
+            emergency.status = 'cancelled'
+            emergency.updated_at = created_at + timedelta(minutes=rng.randint(1, 30))
+            return emergency
+
+        # Assigned in minutes, on scene within the half hour, resolved within hours
+        assigned_at = created_at + lognormal(rng, timedelta(minutes=4), sigma=0.8)
+        en_route_at = assigned_at + timedelta(minutes=rng.uniform(0.5, 3))
+        on_scene_at = en_route_at + lognormal(rng, timedelta(minutes=12), sigma=0.5)
+        resolved_at = on_scene_at + lognormal(rng, timedelta(minutes=45), sigma=0.7)
+        for status, moment in (('assigned', assigned_at), ('en_route', en_route_at),
+                               ('on_scene', on_scene_at), ('resolved', resolved_at)):
+            if moment > self.now:
+                break
+            emergency.status, emergency.updated_at = status, moment
+        if emergency.status != 'pending':
+            emergency.assigned_at = assigned_at
+        if emergency.status == 'resolved':
+            emergency.resolved_at = resolved_at
+        return emergency
+
+    def dispatch(self, emergency):
+        if emergency.assigned_at is None:
+            return None
+        status = 'completed' if emergency.status == 'resolved' else emergency.status
+        pool = self.vehicles[emergency.vehicle_type]
+        # Active dispatches hold the vehicles marked unavailable
+        candidates = pool['busy'] if status in ACTIVE_DISPATCH_STATUSES and pool['busy'] else pool['free'] or pool['busy']
+        # A very small fleet may lack the right type; any vehicle will do then
+        candidates = candidates or self.fleet
+        return DispatchRecord(
+            emergency_request_id=emergency.pk,
+            vehicle_id=self.rng.choice(candidates),
+            assigned_by_id=self.rng.choice(self.operators),
+            assigned_at=emergency.assigned_at,
+            status=status,
+        )
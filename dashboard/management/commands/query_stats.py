@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand
+from smartcity import querystats
+
+
+class Command(BaseCommand):
+    help = 'Show per-view query counts, DB time, slowest statements and repeated (N+1) statements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', help='Only show views whose name contains this')
+        parser.add_argument('--json', action='store_true', help='Print the raw report as JSON')
+        parser.add_argument('--reset', action='store_true', help='Clear the collected statistics')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            querystats.reset()
+            self.stdout.write(self.style.SUCCESS('✅ Query statistics cleared'))
+            return
+
+        report = querystats.report()
+        if options['view']:
+            report = {name: view for name, view in report.items() if options['view'] in name}
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if not report:
+            self.stdout.write(self.style.WARNING(
+                '⚠ No statistics yet. Serve some requests; with a per-process cache (LocMemCache) '
+                'only /admin/query-stats/ on the serving process can see them.'
+            ))
+            return
+
+        self.stdout.write(f'{"view":<40} {"requests":>8} {"avg q":>7} {"max q":>6} {"avg db ms":>10}')
+        for name, view in report.items():
+            self.stdout.write(
+                f'{name:<40} {view["requests"]:>8} {view["mean_queries"]:>7} '
+                f'{view["max_queries"]:>6} {view["mean_db_ms"]:>10}'
+            )
+        for name, view in report.items():
+            self.stdout.write(f'\n{name}')
+            self.stdout.write('  queries: ' + self.bars(view['queries_histogram']))
+            self.stdout.write('  db ms:   ' + self.bars(view['db_ms_histogram']))
+            for statement in view['slowest']:
+                self.stdout.write(f'  slow {statement["ms"]:>8.2f} ms  {statement["sql"][:120]}')
+            for statement in view['repeated']:
+                self.stdout.write(self.style.WARNING(
+                    f'  N+1? x{statement["max_repeats"]} in {statement["requests"]} request(s)  '
+                    f'{statement["sql"][:120]}'
+                ))
+
+    @staticmethod
+    def bars(histogram):
+        return '  '.join(f'{bucket}:{count}' for bucket, count in histogram.items() if count)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from dashboard import sketches
+
+
+class Command(BaseCommand):
+    help = 'Recompute the time-to-assign and time-to-resolve sketches from the emergency and complaint tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domain', choices=sorted(sketches.DOMAINS), help='Only this domain')
+
+    def handle(self, *args, **options):
+        domains = [options['domain']] if options['domain'] else list(sketches.DOMAINS)
+        sketches.rebuild(domains)
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt response-time sketches for {", ".join(domains)}'))
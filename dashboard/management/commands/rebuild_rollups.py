@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics rollups from the emergency and complaint tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', choices=sorted(rollups.METRICS), help='Only this metric')
+        parser.add_argument('--check', action='store_true',
+                            help='Report drift without changing anything; fails if any is found')
+
+    def handle(self, *args, **options):
+        metrics = [options['metric']] if options['metric'] else list(rollups.METRICS)
+
+        if options['check']:
+            drifted = 0
+            for metric in metrics:
+                for (_, period, bucket, type_id, status), (stored, actual) in sorted(rollups.drift(metric).items()):
+                    drifted += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'⚠ {metric} {period} {bucket:%Y-%m-%d %H:00} type {type_id} {status}: '
+                        f'stored {stored}, actual {actual}'
+                    ))
+            if drifted:
+                raise CommandError(f'{drifted} rollup row(s) have drifted; run without --check to repair')
+            self.stdout.write(self.style.SUCCESS('✅ Rollups match the source tables'))
+            return
+
+        rollups.rebuild(metrics)
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt rollups for {", ".join(metrics)}'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import counters
+
+
+class Command(BaseCommand):
+    help = "Repair citizens' dashboard counters that drifted from the emergency and complaint tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domain', choices=sorted(counters.DOMAINS), help='Only this domain')
+        parser.add_argument('--check', action='store_true',
+                            help='Report drift without changing anything; fails if any is found')
+
+    def handle(self, *args, **options):
+        domains = [options['domain']] if options['domain'] else list(counters.DOMAINS)
+
+        if options['check']:
+            drifted = 0
+            for domain in domains:
+                for citizen_id, (stored, actual) in sorted(counters.drift(domain).items()):
+                    drifted += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'⚠ {domain} citizen {citizen_id}: stored {self.describe(stored)}, actual {self.describe(actual)}'
+                    ))
+            if drifted:
+                raise CommandError(f'{drifted} citizen counter(s) have drifted; run without --check to repair')
+            self.stdout.write(self.style.SUCCESS('✅ Citizen counters match the source tables'))
+            return
+
+        for domain in domains:
+            repaired = counters.reconcile(domain)
+            self.stdout.write(self.style.SUCCESS(f'✅ {domain}: repaired {repaired} citizen counter(s)'))
+
+    def describe(self, values):
+        return ', '.join(f'{values[field]} {field}' for field in counters.FIELDS)
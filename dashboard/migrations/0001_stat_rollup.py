@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('emergency', 'Emergency requests'), ('complaint', 'Utility complaints')], max_length=20)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('total', 'All time')], max_length=10)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or (local) day; a fixed date for all-time rows')),
+                ('type_id', models.PositiveIntegerField(help_text='EmergencyType or UtilityType id')),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'period', 'bucket', 'type_id', 'status'), name='stat_rollup_key')],
+            },
+        ),
+    ]
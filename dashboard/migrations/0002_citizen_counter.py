@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_existing_records(apps, schema_editor):
+    """Counters for everything filed before they were maintained"""
+    CitizenCounter = apps.get_model('dashboard', 'CitizenCounter')
+    for domain, model in (('emergency', apps.get_model('emergency', 'EmergencyRequest')),
+                          ('complaint', apps.get_model('utilities', 'Complaint'))):
+        rows = model.objects.order_by().values('citizen_id').annotate(
+            pending=Count('id', filter=Q(status='pending')),
+            resolved=Count('id', filter=Q(status='resolved')),
+            total=Count('id'),
+        )
+        CitizenCounter.objects.bulk_create(
+            (CitizenCounter(user_id=row.pop('citizen_id'), domain=domain, **row) for row in rows.iterator()),
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_stat_rollup'),
+        ('emergency', '0009_vehicle_telemetry'),
+        ('utilities', '0007_escalation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CitizenCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(choices=[('emergency', 'Emergency requests'), ('complaint', 'Utility complaints')], max_length=20)),
+                ('pending', models.IntegerField(default=0)),
+                ('resolved', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'domain'), name='citizen_counter_key')],
+            },
+        ),
+        migrations.RunPython(count_existing_records, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_citizen_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('complaint_assign', 'Complaint time to assign'), ('complaint_resolve', 'Complaint time to resolve'), ('emergency_assign', 'Emergency time to assign'), ('emergency_resolve', 'Emergency time to resolve')], max_length=20)),
+                ('key', models.CharField(help_text='Department of a complaint, EmergencyType id of an emergency', max_length=100)),
+                ('day', models.DateField(help_text='Local day of the transitions; a fixed date for all-time rows')),
+                ('count', models.BigIntegerField(default=0)),
+                ('digest', models.JSONField(default=dict, help_text='Centroids, minimum and maximum in seconds')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'day', 'key'), name='response_sketch_key')],
+            },
+        ),
+    ]
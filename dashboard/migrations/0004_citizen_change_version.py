@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def date_existing_counters(apps, schema_editor):
+    """Last change of each citizen's records, so Last-Modified works from the start"""
+    CitizenCounter = apps.get_model('dashboard', 'CitizenCounter')
+    for domain, model in (('emergency', apps.get_model('emergency', 'EmergencyRequest')),
+                          ('complaint', apps.get_model('utilities', 'Complaint'))):
+        latest = model.objects.order_by().values('citizen_id').annotate(latest=Max('updated_at'))
+        for row in latest.iterator():
+            CitizenCounter.objects.filter(user_id=row['citizen_id'], domain=domain).update(changed_at=row['latest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_response_sketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citizencounter',
+            name='changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='citizencounter',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(date_existing_counters, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,99 @@
 from django.db import models
 
-# Create your models here.
+
+class StatRollup(models.Model):
+    """
+    Running count of emergencies or complaints created in one period
+    bucket, of one type, currently in one status. Kept up to date by
+    ``dashboard.rollups``; ``rebuild_rollups`` recomputes it from scratch.
+    """
+    
+    METRIC_CHOICES = [
+        ('emergency', 'Emergency requests'),
+        ('complaint', 'Utility complaints'),
+    ]
+    
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+        ('total', 'All time'),
+    ]
+    
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text='Start of the hour or (local) day; a fixed date for all-time rows')
+    type_id = models.PositiveIntegerField(help_text='EmergencyType or UtilityType id')
+    status = models.CharField(max_length=20)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['metric', 'period', 'bucket', 'type_id', 'status'], name='stat_rollup_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.metric} {self.period} {self.bucket:%Y-%m-%d %H:00} type {self.type_id} {self.status}: {self.count}"
+
+
+class CitizenCounter(models.Model):
+    """
+    How many emergencies or complaints one citizen has filed, and how many
+    of them are pending and resolved, plus a version of them for the status
+    API. Kept up to date by ``dashboard.counters`` and ``dashboard.changes``;
+    ``reconcile_citizen_counters`` repairs drift.
+    """
+    
+    DOMAIN_CHOICES = [
+        ('emergency', 'Emergency requests'),
+        ('complaint', 'Utility complaints'),
+    ]
+    
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='counters')
+    domain = models.CharField(max_length=20, choices=DOMAIN_CHOICES)
+    pending = models.IntegerField(default=0)
+    resolved = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    # Change version of the citizen's records in this domain (dashboard.changes)
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        constraints = [
+            # Also the index behind the dashboard's lookup by user
+            models.UniqueConstraint(fields=['user', 'domain'], name='citizen_counter_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.domain}: {self.pending} pending, {self.resolved} resolved, {self.total} total"
+
+
+class ResponseSketch(models.Model):
+    """
+    t-digest of how long complaints or emergencies of one key took to be
+    assigned or resolved, over the transitions of one (local) day. Kept up
+    to date by ``dashboard.sketches``; ``rebuild_response_sketches``
+    recomputes it from scratch.
+    """
+    
+    METRIC_CHOICES = [
+        ('complaint_assign', 'Complaint time to assign'),
+        ('complaint_resolve', 'Complaint time to resolve'),
+        ('emergency_assign', 'Emergency time to assign'),
+        ('emergency_resolve', 'Emergency time to resolve'),
+    ]
+    
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    key = models.CharField(max_length=100, help_text='Department of a complaint, EmergencyType id of an emergency')
+    day = models.DateField(help_text='Local day of the transitions; a fixed date for all-time rows')
+    count = models.BigIntegerField(default=0)
+    digest = models.JSONField(default=dict, help_text='Centroids, minimum and maximum in seconds')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day', 'key'], name='response_sketch_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.metric} {self.key} {self.day}: {self.count}"
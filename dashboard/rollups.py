@@ -0,0 +1,189 @@
+"""
+Incrementally maintained counts behind the government dashboard.
+
+Every emergency, complaint and user is counted in three ``StatRollup``
+rows, one each for the hour and the local day it was created in and one
+all-time row, under its type and current status (users: their role).
+Creating, deleting or changing the status (or type) of a record moves it
+between rows. Those changes are reported through
+``dashboard.transitions``, by the model signals and by code that changes
+statuses with ``QuerySet.update()``.
+
+Bulk loads (``generate_city_data``) and anything else that bypasses both
+should call ``rebuild()``, which recomputes every row from the source
+tables.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import StatRollup
+
+TOTAL_BUCKET = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+# metric -> (model label, creation time field, type foreign key attname, status field)
+METRICS = {
+    'emergency': ('emergency.EmergencyRequest', 'created_at', 'emergency_type_id', 'status'),
+    'complaint': ('utilities.Complaint', 'created_at', 'utility_type_id', 'status'),
+    'user': ('accounts.User', 'date_joined', None, 'role'),
+}
+UNTYPED = 0  # type_id of metrics without a type
+
+OPEN_EMERGENCY_STATUSES = ['pending', 'assigned', 'en_route', 'on_scene']
+OPEN_COMPLAINT_STATUSES = ['pending', 'assigned', 'in_progress', 'escalated']
+
+
+def buckets(created_at):
+    """``(period, bucket)`` pairs a record created at ``created_at`` is counted in"""
+    hour = timezone.localtime(created_at).replace(minute=0, second=0, microsecond=0)
+    return [('hour', hour), ('day', hour.replace(hour=0)), ('total', TOTAL_BUCKET)]
+
+
+def state(metric, values):
+    """
+    ``(created_at, type_id, status)`` of a record's field ``values``, or
+    None if any of them is missing (deferred on the instance).
+    """
+    _, created_field, type_attname, status_field = METRICS[metric]
+    needed = [created_field, status_field] + ([type_attname] if type_attname else [])
+    if not all(name in values for name in needed):
+        return None
+    type_id = values[type_attname] if type_attname else UNTYPED
+    return values[created_field], type_id, values[status_field]
+
+
+def changes(metric, old, new):
+    """Row deltas for a record moving from state ``old`` to ``new`` (either may be None)"""
+    deltas = Counter()
+    for current, sign in ((old, -1), (new, 1)):
+        if current is None or current[0] is None:
+            continue
+        created_at, type_id, status = current
+        for period, bucket in buckets(created_at):
+            deltas[(metric, period, bucket, type_id, status)] += sign
+    return deltas
+
+
+def apply(deltas):
+    """Add ``deltas`` (``{(metric, period, bucket, type_id, status): n}``) to the rollup rows"""
+    # A fixed order keeps concurrent writers from waiting on each other in a cycle
+    keys = sorted(key for key, delta in deltas.items() if delta)
+    if not keys:
+        return
+    with transaction.atomic():
+        for key in keys:
+            row = dict(zip(('metric', 'period', 'bucket', 'type_id', 'status'), key))
+            delta = deltas[key]
+            if StatRollup.objects.filter(**row).update(count=F('count') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    StatRollup.objects.create(count=delta, **row)
+            except IntegrityError:
+                # Another writer created the row first
+                StatRollup.objects.filter(**row).update(count=F('count') + delta)
+
+
+def compute(metric):
+    """Hour rows for ``metric`` from the source table, with day and all-time rows derived from them"""
+    model_label, created_field, type_attname, status_field = METRICS[metric]
+    hours = (
+        apps.get_model(model_label).objects.order_by()
+        .annotate(hour=Trunc(created_field, 'hour'), type_id=Value(UNTYPED) if type_attname is None else F(type_attname))
+        .values_list('hour', 'type_id', status_field)
+        .annotate(n=Count('id'))
+    )
+    counts = Counter()
+    for hour, type_id, status, n in hours.iterator():
+        for period, bucket in buckets(hour):
+            counts[(metric, period, bucket, type_id, status)] += n
+    return counts
+
+
+def rebuild(metrics=METRICS):
+    """Replace the rollups of ``metrics`` with freshly computed ones"""
+    with transaction.atomic():
+        for metric in metrics:
+            StatRollup.objects.filter(metric=metric).delete()
+            StatRollup.objects.bulk_create(
+                (
+                    StatRollup(metric=metric, period=period, bucket=bucket, type_id=type_id, status=status, count=n)
+                    for (metric, period, bucket, type_id, status), n in compute(metric).items()
+                ),
+                batch_size=5000,
+            )
+
+
+def drift(metric):
+    """``{key: (stored, actual)}`` for every row that disagrees with the source table"""
+    stored = {
+        (metric, row.period, row.bucket, row.type_id, row.status): row.count
+        for row in StatRollup.objects.filter(metric=metric).iterator()
+    }
+    actual = compute(metric)
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in stored.keys() | actual.keys()
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def city_stats():
+    """
+    All-time counts per metric, type and status plus today's, read from a
+    few dozen pre-aggregated rows in a single query.
+    """
+    today = buckets(timezone.now())[1][1]
+    rows = StatRollup.objects.filter(
+        Q(period='total') | Q(period='day', bucket=today)
+    ).values_list('metric', 'period', 'type_id', 'status', 'count')
+
+    totals = {metric: Counter() for metric in METRICS}  # (type_id, status) -> count
+    created_today = Counter()
+    for metric, period, type_id, status, n in rows:
+        if period == 'total':
+            totals[metric][(type_id, status)] += n
+        else:
+            created_today[metric] += n
+
+    def by_status(metric, statuses=None):
+        return sum(n for (_, status), n in totals[metric].items() if statuses is None or status in statuses)
+
+    def by_type(metric):
+        types = {}
+        for (type_id, status), n in totals[metric].items():
+            types.setdefault(type_id, Counter())[status] += n
+        return types
+
+    return {
+        'total_emergencies': by_status('emergency'),
+        'pending_emergencies': by_status('emergency', ['pending']),
+        'active_emergencies': by_status('emergency', OPEN_EMERGENCY_STATUSES[1:]),
+        'resolved_emergencies': by_status('emergency', ['resolved']),
+        'emergencies_today': created_today['emergency'],
+        'total_complaints': by_status('complaint'),
+        'open_complaints': by_status('complaint', OPEN_COMPLAINT_STATUSES),
+        'escalated_complaints': by_status('complaint', ['escalated']),
+        'resolved_complaints': by_status('complaint', ['resolved']),
+        'complaints_today': created_today['complaint'],
+        'emergencies_by_type': by_type('emergency'),
+        'complaints_by_type': by_type('complaint'),
+        'users_by_role': dict(by_type('user').get(UNTYPED, Counter())),
+    }
+
+
+def hourly(since):
+    """``{metric: {hour: count}}`` of records created from ``since`` on"""
+    counts = {metric: {} for metric in METRICS}
+    rows = (
+        StatRollup.objects.filter(period='hour', bucket__gte=since)
+        .values_list('metric', 'bucket').annotate(n=Sum('count')).order_by()
+    )
+    for metric, bucket, n in rows:
+        counts[metric][bucket] = n
+    return counts
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import User
+from emergency.models import EmergencyRequest
+from utilities.models import Complaint
+from . import transitions
+
+
+@receiver(post_init, sender=EmergencyRequest)
+@receiver(post_init, sender=Complaint)
+@receiver(post_init, sender=User)
+def remember_row(sender, instance, **kwargs):
+    """Note what a loaded record is counted under, to diff against on save"""
+    transitions.remember(instance)
+
+
+@receiver(post_save, sender=EmergencyRequest)
+@receiver(post_save, sender=Complaint)
+@receiver(post_save, sender=User)
+def record_save(sender, instance, created, **kwargs):
+    # Runs inside the transaction the models' save() opens. A record saved
+    # without having been loaded has no known past: an empty row leaves
+    # the stores that need one to their rebuild
+    old = None if created else (transitions.remembered(instance) or {})
+    transitions.apply_transitions(sender, [old], [transitions.saved_row(instance)])
+    transitions.remember(instance)
+
+
+@receiver(post_delete, sender=EmergencyRequest)
+@receiver(post_delete, sender=Complaint)
+@receiver(post_delete, sender=User)
+def record_delete(sender, instance, **kwargs):
+    transitions.apply_transitions(sender, [transitions.snapshot(instance)], [None])
@@ -0,0 +1,294 @@
+"""
+Response-time distributions behind the government dashboard.
+
+Every time a complaint or emergency is first assigned or resolved, the
+seconds since it was created are added to a ``ResponseSketch``: a
+t-digest per metric, key (a complaint's department, an emergency's type)
+and local day of the transition, plus an all-time digest per metric and
+key. A t-digest keeps about ``COMPRESSION`` weighted centroids however
+many values it summarises, most of them near the tails, so p99 stays
+accurate. Digests of several days or keys merge into one, so any range
+costs one read of its rows rather than a scan of the history.
+
+Transitions are recorded through ``dashboard.transitions`` inside the
+transaction that makes them, by the model signals and by code that sets
+the timestamps with ``QuerySet.update()``. Bulk loads call ``rebuild()``. Duplicates of a complaint are not counted; they follow
+their parent rather than being handled.
+"""
+
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import ResponseSketch
+
+COMPRESSION = 100
+QUANTILES = (0.5, 0.9, 0.99)
+TOTAL_DAY = date(2000, 1, 1)  # day of the all-time rows
+
+# domain -> (model label, type foreign key attname)
+DOMAINS = {
+    'complaint': ('utilities.Complaint', 'utility_type_id'),
+    'emergency': ('emergency.EmergencyRequest', 'emergency_type_id'),
+}
+# What each domain measures: metric -> timestamp field
+METRICS = {
+    'complaint': {'complaint_assign': 'assigned_at', 'complaint_resolve': 'resolved_at'},
+    'emergency': {'emergency_assign': 'assigned_at', 'emergency_resolve': 'resolved_at'},
+}
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl) with the arcsine scale function:
+    sorted ``[mean, weight]`` centroids, small at the tails and large in
+    the middle, plus the exact minimum and maximum.
+    """
+
+    def __init__(self, centroids=(), minimum=None, maximum=None, compression=COMPRESSION):
+        self.centroids = [list(centroid) for centroid in centroids]
+        self.min = minimum
+        self.max = maximum
+        self.compression = compression
+        self.unmerged = []
+
+    @property
+    def count(self):
+        return sum(weight for _, weight in self.centroids) + sum(weight for _, weight in self.unmerged)
+
+    def add(self, value, weight=1):
+        self.unmerged.append([value, weight])
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.unmerged) > self.compression * 5:
+            self.compress()
+        return self
+
+    def merge(self, other):
+        """Fold ``other`` into this digest"""
+        merged = TDigest.combine([self, other])
+        self.centroids, self.unmerged, self.min, self.max = merged.centroids, [], merged.min, merged.max
+        return self
+
+    @classmethod
+    def combine(cls, digests):
+        """One digest of several, compressed once rather than once per merge"""
+        combined = cls()
+        for digest in digests:
+            if digest.count:
+                combined.unmerged.extend([list(centroid) for centroid in digest.centroids + digest.unmerged])
+                combined.min = digest.min if combined.min is None else min(combined.min, digest.min)
+                combined.max = digest.max if combined.max is None else max(combined.max, digest.max)
+        return combined.compress()
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def compress(self):
+        points = sorted(self.centroids + self.unmerged)
+        self.unmerged = []
+        if not points:
+            self.centroids = []
+            return self
+        total = sum(weight for _, weight in points)
+        merged = [list(points[0])]
+        q_start = 0.0
+        q_limit = self._q(self._k(q_start) + 1)
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            if q_start + (current[1] + weight) / total <= q_limit:
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                q_start += current[1] / total
+                q_limit = self._q(self._k(q_start) + 1)
+                merged.append([mean, weight])
+        self.centroids = merged
+        return self
+
+    def quantile(self, q):
+        """Estimated value at quantile ``q`` (0-1), or None if the digest is empty"""
+        if self.unmerged:
+            self.compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        total = sum(weight for _, weight in self.centroids)
+        target = q * total
+        first, last = self.centroids[0], self.centroids[-1]
+        if target <= first[1] / 2:
+            return self.min + (first[0] - self.min) * target / (first[1] / 2) if first[1] > 1 else self.min
+        if target >= total - last[1] / 2:
+            tail = total - target
+            return self.max - (self.max - last[0]) * tail / (last[1] / 2) if last[1] > 1 else self.max
+        # Between the centres of two neighbouring centroids
+        cumulative = first[1] / 2
+        for left, right in zip(self.centroids, self.centroids[1:]):
+            step = (left[1] + right[1]) / 2
+            if target <= cumulative + step:
+                return left[0] + (right[0] - left[0]) * (target - cumulative) / step
+            cumulative += step
+        return self.max
+
+    def to_dict(self):
+        if self.unmerged:
+            self.compress()
+        return {'centroids': [[round(mean, 3), weight] for mean, weight in self.centroids], 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('centroids', ()), data.get('min'), data.get('max'))
+
+
+def key_for(domain, type_id):
+    """Sketch key of a record's type: its department for complaints, its type id for emergencies"""
+    if domain == 'complaint':
+        from utilities.registry import utility_types
+        utility_type = utility_types.get(type_id)
+        return utility_type.department if utility_type else 'Unknown'
+    return str(type_id)
+
+
+def state(domain, values):
+    """``{field: timestamp}`` of the measured fields in a record's field ``values``, or None if any is missing"""
+    fields = set(METRICS[domain].values())
+    if not fields <= values.keys():
+        return None
+    return {field: values[field] for field in fields}
+
+
+def samples(domain, created_at, type_id, old, new):
+    """``[(metric, key, day, seconds)]`` for the timestamps that went from empty to set between ``old`` and ``new``"""
+    found = []
+    for metric, field in METRICS[domain].items():
+        at = new.get(field)
+        if at is None or (old or {}).get(field) is not None:
+            continue
+        found.append((metric, key_for(domain, type_id), timezone.localdate(at), max((at - created_at).total_seconds(), 0.0)))
+    return found
+
+
+def record(found):
+    """Add ``[(metric, key, day, seconds)]`` to their day and all-time sketches"""
+    digests = defaultdict(TDigest)
+    for metric, key, day, seconds in found:
+        for bucket in (day, TOTAL_DAY):
+            digests[(metric, key, bucket)].add(seconds)
+    if not digests:
+        return
+    with transaction.atomic():
+        # A fixed order keeps concurrent writers from waiting on each other in a cycle
+        for metric, key, day in sorted(digests):
+            _merge_into(metric, key, day, digests[(metric, key, day)])
+
+
+def _merge_into(metric, key, day, digest):
+    row = ResponseSketch.objects.select_for_update().filter(metric=metric, key=key, day=day).first()
+    if row is None:
+        try:
+            with transaction.atomic():
+                ResponseSketch.objects.create(metric=metric, key=key, day=day, count=digest.count, digest=digest.to_dict())
+            return
+        except IntegrityError:
+            # Another writer created the row first
+            row = ResponseSketch.objects.select_for_update().get(metric=metric, key=key, day=day)
+    merged = TDigest.from_dict(row.digest).merge(digest)
+    ResponseSketch.objects.filter(pk=row.pk).update(count=row.count + digest.count, digest=merged.to_dict())
+
+
+def distribution(metric, keys=None, since=None, until=None):
+    """
+    ``{key: TDigest}`` of ``metric``: the all-time digests, or the days in
+    ``[since, until]`` merged, optionally only of ``keys``.
+    """
+    rows = ResponseSketch.objects.filter(metric=metric)
+    if since is None and until is None:
+        rows = rows.filter(day=TOTAL_DAY)
+    else:
+        rows = rows.exclude(day=TOTAL_DAY)
+        if since is not None:
+            rows = rows.filter(day__gte=since)
+        if until is not None:
+            rows = rows.filter(day__lte=until)
+    if keys is not None:
+        rows = rows.filter(key__in=keys)
+    found = defaultdict(list)
+    for key, data in rows.values_list('key', 'digest').iterator():
+        found[key].append(TDigest.from_dict(data))
+    return {key: TDigest.combine(digests) for key, digests in found.items()}
+
+
+def summarize(digest, quantiles=QUANTILES):
+    """``{'count': n, 'p50': seconds, ...}`` of a digest"""
+    result = {'count': digest.count}
+    for q in quantiles:
+        result[f'p{round(q * 100):g}'] = digest.quantile(q)
+    return result
+
+
+def format_duration(seconds):
+    """Short human form of a duration: ``45s``, ``12m``, ``3.4h``, ``2.1d``"""
+    if seconds is None:
+        return '-'
+    if seconds < 60:
+        return f'{seconds:.0f}s'
+    if seconds < 3600:
+        return f'{seconds / 60:.0f}m'
+    if seconds < 86400:
+        return f'{seconds / 3600:.1f}h'
+    return f'{seconds / 86400:.1f}d'
+
+
+def report(days=None, today=None):
+    """
+    ``{metric: {key: summary}}`` of every metric over the last ``days``
+    local days (all time if None), read with one query.
+    """
+    if days is None:
+        rows = ResponseSketch.objects.filter(day=TOTAL_DAY)
+    else:
+        today = today or timezone.localdate()
+        rows = ResponseSketch.objects.filter(day__gt=today - timedelta(days=days), day__lte=today)
+    found = defaultdict(list)
+    for metric, key, data in rows.values_list('metric', 'key', 'digest').iterator():
+        found[(metric, key)].append(TDigest.from_dict(data))
+    result = {}
+    for (metric, key), digests in found.items():
+        result.setdefault(metric, {})[key] = summarize(TDigest.combine(digests))
+    return result
+
+
+def compute(domain):
+    """``{(metric, key, day): TDigest}`` from the source table, all-time rows included"""
+    label, type_attname = DOMAINS[domain]
+    rows = apps.get_model(label).objects.order_by()
+    if domain == 'complaint':
+        rows = rows.filter(parent__isnull=True)
+    digests = defaultdict(TDigest)
+    fields = list(METRICS[domain].values())
+    for created_at, type_id, *stamps in rows.values_list('created_at', type_attname, *fields).iterator():
+        for metric, key, day, seconds in samples(domain, created_at, type_id, None, dict(zip(fields, stamps))):
+            digests[(metric, key, day)].add(seconds)
+            digests[(metric, key, TOTAL_DAY)].add(seconds)
+    return digests
+
+
+def rebuild(domains=DOMAINS):
+    """Replace the sketches of ``domains`` with ones computed from the source tables"""
+    with transaction.atomic():
+        for domain in domains:
+            ResponseSketch.objects.filter(metric__in=list(METRICS[domain])).delete()
+            ResponseSketch.objects.bulk_create(
+                (
+                    ResponseSketch(metric=metric, key=key, day=day, count=digest.count, digest=digest.to_dict())
+                    for (metric, key, day), digest in compute(domain).items()
+                ),
+                batch_size=1000,
+            )
@@ -1,3 +1,572 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+import csv
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from smartcity import querystats
+from smartcity.view_benchmarks import (
+    ROUTES, UNBENCHMARKED, check_budgets, load_budgets, measure_routes, route_names, seed_route_data,
+)
+from accounts.models import User
+from emergency.dispatch import dispatch_vehicle
+from emergency.models import EmergencyRequest, EmergencyType, EmergencyVehicle, DispatchRecord
+from utilities import bulk
+from utilities.escalation import escalate
+from utilities.models import Complaint, ComplaintUpdate, UtilityType
+from utilities.registry import utility_types
+from . import counters, exports, heatmap, rollups, sketches, transitions
+from .models import CitizenCounter, ResponseSketch, StatRollup
+
+
+class GenerateCityDataTests(TestCase):
+
+    def generate(self, **options):
+        call_command('generate_city_data', scale=0.0002, batch_size=250, stdout=StringIO(), **options)
+
+    def test_generates_a_consistent_population(self):
+        self.generate(seed=7)
+        self.assertEqual(User.objects.filter(role='citizen').count(), 200)
+        self.assertEqual(Complaint.objects.count(), 600)
+        self.assertEqual(EmergencyRequest.objects.count(), 100)
+        self.assertTrue(ComplaintUpdate.objects.exists())
+
+        # Generated timestamps survive bulk_create and ids grow with them
+        created = list(Complaint.objects.order_by('id').values_list('created_at', flat=True))
+        self.assertEqual(created, sorted(created))
+        self.assertLess(created[0], created[-1])
+        self.assertFalse(Complaint.objects.filter(status='resolved', resolved_at__isnull=True).exists())
+        self.assertFalse(Complaint.objects.exclude(status='pending').filter(assigned_officer__isnull=True).exists())
+        self.assertEqual(
+            DispatchRecord.objects.count(),
+            EmergencyRequest.objects.filter(assigned_at__isnull=False).count(),
+        )
+
+        # New complaints continue the sequences the generator reserved from
+        complaint = Complaint.objects.order_by('id').last()
+        complaint.pk, complaint.complaint_id = None, ''
+        complaint.save()
+        self.assertEqual(Complaint.objects.filter(complaint_id=complaint.complaint_id).count(), 1)
+
+    def test_same_seed_twice_is_refused(self):
+        self.generate(seed=8)
+        with self.assertRaises(CommandError):
+            self.generate(seed=8)
+
+
+class ViewBudgetTests(TransactionTestCase):
+    """
+    Every page stays within the query budget stored by ``benchmark_views``.
+    Requests run in autocommit like in production, so the session and
+    user caches are written when they would be.
+    """
+
+    serialized_rollback = True  # The generator needs the types seeded by migrations
+
+    def test_every_route_is_benchmarked(self):
+        self.assertEqual(route_names() - UNBENCHMARKED, {route.name for route in ROUTES})
+
+    def test_query_budgets(self):
+        cache.clear()
+        call_command('generate_city_data', scale=0.0002, batch_size=250, seed=9, stdout=StringIO())
+        measurements = measure_routes(seed_route_data(), repeat=2)
+        self.assertEqual(check_budgets(measurements, load_budgets(), metrics=('queries',)), [])
+
+
+class QueryStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.admin = User.objects.create_user('admin', password='pass1234', is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        querystats.reset()
+
+    def test_fingerprint_collapses_parameters(self):
+        self.assertEqual(
+            querystats.fingerprint('SELECT * FROM t WHERE id IN (%s, %s,  %s) AND name = \'x\' LIMIT 21'),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_repeated_statements_are_reported(self):
+        recorder = querystats.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for user in User.objects.all():
+                User.objects.get(pk=user.pk)
+            for _ in range(4):
+                User.objects.get(pk=self.admin.pk)
+        self.assertEqual(list(recorder.repeated().values()), [6])
+
+    def test_requests_are_recorded_per_view(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        self.client.get('/utilities/my-complaints/')
+        self.client.get('/utilities/my-complaints/')
+        view = querystats.report()['utilities:my_complaints']
+        self.assertEqual(view['requests'], 2)
+        self.assertEqual(view['max_queries'], 1)  # one page; session and user are cached
+        self.assertEqual(view['queries_histogram']['<=1'], 2)
+
+    def test_endpoint_is_staff_only(self):
+        self.client.force_login(self.citizen)
+        self.assertEqual(self.client.get('/admin/query-stats/').status_code, 302)
+        self.client.force_login(self.admin)
+        self.client.get('/dashboard/')
+        self.assertIn('dashboard:dashboard', self.client.get('/admin/query-stats/').json())
+
+
+class RollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.gov = User.objects.create_user('gov', password='pass1234', role='government_authority')
+        cls.fire = EmergencyType.objects.get(name='Fire')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+
+    def create_emergency(self, **kwargs):
+        return EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, address='1 Main Street',
+            description='Smoke', contact_number='5550100', **kwargs,
+        )
+
+    def create_complaint(self, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen, utility_type=self.water, title='Leak',
+            description='Pipe leak', address='1 Main Street', **kwargs,
+        )
+
+    def totals(self, metric):
+        return dict(
+            StatRollup.objects.filter(metric=metric, period='total', count__gt=0).values_list('status', 'count')
+        )
+
+    def test_saves_move_records_between_rows(self):
+        emergency = self.create_emergency()
+        self.create_emergency()
+        self.assertEqual(self.totals('emergency'), {'pending': 2})
+
+        emergency.status = 'resolved'
+        emergency.save()
+        self.assertEqual(self.totals('emergency'), {'pending': 1, 'resolved': 1})
+
+        # Reloaded instances diff against what they were loaded with
+        reloaded = EmergencyRequest.objects.get(pk=emergency.pk)
+        reloaded.status = 'cancelled'
+        reloaded.save()
+        reloaded.delete()
+        self.assertEqual(self.totals('emergency'), {'pending': 1})
+        self.assertEqual(rollups.drift('emergency'), {})
+
+    def test_bulk_updates_are_reported_or_rebuilt(self):
+        for _ in range(3):
+            self.create_complaint()
+        pending = Complaint.objects.filter(status='pending')
+
+        rows = list(pending.values(*transitions.fields(Complaint)))
+        pending.update(status='escalated')
+        self.assertNotEqual(rollups.drift('complaint'), {})
+        transitions.apply_transitions(Complaint, rows, [{**row, 'status': 'escalated'} for row in rows])
+        self.assertEqual(rollups.drift('complaint'), {})
+        self.assertEqual(counters.drift('complaint'), {})
+
+        # A record loaded without what the rollups need is left to the rebuild; its citizen still sees the change
+        complaint = Complaint.objects.only('id', 'status').first()
+        version = CitizenCounter.objects.get(user=complaint.citizen_id, domain='complaint').version
+        complaint.status = 'resolved'
+        complaint.save(update_fields=['status'])
+        self.assertNotEqual(rollups.drift('complaint'), {})
+        self.assertEqual(CitizenCounter.objects.get(user=complaint.citizen_id, domain='complaint').version, version + 1)
+
+        Complaint.objects.update(status='resolved')
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.totals('complaint'), {'resolved': 3})
+
+    def test_gov_dashboard_reads_rollups(self):
+        self.create_emergency()
+        self.create_emergency(status='resolved')
+        self.create_complaint()
+        with self.captureOnCommitCallbacks(execute=True):  # Caches the user the way a real login does
+            self.client.force_login(self.gov)
+        with self.assertNumQueries(3):  # rollup totals, last 24 hours, response-time sketches
+            response = self.client.get('/dashboard/gov/')
+        self.assertEqual(response.context['total_emergencies'], 2)
+        self.assertEqual(response.context['pending_emergencies'], 1)
+        self.assertEqual(response.context['resolved_emergencies'], 1)
+        self.assertEqual(dict(response.context['complaints_by_department'])['Water Department']['open'], 1)
+        self.assertEqual(sum(slot['emergencies'] for slot in response.context['last_24_hours']), 2)
+        self.assertEqual((response.context['citizens'], response.context['staff']), (1, 1))
+
+
+class CitizenCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.fire = EmergencyType.objects.get(name='Fire')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+
+    def create_emergency(self, **kwargs):
+        return EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, address='1 Main Street',
+            description='Smoke', contact_number='5550100', **kwargs,
+        )
+
+    def create_complaint(self, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen, utility_type=self.water, title='Leak',
+            description='Pipe leak', address='1 Main Street', **kwargs,
+        )
+
+    def mine(self, domain):
+        return counters.for_citizen(self.citizen)[domain]
+
+    def test_saves_and_deletes_move_records_between_counts(self):
+        emergency = self.create_emergency()
+        self.create_emergency()
+        self.assertEqual(self.mine('emergency'), {'pending': 2, 'resolved': 0, 'total': 2})
+
+        reloaded = EmergencyRequest.objects.get(pk=emergency.pk)
+        reloaded.status = 'resolved'
+        reloaded.save()
+        self.assertEqual(self.mine('emergency'), {'pending': 1, 'resolved': 1, 'total': 2})
+
+        reloaded.delete()
+        self.assertEqual(self.mine('emergency'), {'pending': 1, 'resolved': 0, 'total': 1})
+        self.assertEqual(counters.drift('emergency'), {})
+
+    def test_bulk_transitions_are_counted(self):
+        vehicle = EmergencyVehicle.objects.create(
+            vehicle_type='ambulance', vehicle_number='KA-01-0001', driver_name='Driver', driver_contact='9000000000',
+        )
+        dispatch_vehicle(self.create_emergency().pk, vehicle.pk, self.operator)
+        self.create_complaint()
+        Complaint.objects.update(created_at=timezone.now() - timedelta(days=30))
+        User.objects.create_user('gov', password='pass1234', role='government_authority')
+        self.assertEqual(escalate(), 1)
+        self.assertEqual(counters.drift('emergency'), {})
+        self.assertEqual(counters.drift('complaint'), {})
+        self.assertEqual(self.mine('complaint')['pending'], 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.create_complaint()
+        self.create_complaint()
+        Complaint.objects.update(status='resolved')  # Unreported
+        with self.assertRaises(CommandError):
+            call_command('reconcile_citizen_counters', '--check', stdout=StringIO())
+
+        call_command('reconcile_citizen_counters', stdout=StringIO())
+        self.assertEqual(self.mine('complaint'), {'pending': 0, 'resolved': 2, 'total': 2})
+        call_command('reconcile_citizen_counters', '--check', stdout=StringIO())
+
+    def test_dashboard_reads_one_lookup(self):
+        self.create_emergency()
+        self.create_emergency(status='resolved')
+        self.create_complaint()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        with self.assertNumQueries(1):
+            response = self.client.get('/dashboard/citizen/')
+        self.assertEqual(response.context['pending_emergencies'], 1)
+        self.assertEqual(response.context['pending_complaints'], 1)
+        self.assertEqual(response.context['resolved_requests'], 1)
+        self.assertEqual(response.context['total_requests'], 3)
+
+
+class ResponseSketchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.gov = User.objects.create_user('gov', password='pass1234', role='government_authority')
+        cls.fire = EmergencyType.objects.get(name='Fire')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+
+    def create_complaint(self, hours_ago, **kwargs):
+        complaint = Complaint.objects.create(
+            citizen=self.citizen, utility_type=self.water, title='Leak',
+            description='Pipe leak', address='1 Main Street', **kwargs,
+        )
+        Complaint.objects.filter(pk=complaint.pk).update(created_at=timezone.now() - timedelta(hours=hours_ago))
+        return Complaint.objects.get(pk=complaint.pk)
+
+    def stored(self):
+        return dict(
+            ResponseSketch.objects.filter(day=sketches.TOTAL_DAY).values_list('metric', 'count')
+        )
+
+    def test_merged_digests_estimate_quantiles(self):
+        values = [(i * 7919 % 10007) ** 1.5 for i in range(20000)]
+        parts = [sketches.TDigest() for _ in range(10)]
+        for i, value in enumerate(values):
+            parts[i % 10].add(value)
+        merged = sketches.TDigest.combine(sketches.TDigest.from_dict(part.to_dict()) for part in parts)
+        self.assertEqual(merged.count, 20000)
+        self.assertLessEqual(len(merged.centroids), sketches.COMPRESSION)
+        ordered = sorted(values)
+        for q in sketches.QUANTILES:
+            exact = ordered[int(q * len(ordered))]
+            self.assertAlmostEqual(merged.quantile(q) / exact, 1, delta=0.02)
+        self.assertEqual((merged.quantile(0), merged.quantile(1)), (ordered[0], ordered[-1]))
+        self.assertIsNone(sketches.TDigest().quantile(0.5))
+
+    def test_first_assignment_and_resolution_are_timed_once(self):
+        complaint = self.create_complaint(hours_ago=2)
+        complaint.status = 'assigned'
+        complaint.save()
+        complaint.status = 'resolved'
+        complaint.save()
+        complaint.status = 'assigned'  # Reopened: already timed
+        complaint.save()
+        self.create_complaint(hours_ago=1, parent=complaint, status='resolved')  # Duplicates aren't handled
+
+        self.assertEqual(self.stored(), {'complaint_assign': 1, 'complaint_resolve': 1})
+        summary = sketches.summarize(sketches.distribution('complaint_assign')['Water Department'])
+        self.assertAlmostEqual(summary['p50'], 7200, delta=5)
+        today = sketches.distribution('complaint_resolve', since=timezone.localdate())
+        self.assertEqual(list(today), ['Water Department'])
+
+    def test_bulk_transitions_are_timed(self):
+        vehicle = EmergencyVehicle.objects.create(
+            vehicle_type='ambulance', vehicle_number='KA-01-0001', driver_name='Driver', driver_contact='9000000000',
+        )
+        emergency = EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, address='1 Main Street',
+            description='Smoke', contact_number='5550100',
+        )
+        dispatch_vehicle(emergency.pk, vehicle.pk, self.operator)
+        complaints = [self.create_complaint(hours_ago=3) for _ in range(3)]
+        ids = [complaint.pk for complaint in complaints]
+        bulk.claim(self.officer, ids)
+        bulk.change_status(self.officer, ids[:2], 'resolved')
+        bulk.change_status(self.officer, ids[:2], 'assigned')
+        self.assertEqual(self.stored(), {'emergency_assign': 1, 'complaint_assign': 3, 'complaint_resolve': 2})
+        report = sketches.report(days=1)
+        self.assertEqual(report['emergency_assign'][str(self.fire.pk)]['count'], 1)
+        self.assertAlmostEqual(report['complaint_resolve']['Water Department']['p99'], 3 * 3600, delta=5)
+
+        # Rebuilding from the tables gives the same distributions
+        before = list(ResponseSketch.objects.order_by('metric', 'key', 'day').values_list('metric', 'key', 'day', 'count'))
+        call_command('rebuild_response_sketches', stdout=StringIO())
+        after = list(ResponseSketch.objects.order_by('metric', 'key', 'day').values_list('metric', 'key', 'day', 'count'))
+        self.assertEqual(before, after)
+
+    def test_gov_dashboard_shows_percentiles(self):
+        complaint = self.create_complaint(hours_ago=36)
+        complaint.status = 'resolved'
+        complaint.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.gov)
+        response = self.client.get('/dashboard/gov/')
+        [row] = response.context['response_times']
+        self.assertEqual((row['group'], row['name'], row['resolved']), ('Complaint', 'Water Department', 1))
+        self.assertEqual(row['resolve'], ['1.5d', '1.5d', '1.5d'])
+        self.assertEqual(row['assign'], ['-', '-', '-'])
+
+
+@skipUnless(heatmap.available(), 'NumPy is not installed')
+class HeatmapTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.gov = User.objects.create_user('gov', password='pass1234', role='government_authority')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+        cls.power = UtilityType.objects.get(name='Electricity')
+        cls.fire = EmergencyType.objects.get(name='Fire')
+
+    def setUp(self):
+        cache.clear()
+        heatmap.reset()
+
+    def create_complaint(self, lat, lng, utility_type=None, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen, utility_type=utility_type or self.water, title='Leak', description='Pipe leak',
+            address='1 Main Street', location_lat=lat, location_lng=lng, **kwargs,
+        )
+
+    def cells(self, **params):
+        response = self.client.get('/dashboard/gov/heatmap/', {'layer': 'complaint', 'zoom': 17, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return {(x, y): n for x, y, n in response.json()['cells']}
+
+    def test_bins_filters_and_crops(self):
+        self.create_complaint('12.971600', '77.594600')
+        self.create_complaint('12.971650', '77.594650', utility_type=self.power, status='resolved')
+        self.create_complaint('12.990000', '77.620000')
+        self.create_complaint(None, None)
+        old = self.create_complaint('12.971600', '77.594600')
+        Complaint.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=40))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.gov)
+
+        # Slippy-map tile of the first point at zoom 17
+        tile = (93787, 60772)
+        self.assertEqual(self.cells(), {tile: 2, (93796, 60765): 1})
+        self.assertEqual(self.cells(window='365d')[tile], 3)
+        self.assertEqual(self.cells(type=self.power.pk), {tile: 1})
+        self.assertEqual(self.cells(status='pending'), {tile: 1, (93796, 60765): 1})
+        self.assertEqual(self.cells(zoom=8), {(183, 118): 3})
+        self.assertEqual(self.cells(bbox='77.59,12.96,77.60,12.98'), {tile: 2})
+
+    def test_refresh_reads_changed_rows(self):
+        complaint = self.create_complaint('12.971600', '77.594600')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.gov)
+        self.assertEqual(sum(self.cells(status='pending').values()), 1)
+
+        complaint.status = 'resolved'
+        complaint.save()
+        self.create_complaint('12.990000', '77.620000')
+        EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, address='1 Main Street', description='Smoke',
+            contact_number='5550100', location_lat='12.971600', location_lng='77.594600',
+        )
+        cache.set(heatmap.GENERATION_KEY, 'next window')  # Orphans the cached pyramids
+        store = heatmap.stores['complaint']
+        store.refreshed_at -= heatmap.REFRESH_INTERVAL + 1
+        with self.assertNumQueries(1):  # Only the changed rows
+            self.assertEqual(sum(self.cells(status='pending').values()), 1)
+        self.assertEqual(sum(self.cells(status='resolved').values()), 1)
+        self.assertEqual(sum(self.cells(layer='emergency').values()), 1)
+
+        # Cached pyramids answer pans and zooms without reading anything
+        with self.assertNumQueries(0):
+            self.cells(zoom=12, status='resolved', bbox='77.5,12.9,77.7,13.0')
+
+    def test_pyramid_levels_add_up(self):
+        snapshot = heatmap.Snapshot.from_rows(
+            [(n, 12.9 + n * 0.001, 77.5 + n * 0.002, timezone.now(), 1, 'pending') for n in range(500)],
+            heatmap.status_codes('complaint'),
+        )
+        levels = snapshot.pyramid(snapshot.select(0, 2 ** 40))
+        self.assertEqual({zoom: int(counts.sum()) for zoom, (_, _, counts) in levels.items()},
+                         dict.fromkeys(range(heatmap.MIN_ZOOM, heatmap.MAX_ZOOM + 1), 500))
+
+    def test_rejects_other_roles_and_bad_parameters(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        self.assertEqual(self.client.get('/dashboard/gov/heatmap/').status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.gov)
+        for params in ({'layer': 'users'}, {'window': '2d'}, {'zoom': 3}, {'zoom': 'x'},
+                       {'status': 'en_route'}, {'bbox': '1,2,3'}, {'bbox': 'nan,0,1,1'}, {'bbox': '0,-inf,1,1'}):
+            self.assertEqual(self.client.get('/dashboard/gov/heatmap/', params).status_code, 400, params)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.gov = User.objects.create_user('gov', password='pass1234', role='government_authority')
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+        cls.fire = EmergencyType.objects.get(name='Fire')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.gov)
+
+    def create_complaint(self, title, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen, utility_type=self.water, title=title, description='Pipe leak',
+            address='1 Main Street, "Block A"', location_lat='12.971600', location_lng='77.594600', **kwargs,
+        )
+
+    def download(self, **params):
+        response = self.client.get('/dashboard/gov/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_streams_one_month_as_csv(self):
+        this_month = timezone.localdate().replace(day=1)
+        self.create_complaint('Leak, main road')
+        old = self.create_complaint('Old leak')
+        Complaint.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=40))
+
+        response, body = self.download(dataset='complaints', format='csv', month=f'{this_month:%Y-%m}')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="complaints-{this_month:%Y-%m}.csv"')
+        rows = list(csv.DictReader(body.decode().splitlines()))
+        self.assertEqual([row['title'] for row in rows], ['Leak, main road'])
+        self.assertEqual(rows[0]['address'], '1 Main Street, "Block A"')
+        self.assertEqual((rows[0]['utility_type'], rows[0]['department']), ('Water Supply', 'Water Department'))
+        self.assertEqual(rows[0]['location_lat'], '12.9716')
+
+        _, body = self.download(dataset='complaints', format='csv')
+        self.assertEqual(len(body.decode().splitlines()), 3)
+
+    def test_csv_cells_are_not_formulas(self):
+        self.create_complaint('=HYPERLINK("http://example.com","Leak")')
+        self.create_complaint('-5 bar at the main')
+        _, body = self.download(dataset='complaints', format='csv')
+        rows = list(csv.DictReader(body.decode().splitlines()))
+        self.assertEqual([row['title'] for row in rows], ['\'=HYPERLINK("http://example.com","Leak")', "'-5 bar at the main"])
+        self.assertEqual(rows[0]['location_lat'], '12.9716')  # Numbers are left alone
+
+        _, body = self.download(dataset='complaints', format='ndjson')
+        self.assertEqual(json.loads(body.decode().splitlines()[0])['title'], '=HYPERLINK("http://example.com","Leak")')
+
+    def test_gzipped_ndjson_of_dispatches(self):
+        vehicle = EmergencyVehicle.objects.create(
+            vehicle_type='ambulance', vehicle_number='KA-01-0001', driver_name='Driver', driver_contact='9000000000',
+        )
+        emergency = EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, address='1 Main Street',
+            description='Smoke', contact_number='5550100',
+        )
+        dispatch_vehicle(emergency.pk, vehicle.pk, self.operator)
+
+        response, body = self.download(dataset='dispatches', format='ndjson', gzip='on')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['vehicle_number'], 'KA-01-0001')
+        self.assertEqual(records[0]['emergency_id'], emergency.pk)
+
+    def test_output_comes_in_bounded_pieces(self):
+        for n in range(50):
+            self.create_complaint(f'Leak {n}')
+        utility_types.all()  # Loaded, so only the extract is read below
+        with mock.patch.object(exports, 'CHUNK_SIZE', 10), mock.patch.object(exports, 'PIECE_BYTES', 1024):
+            with self.assertNumQueries(0):
+                pieces = exports.stream('complaints', 'csv')  # Lazy until read
+            with self.assertNumQueries(1):
+                pieces = list(pieces)
+        self.assertGreater(len(pieces), 5)
+        self.assertTrue(all(len(piece) < 2048 for piece in pieces))
+        self.assertEqual(len(b''.join(pieces).decode().splitlines()), 51)
+
+    def test_command_writes_a_file(self):
+        self.create_complaint('Leak')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.ndjson.gz')
+            call_command('export_records', 'complaints', '--format', 'ndjson', '--gzip', '--output', path,
+                         '--month', f'{timezone.localdate():%Y-%m}', stdout=StringIO())
+            with gzip.open(path, 'rt') as extract:
+                self.assertEqual([json.loads(line)['title'] for line in extract], ['Leak'])
+        with self.assertRaises(CommandError):
+            call_command('export_records', 'complaints', '--month', 'May', stdout=StringIO())
+
+    def test_rejects_other_roles_and_bad_requests(self):
+        self.assertRedirects(self.client.get('/dashboard/gov/export/', {'dataset': 'users', 'format': 'csv'}),
+                             '/dashboard/gov/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        response = self.client.get('/dashboard/gov/export/', {'dataset': 'complaints', 'format': 'csv'})
+        self.assertRedirects(response, '/dashboard/', fetch_redirect_response=False)
@@ -0,0 +1,124 @@
+"""
+One place that accounts for records changing.
+
+The rollups, citizen counters, response-time sketches and change versions
+of this package, and the fragment versions of the records themselves, all
+follow emergencies and complaints (users only have rollups).
+``apply_transitions`` brings every one of them up to date from what the
+changed records were before and are after, with one batch of writes per
+store however many records changed. It runs in the caller's transaction,
+so what it writes commits or rolls back with the change.
+
+Rows are a record's field values: ``vars()`` of an instance, or a
+``values()`` row of ``fields(model)``. The model signals in ``dashboard.signals``
+remember the row of every loaded instance and call ``apply_transitions``
+for each save and delete. Code that changes records with
+``QuerySet.update()`` reads the rows under lock before the update and
+calls it with them and what it set them to.
+"""
+
+from collections import Counter, defaultdict
+
+from smartcity import fragments
+from . import changes, counters, rollups, sketches
+
+# model label -> (rollup metric, citizen domain or None, fields read of each row)
+MODELS = {
+    'emergency.EmergencyRequest': ('emergency', 'emergency', (
+        'id', 'citizen_id', 'emergency_type_id', 'status', 'created_at', 'updated_at', 'assigned_at', 'resolved_at',
+    )),
+    'utilities.Complaint': ('complaint', 'complaint', (
+        'id', 'citizen_id', 'utility_type_id', 'status', 'created_at', 'updated_at', 'assigned_at', 'resolved_at',
+        'parent_id',
+    )),
+    'accounts.User': ('user', None, ('id', 'date_joined', 'role')),
+}
+
+
+def fields(model):
+    """What ``apply_transitions`` reads of each row of ``model``"""
+    return MODELS[model._meta.label][2]
+
+
+def snapshot(instance):
+    """The loaded fields of ``instance`` that ``apply_transitions`` reads"""
+    values = vars(instance)
+    return {name: values[name] for name in fields(type(instance)) if name in values}
+
+
+def saved_row(instance):
+    """
+    The row of an instance just saved. Its citizen is loaded if it was
+    deferred: the other stores can wait for a rebuild, but a missed change
+    version would keep serving the citizen a stale listing.
+    """
+    if MODELS[instance._meta.label][1] is not None and 'citizen_id' in instance.get_deferred_fields():
+        instance.refresh_from_db(fields=['citizen_id'])
+    return vars(instance)
+
+
+def remember(instance):
+    """Note the row ``instance`` has now, to diff against when it is saved"""
+    instance._transition_row = snapshot(instance) if instance.pk else None
+
+
+def remembered(instance):
+    return getattr(instance, '_transition_row', None)
+
+
+def _states(state, old, new):
+    """
+    ``(old state, new state)`` of one record, or None if a row lacks a
+    field ``state`` needs (it was loaded with ``only()``); rebuilding the
+    store picks that change up.
+    """
+    old_state = None if old is None else state(old)
+    new_state = None if new is None else state(new)
+    if (old is not None and old_state is None) or (new is not None and new_state is None):
+        return None
+    return old_state, new_state
+
+
+def apply_transitions(model, old_rows, new_rows):
+    """
+    Account for records of ``model`` going from ``old_rows`` to
+    ``new_rows``, two parallel lists of rows. None stands for a record
+    that didn't exist before (created) or doesn't any more (deleted).
+    """
+    metric, domain, _ = MODELS[model._meta.label]
+    rollup_deltas, counter_deltas, samples = Counter(), Counter(), []
+    changed_at = defaultdict(set)  # time of change -> citizen ids
+    pks = []
+    for old, new in zip(old_rows, new_rows):
+        states = _states(lambda row: rollups.state(metric, row), old, new)
+        if states and states[0] != states[1]:
+            rollup_deltas.update(rollups.changes(metric, *states))
+        if domain is None:
+            continue
+
+        states = _states(counters.state, old, new)
+        if states and states[0] != states[1]:
+            counter_deltas.update(counters.changes(*states))
+
+        # Timed only where the change is what fills a timestamp in; duplicates follow their parent instead
+        states = _states(lambda row: sketches.state(domain, row), old, new)
+        type_attname = sketches.DOMAINS[domain][1]
+        if (
+            states and new is not None and new.get('created_at') is not None and type_attname in new
+            and (domain != 'complaint' or ('parent_id' in new and new['parent_id'] is None))
+        ):
+            samples.extend(sketches.samples(domain, new['created_at'], new[type_attname], *states))
+
+        row = new if new is not None else old
+        changed_at[new.get('updated_at') if new is not None else None].add(row.get('citizen_id'))
+        pks.append(row.get('id'))
+
+    rollups.apply(rollup_deltas)
+    if domain is None:
+        return
+    counters.apply(domain, counter_deltas)
+    sketches.record(samples)
+    # After the counters, which make sure the citizens' rows exist
+    for at, citizen_ids in changed_at.items():
+        changes.bump(domain, citizen_ids, at)
+    fragments.bump(model._meta.label_lower, [pk for pk in pks if pk is not None])
@@ -7,6 +7,8 @@ urlpatterns = [
     path('', views.dashboard_redirect, name='dashboard'),
     path('citizen/', views.citizen_dashboard, name='citizen'),
     path('gov/', views.gov_dashboard, name='gov'),
+    path('gov/heatmap/', views.heatmap_tiles, name='heatmap'),
+    path('gov/export/', views.export_records, name='export'),
     path('utility/', views.utility_dashboard, name='utility'),
     path('emergency/', views.emergency_dashboard, name='emergency'),
     path('driver/', views.driver_dashboard, name='driver'),
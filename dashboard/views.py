@@ -1,7 +1,18 @@
+import math
+from datetime import timedelta
+
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
-from accounts.models import User
+from django.db.models import Count, Sum
+from django.utils import timezone
+from emergency.models import EmergencyVehicle, VehicleTrack
+from emergency.registry import emergency_types
+from emergency.telemetry import telemetry_buffer
+from utilities.registry import utility_types
+from . import counters, exports, heatmap, rollups, sketches
+from .forms import ExportForm
 
 @login_required
 def dashboard_redirect(request):
@@ -28,47 +39,186 @@ def citizen_dashboard(request):
     if request.user.role != 'citizen':
         return redirect('dashboard:dashboard')
     
-    # Get actual statistics from database
-    pending_emergencies = request.user.emergency_requests.filter(status='pending').count()
-    pending_complaints = request.user.complaints.filter(status='pending').count()
-    resolved_requests = request.user.emergency_requests.filter(status='resolved').count() + request.user.complaints.filter(status='resolved').count()
-    total_requests = request.user.emergency_requests.count() + request.user.complaints.count()
+    # Both domains' counters in one lookup instead of six COUNTs
+    mine = counters.for_citizen(request.user)
+    emergencies, complaints = mine['emergency'], mine['complaint']
     
     context = {
         'title': 'Citizen Dashboard',
         'user': request.user,
-        'pending_emergencies': pending_emergencies,
-        'pending_complaints': pending_complaints,
-        'resolved_requests': resolved_requests,
-        'total_requests': total_requests,
+        'pending_emergencies': emergencies['pending'],
+        'pending_complaints': complaints['pending'],
+        'resolved_requests': emergencies['resolved'] + complaints['resolved'],
+        'total_requests': emergencies['total'] + complaints['total'],
     }
     return render(request, 'dashboard/citizen.html', context)
 
 
+RESPONSE_TIME_DAYS = 7
+
+
+def _percentiles(summary):
+    """Formatted p50/p90/p99 of a ``sketches.summarize`` result (dashes when there's none)"""
+    return [sketches.format_duration((summary or {}).get(name)) for name in ('p50', 'p90', 'p99')]
+
+
 @login_required
 def gov_dashboard(request):
     """Government authority dashboard - show city stats"""
     if request.user.role != 'government_authority':
         return redirect('dashboard:dashboard')
     
-    # Get system statistics (will populate later)
-    total_users = User.objects.count()
-    citizens = User.objects.filter(role='citizen').count()
+    # Every number comes from pre-aggregated rollup rows
+    city = rollups.city_stats()
+    
+    total_users = sum(city['users_by_role'].values())
+    citizens = city['users_by_role'].get('citizen', 0)
     staff = total_users - citizens
     
+    emergencies_by_type = []
+    for type_id, statuses in city['emergencies_by_type'].items():
+        emergency_type = emergency_types.get(type_id)
+        emergencies_by_type.append({
+            'name': emergency_type.name if emergency_type else f'Type #{type_id}',
+            'icon': emergency_type.icon if emergency_type else 'exclamation-triangle',
+            'open': sum(statuses[status] for status in rollups.OPEN_EMERGENCY_STATUSES),
+            'resolved': statuses['resolved'],
+            'total': sum(statuses.values()),
+        })
+    
+    # Departments own several utility types
+    departments = {}
+    for type_id, statuses in city['complaints_by_type'].items():
+        utility_type = utility_types.get(type_id)
+        department = departments.setdefault(
+            utility_type.department if utility_type else 'Unknown',
+            {'open': 0, 'escalated': 0, 'resolved': 0, 'total': 0},
+        )
+        department['open'] += sum(statuses[status] for status in rollups.OPEN_COMPLAINT_STATUSES)
+        department['escalated'] += statuses['escalated']
+        department['resolved'] += statuses['resolved']
+        department['total'] += sum(statuses.values())
+    
+    # Last 24 hours, oldest first
+    since = timezone.localtime().replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    hourly = rollups.hourly(since)
+    last_24_hours = []
+    for offset in range(24):
+        hour = since + timedelta(hours=offset)
+        last_24_hours.append({
+            'hour': hour,
+            'emergencies': hourly['emergency'].get(hour, 0),
+            'complaints': hourly['complaint'].get(hour, 0),
+        })
+    
+    # Percentiles of the last week's transitions, merged from the daily sketches
+    report = sketches.report(days=RESPONSE_TIME_DAYS)
+    response_times = []
+    for domain, name in (
+        ('emergency', lambda key: getattr(emergency_types.get(int(key)), 'name', f'Type #{key}')),
+        ('complaint', str),
+    ):
+        assign, resolve = (report.get(metric, {}) for metric in sketches.METRICS[domain])
+        for key in sorted(assign.keys() | resolve.keys(), key=name):
+            response_times.append({
+                'group': domain.title(),
+                'name': name(key),
+                'assign': _percentiles(assign.get(key)),
+                'resolve': _percentiles(resolve.get(key)),
+                'resolved': resolve[key]['count'] if key in resolve else 0,
+            })
+    
+    stats = [
+        {'label': 'Total Emergencies', 'value': city['total_emergencies'], 'icon': 'ambulance', 'color': 'primary'},
+        {'label': 'Pending Emergencies', 'value': city['pending_emergencies'], 'icon': 'bell', 'color': 'danger'},
+        {'label': 'Resolved Emergencies', 'value': city['resolved_emergencies'], 'icon': 'check-circle', 'color': 'success'},
+        {'label': 'Open Complaints', 'value': city['open_complaints'], 'icon': 'tools', 'color': 'warning'},
+        {'label': 'Escalated Complaints', 'value': city['escalated_complaints'], 'icon': 'exclamation-circle', 'color': 'danger'},
+        {'label': 'Reported Today', 'value': city['emergencies_today'] + city['complaints_today'], 'icon': 'calendar-day', 'color': 'info'},
+        {'label': 'Citizens', 'value': citizens, 'icon': 'users', 'color': 'primary'},
+        {'label': 'Staff', 'value': staff, 'icon': 'user-tie', 'color': 'info'},
+    ]
+    
     context = {
         'title': 'Government Dashboard',
+        'welcome_message': f'Welcome, {request.user.username}',
         'user': request.user,
+        'stats': stats,
         'total_users': total_users,
         'citizens': citizens,
         'staff': staff,
-        'total_emergencies': 0,
-        'pending_emergencies': 0,
-        'resolved_emergencies': 0,
+        'total_emergencies': city['total_emergencies'],
+        'pending_emergencies': city['pending_emergencies'],
+        'resolved_emergencies': city['resolved_emergencies'],
+        'emergencies_by_type': sorted(emergencies_by_type, key=lambda row: -row['total']),
+        'complaints_by_department': sorted(departments.items(), key=lambda item: -item[1]['total']),
+        'last_24_hours': last_24_hours,
+        'response_times': response_times,
+        'response_time_days': RESPONSE_TIME_DAYS,
+        'export_form': ExportForm(initial={'month': timezone.localdate().replace(day=1)}),
     }
     return render(request, 'dashboard/gov.html', context)
 
 
+@login_required
+def export_records(request):
+    """Download complaints, emergencies or dispatches as streamed CSV or NDJSON (see ``dashboard.exports``)"""
+    if request.user.role != 'government_authority':
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard:dashboard')
+    
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        messages.error(request, 'Choose a dataset, a format and optionally a month to export.')
+        return redirect('dashboard:gov')
+    
+    data = form.cleaned_data
+    content_type = 'application/gzip' if data['gzip'] else exports.FORMATS[data['format']][0]
+    response = StreamingHttpResponse(
+        exports.stream(data['dataset'], data['format'], month=data['month'], compress=data['gzip']),
+        content_type=content_type,
+    )
+    name = exports.filename(data['dataset'], data['format'], month=data['month'], compress=data['gzip'])
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+@login_required
+def heatmap_tiles(request):
+    """
+    Density of complaints or emergencies as slippy-map tiles:
+    ``?layer=complaint&zoom=14&window=7d`` with optional ``type``,
+    ``status`` and ``bbox=west,south,east,north``. See ``dashboard.heatmap``.
+    """
+    if request.user.role != 'government_authority':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    if not heatmap.available():
+        return JsonResponse({'error': 'Heatmaps need NumPy, which is not installed.'}, status=503)
+    
+    params = request.GET
+    layer = params.get('layer', 'complaint')
+    window = params.get('window', '7d')
+    status = params.get('status') or None
+    if layer not in heatmap.LAYERS:
+        return JsonResponse({'error': f'layer must be one of {", ".join(heatmap.LAYERS)}.'}, status=400)
+    if window not in heatmap.WINDOWS:
+        return JsonResponse({'error': f'window must be one of {", ".join(heatmap.WINDOWS)}.'}, status=400)
+    if status is not None and status not in heatmap.status_codes(layer):
+        return JsonResponse({'error': f'Unknown {layer} status "{status}".'}, status=400)
+    try:
+        zoom = int(params.get('zoom', 12))
+        type_id = int(params['type']) if params.get('type') else None
+        bbox = tuple(float(value) for value in params['bbox'].split(',')) if params.get('bbox') else None
+    except ValueError:
+        return JsonResponse({'error': 'zoom and type must be integers and bbox four numbers.'}, status=400)
+    if not heatmap.MIN_ZOOM <= zoom <= heatmap.MAX_ZOOM:
+        return JsonResponse({'error': f'zoom must be between {heatmap.MIN_ZOOM} and {heatmap.MAX_ZOOM}.'}, status=400)
+    if bbox is not None and (len(bbox) != 4 or not all(map(math.isfinite, bbox))):
+        return JsonResponse({'error': 'bbox must be west,south,east,north.'}, status=400)
+    
+    return JsonResponse(heatmap.tiles(layer, zoom, window, type_id=type_id, status=status, bbox=bbox))
+
+
 @login_required
 def utility_dashboard(request):
     """Utility officer dashboard"""
@@ -108,12 +258,23 @@ def driver_dashboard(request):
     if request.user.role != 'vehicle_driver':
         return redirect('dashboard:dashboard')
     
+    # Distance today: stored tracks plus what the telemetry buffer hasn't flushed yet
+    vehicle = EmergencyVehicle.objects.filter(driver=request.user).first()
+    distance_km, position = 0.0, None
+    if vehicle:
+        midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        stored = VehicleTrack.objects.filter(vehicle=vehicle, started_at__gte=midnight).aggregate(km=Sum('distance_km'))
+        distance_km = (stored['km'] or 0.0) + telemetry_buffer.unsaved_km(vehicle.id)
+        position = telemetry_buffer.latest(vehicle.id)
+    
     context = {
         'title': 'Driver Dashboard',
         'user': request.user,
+        'vehicle': vehicle,
+        'position': position and {'lat': position[1], 'lng': position[2]},
         'current_assignment': 'None',
-        'status': 'Available',
+        'status': 'Available' if vehicle is None or vehicle.is_available else 'On Dispatch',
         'completed_today': 0,
-        'total_distance': '0 km',
+        'total_distance': f'{distance_km:.1f} km',
     }
     return render(request, 'dashboard/driver.html', context)
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class EmergencyConfig(AppConfig):
     name = 'emergency'
+
+    def ready(self):
+        from . import signals  # noqa: F401
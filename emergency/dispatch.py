@@ -0,0 +1,159 @@
+"""
+Vehicle dispatch as one transaction.
+
+A vehicle is claimed with a conditional ``UPDATE ... WHERE is_available``
+inside the same transaction that records the dispatch and moves the
+emergency to ``assigned``. Two operators picking the same vehicle during
+a surge can't both win: the second one finds nothing to update and gets
+``VehicleUnavailable`` instead of a double booking.
+
+``dispatch_vehicles`` takes any number of (emergency, vehicle) pairs and
+handles them with a fixed number of queries, which is what the batch
+endpoint uses. Because the writes are bulk updates, the side effects that
+model signals would normally trigger are done here explicitly: the
+emergencies' transitions go through ``dashboard.transitions`` like a
+save's do, and the spatial index, vehicle fragments and live dashboard
+events are updated here.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+from dashboard.transitions import apply_transitions, remember, snapshot
+from smartcity import fragments
+from .events import dispatch_event, emergency_event, publish_on_commit
+from .models import EmergencyRequest, EmergencyVehicle, DispatchRecord
+from .spatial import vehicle_index
+from .stats import ACTIVE_EMERGENCY_STATUSES, invalidate_operator_stats
+
+MAX_ID = 2 ** 63 - 1  # largest primary key a database integer column holds
+
+# Emergencies that can still take another vehicle
+DISPATCHABLE_STATUSES = ['pending', *ACTIVE_EMERGENCY_STATUSES]
+
+
+class DispatchError(Exception):
+    """A pair that could not be dispatched; the message is shown to operators"""
+
+
+class VehicleUnavailable(DispatchError):
+    pass
+
+
+class EmergencyClosed(DispatchError):
+    pass
+
+
+def dispatch_vehicles(pairs, operator):
+    """
+    Dispatch each ``(emergency_id, vehicle_id)`` in ``pairs``.
+
+    Returns ``(dispatches, errors)``: the created ``DispatchRecord``s and
+    ``{index in pairs: DispatchError}`` for pairs that were refused.
+    Refused pairs don't affect the others.
+    """
+    now = timezone.now()
+    errors = {}
+    parsed = []
+    for index, pair in enumerate(pairs):
+        try:
+            parsed.append((index, _as_id(pair[0]), _as_id(pair[1])))
+        except (TypeError, ValueError, IndexError, KeyError):
+            errors[index] = DispatchError('Pick an emergency and a vehicle.')
+    if not parsed:
+        return [], errors
+
+    with transaction.atomic():
+        emergencies = EmergencyRequest.objects.select_for_update().in_bulk(
+            {emergency_id for _, emergency_id, _ in parsed}
+        )
+        available = set(
+            EmergencyVehicle.objects.select_for_update().order_by()
+            .filter(pk__in={vehicle_id for _, _, vehicle_id in parsed}, is_available=True)
+            .values_list('pk', flat=True)
+        )
+
+        accepted = []
+        accepted_at = []
+        for index, emergency_id, vehicle_id in parsed:
+            emergency = emergencies.get(emergency_id)
+            if emergency is None or emergency.status not in DISPATCHABLE_STATUSES:
+                errors[index] = EmergencyClosed(f'Emergency #{emergency_id} is no longer open.')
+            elif vehicle_id not in available:
+                errors[index] = VehicleUnavailable(f'Vehicle #{vehicle_id} has already been dispatched.')
+            else:
+                available.discard(vehicle_id)  # Once per batch, too
+                accepted.append((emergency_id, vehicle_id))
+                accepted_at.append(index)
+        if not accepted:
+            return [], errors
+
+        # The claim itself: only rows still available are flipped
+        vehicle_ids = [vehicle_id for _, vehicle_id in accepted]
+        claimed = EmergencyVehicle.objects.filter(pk__in=vehicle_ids, is_available=True).update(
+            is_available=False, last_updated=now,
+        )
+        if claimed != len(vehicle_ids):
+            # Lost a race the row locks should have prevented; leave nothing half done
+            transaction.set_rollback(True)
+            return [], {
+                **errors,
+                **{index: VehicleUnavailable('Vehicle availability changed, please try again.') for index in accepted_at},
+            }
+
+        dispatches = DispatchRecord.objects.bulk_create(
+            DispatchRecord(
+                emergency_request_id=emergency_id, vehicle_id=vehicle_id,
+                assigned_by=operator, status='assigned',
+            )
+            for emergency_id, vehicle_id in accepted
+        )
+
+        # First vehicle on a pending emergency moves it to assigned
+        pending = {
+            emergency_id: emergencies[emergency_id]
+            for emergency_id, _ in accepted if emergencies[emergency_id].status == 'pending'
+        }
+        if pending:
+            EmergencyRequest.objects.filter(pk__in=pending, status='pending').update(
+                status='assigned', assigned_at=now, updated_at=now,
+            )
+            # QuerySet.update() sends no signals
+            old_rows = [snapshot(emergency) for emergency in pending.values()]
+            for emergency in pending.values():
+                emergency.status, emergency.assigned_at, emergency.updated_at = 'assigned', now, now
+                remember(emergency)
+            apply_transitions(EmergencyRequest, old_rows, [snapshot(emergency) for emergency in pending.values()])
+
+        fragments.bump(EmergencyVehicle._meta.label_lower, vehicle_ids)
+        transaction.on_commit(lambda: _claimed(vehicle_ids))
+        publish_on_commit(lambda: [
+            *(emergency_event(emergency) for emergency in pending.values()),
+            *(dispatch_event(dispatch, created=True) for dispatch in dispatches),
+        ])
+
+    return dispatches, errors
+
+
+def dispatch_vehicle(emergency_id, vehicle_id, operator):
+    """Dispatch one vehicle; raises ``DispatchError`` if it can't be done"""
+    dispatches, errors = dispatch_vehicles([(emergency_id, vehicle_id)], operator)
+    if errors:
+        raise next(iter(errors.values()))
+    return dispatches[0]
+
+
+def _as_id(value):
+    """A primary key from a client, which may send any JSON value: only an int or a string of digits will do"""
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        value = int(value)
+    elif not isinstance(value, int) or isinstance(value, bool):
+        raise TypeError('Not an id')
+    if not 0 < value <= MAX_ID:
+        raise ValueError('Not an id')
+    return value
+
+
+def _claimed(vehicle_ids):
+    for vehicle_id in vehicle_ids:
+        vehicle_index.remove(vehicle_id)
+    invalidate_operator_stats()
@@ -0,0 +1,120 @@
+"""
+Live updates for operator dashboards.
+
+Model signals publish small JSON deltas (a new or changed emergency, a
+dispatch status change) once their transaction commits. Each delta is
+written as an ``OperatorEvent`` row, so a dashboard served by any worker
+process sees it: the dashboard remembers the id of the last event it has
+and asks for the ones after it.
+
+Under ASGI (``smartcity.asgi``) ``operator_events`` holds a Server-Sent
+Events stream that checks for new rows every ``POLL_INTERVAL`` seconds.
+Under WSGI a stream would hold a worker for as long as the page is open,
+so the same URL answers each poll with the events after ``?after=`` as
+JSON and the page polls it instead.
+
+Events are only built and written while a dashboard has polled or opened
+a stream in the last ``LISTEN_SECONDS``, and rows older than ``RETENTION``
+are pruned as new ones arrive.
+"""
+
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import OperatorEvent
+from .registry import emergency_types
+from .stats import invalidate_operator_stats
+
+LISTENING_KEY = 'emergency:events:listening'
+LISTEN_SECONDS = 60  # how long a dashboard counts as open after its last poll
+POLL_INTERVAL = 1  # seconds between checks of a live stream
+RETENTION = timedelta(minutes=10)
+PRUNE_EVERY = 100  # events between prunes
+MAX_EVENTS_PER_READ = 200
+
+
+def listen():
+    """Note that a dashboard is open, so changes keep being logged for it"""
+    cache.set(LISTENING_KEY, True, LISTEN_SECONDS)
+
+
+def listening():
+    return bool(cache.get(LISTENING_KEY))
+
+
+def cursor():
+    """Id of the newest event; a dashboard rendered now wants the ones after it"""
+    return OperatorEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def read(after, limit=MAX_EVENTS_PER_READ):
+    """``[(id, event)]`` of the events after id ``after``, oldest first"""
+    rows = OperatorEvent.objects.filter(id__gt=after).order_by('id').values_list('id', 'payload')
+    return list(rows[:limit])
+
+
+def publish_on_commit(build):
+    """
+    Once the current transaction commits, send the events ``build()``
+    returns to live dashboards.
+
+    Nothing is built while no dashboard is listening, and the events run
+    after the change they describe has committed: a failure here is logged
+    instead of reaching the code that made the change.
+    """
+    def send():
+        if listening():
+            _log(build())
+
+    transaction.on_commit(send, robust=True)
+
+
+def publish(*events):
+    """Log ``events`` for the open dashboards of every worker"""
+    if events and listening():
+        _log(events)
+
+
+def _log(events):
+    if not events:
+        return
+    # Dashboards follow each delta with counters, so make sure they're fresh
+    invalidate_operator_stats()
+    rows = OperatorEvent.objects.bulk_create([OperatorEvent(payload=event) for event in events])
+    if any(row.id and row.id % PRUNE_EVERY == 0 for row in rows):
+        OperatorEvent.objects.filter(created_at__lt=timezone.now() - RETENTION).delete()
+
+
+def emergency_event(emergency, created=False):
+    emergency_type = emergency_types.get(emergency.emergency_type_id)
+    return {
+        'type': 'emergency',
+        'created': created,
+        'id': emergency.id,
+        'status': emergency.status,
+        'priority': emergency.priority,
+        'emergency_type': emergency_type.name if emergency_type else f'Type #{emergency.emergency_type_id}',
+        'icon': emergency_type.icon if emergency_type else 'exclamation-triangle',
+        'address': emergency.address,
+        'created_at': timezone.localtime(emergency.created_at).strftime('%I:%M %p'),
+        'due_at': emergency.due_at.timestamp(),
+    }
+
+
+def dispatch_event(dispatch, created=False):
+    return {
+        'type': 'dispatch',
+        'created': created,
+        'id': dispatch.id,
+        'emergency_id': dispatch.emergency_request_id,
+        'status': dispatch.status,
+    }
+
+
+def format_sse(event, event_id=None):
+    """Encode one event in the text/event-stream wire format; ``event_id`` lets a reconnect resume after it"""
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -1,9 +1,17 @@
 from django import forms
+from smartcity.registry import RegistryChoiceField, RegistryFormMixin
 from .models import EmergencyRequest, EmergencyType, EmergencyVehicle  # ← Added EmergencyVehicle import
+from .registry import emergency_types
 
-class EmergencyRequestForm(forms.ModelForm):
+class EmergencyRequestForm(RegistryFormMixin, forms.ModelForm):
     """Form for citizens to submit emergency requests"""
     
+    # Choices and validation come from the in-memory registry, not a query
+    emergency_type = RegistryChoiceField(
+        emergency_types,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    
     # Add a manual location field as fallback
     manual_location = forms.CharField(
         required=False,
@@ -33,7 +41,6 @@ class EmergencyRequestForm(forms.ModelForm):
             'location_lat': forms.HiddenInput(),
             'location_lng': forms.HiddenInput(),
             'priority': forms.Select(attrs={'class': 'form-control'}),
-            'emergency_type': forms.Select(attrs={'class': 'form-control'}),
             'address': forms.Textarea(attrs={'rows': 2, 'class': 'form-control'}),
             'landmark': forms.TextInput(attrs={'class': 'form-control'}),
             'contact_number': forms.TextInput(attrs={'class': 'form-control'}),
@@ -69,11 +76,23 @@ class EmergencyVehicleForm(forms.ModelForm):
     
     class Meta:
         model = EmergencyVehicle  # ← Now properly imported
-        fields = ['vehicle_type', 'vehicle_number', 'driver_name', 'driver_contact', 'current_location']
+        fields = ['vehicle_type', 'vehicle_number', 'driver_name', 'driver_contact', 'driver', 'current_location', 'location_lat', 'location_lng']
         widgets = {
             'vehicle_type': forms.Select(attrs={'class': 'form-control'}),
             'vehicle_number': forms.TextInput(attrs={'class': 'form-control'}),
             'driver_name': forms.TextInput(attrs={'class': 'form-control'}),
             'driver_contact': forms.TextInput(attrs={'class': 'form-control'}),
+            'driver': forms.Select(attrs={'class': 'form-control'}),
             'current_location': forms.TextInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+            'location_lat': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'placeholder': 'Latitude'}),
+            'location_lng': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'placeholder': 'Longitude'}),
+        }
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        
+        # Coordinates only make sense as a pair
+        if (cleaned_data.get('location_lat') is None) != (cleaned_data.get('location_lng') is None):
+            self.add_error('location_lng', 'Enter both latitude and longitude, or neither.')
+        
+        return cleaned_data
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0004_alter_dispatchrecord_id_alter_emergencyrequest_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyvehicle',
+            name='location_lat',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyvehicle',
+            name='location_lng',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0005_emergencyvehicle_location'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dispatchrecord',
+            index=models.Index(fields=['status', '-assigned_at'], name='dispatch_status_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['status', '-created_at'], name='emergency_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['status', 'resolved_at'], name='emergency_status_resolved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['citizen', '-created_at'], name='emergency_citizen_created_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0006_dashboard_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='emergencyrequest',
+            name='emergency_status_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='emergencyrequest',
+            name='emergency_citizen_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['status', 'created_at'], name='emergency_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['citizen', 'created_at'], name='emergency_citizen_created_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+DEFAULT_TYPES = [
+    ('Medical Emergency', 'Medical emergencies including accidents, heart attacks, etc.', 'heartbeat'),
+    ('Fire', 'Fire incidents in buildings, vehicles, or forests', 'fire'),
+    ('Accident', 'Road accidents, falls, or other accidents', 'car-crash'),
+    ('Crime', 'Criminal activities requiring police assistance', 'shield-alt'),
+]
+
+
+def seed_emergency_types(apps, schema_editor):
+    """Default types, previously created on the first request form view"""
+    EmergencyType = apps.get_model('emergency', 'EmergencyType')
+    if EmergencyType.objects.exists():
+        return
+    EmergencyType.objects.bulk_create(
+        EmergencyType(name=name, description=description, icon=icon)
+        for name, description, icon in DEFAULT_TYPES
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0007_keyset_index_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_emergency_types, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0008_seed_emergency_types'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyvehicle',
+            name='driver',
+            field=models.ForeignKey(blank=True, help_text="Driver account whose device reports this vehicle's position", limit_choices_to={'role': 'vehicle_driver'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vehicles', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='VehicleTrack',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('distance_km', models.FloatField(default=0)),
+                ('points', models.BinaryField()),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='emergency.emergencyvehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vehicle', 'started_at'], name='track_vehicle_started_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0009_vehicle_telemetry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['updated_at'], name='emergency_updated_idx'),
+        ),
+    ]
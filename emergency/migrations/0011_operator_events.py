@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0010_heatmap_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperatorEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('payload', models.JSONField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+
+import emergency.models
+
+# RESPONSE_GRACE as it stood when due_at was introduced
+RESPONSE_GRACE = {
+    'critical': timedelta(0),
+    'high': timedelta(minutes=10),
+    'medium': timedelta(minutes=30),
+    'low': timedelta(minutes=60),
+}
+
+
+def fill_due_at(apps, schema_editor):
+    EmergencyRequest = apps.get_model('emergency', 'EmergencyRequest')
+
+    def due(grace):
+        return ExpressionWrapper(F('created_at') + grace, output_field=models.DateTimeField())
+
+    for priority, grace in RESPONSE_GRACE.items():
+        EmergencyRequest.objects.filter(priority=priority).update(due_at=due(grace))
+    EmergencyRequest.objects.exclude(priority__in=RESPONSE_GRACE).update(due_at=due(RESPONSE_GRACE['medium']))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0011_operator_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyrequest',
+            name='due_at',
+            field=emergency.models.DueAtField(null=True),
+        ),
+        migrations.RunPython(fill_due_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='emergencyrequest',
+            name='due_at',
+            field=emergency.models.DueAtField(),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['status', 'due_at'], name='emergency_status_due_idx'),
+        ),
+    ]
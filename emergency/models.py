@@ -1,6 +1,27 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from accounts.models import User
+from .registry import emergency_types
+from . import triage
+
+
+class DueAtField(models.DateTimeField):
+    """When an emergency falls due for triage, kept in step with its priority and ``created_at``"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['editable'] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['editable']
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        # Declared after created_at, whose auto_now_add has already been applied
+        value = triage.due_at(model_instance.priority, model_instance.created_at)
+        setattr(model_instance, self.attname, value)
+        return value
 
 class EmergencyType(models.Model):
     """Types of emergencies (fire, medical, accident, etc.)"""
@@ -58,9 +79,25 @@ class EmergencyRequest(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     assigned_at = models.DateTimeField(null=True, blank=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
+    due_at = DueAtField()
+    
+    class Meta:
+        indexes = [
+            # created_at is ascending so a backwards scan yields (created_at, id) DESC for keyset pages
+            # Operator dashboard counters and listings
+            models.Index(fields=['status', 'created_at'], name='emergency_status_created_idx'),
+            models.Index(fields=['status', 'resolved_at'], name='emergency_status_resolved_idx'),
+            # Triage order of pending emergencies, paged by (due_at, id)
+            models.Index(fields=['status', 'due_at'], name='emergency_status_due_idx'),
+            # Citizen's own requests
+            models.Index(fields=['citizen', 'created_at'], name='emergency_citizen_created_idx'),
+            # Heatmap snapshots re-read what changed since their last refresh
+            models.Index(fields=['updated_at'], name='emergency_updated_idx'),
+        ]
     
     def __str__(self):
-        return f"Emergency #{self.id} - {self.emergency_type.name} - {self.citizen.username}"
+        emergency_type = emergency_types.get(self.emergency_type_id) or self.emergency_type
+        return f"Emergency #{self.id} - {emergency_type.name} - {self.citizen.username}"
     
     def save(self, *args, **kwargs):
         # Auto-set contact number from citizen profile if not provided
@@ -73,7 +110,13 @@ class EmergencyRequest(models.Model):
         if self.status == 'resolved' and not self.resolved_at:
             self.resolved_at = timezone.now()
         
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'priority', 'created_at'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'due_at'}
+        
+        # post_save receivers (the citizen's counters) commit or roll back with the row
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
 
 class EmergencyVehicle(models.Model):
@@ -90,8 +133,19 @@ class EmergencyVehicle(models.Model):
     vehicle_number = models.CharField(max_length=20, unique=True)
     driver_name = models.CharField(max_length=100)
     driver_contact = models.CharField(max_length=15)
+    driver = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='vehicles',
+        limit_choices_to={'role': 'vehicle_driver'},
+        help_text="Driver account whose device reports this vehicle's position",
+    )
     is_available = models.BooleanField(default=True)
     current_location = models.CharField(max_length=200, blank=True)
+    location_lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    location_lng = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -101,6 +155,24 @@ class EmergencyVehicle(models.Model):
         ordering = ['vehicle_type', 'vehicle_number']
 
 
+class VehicleTrack(models.Model):
+    """A stretch of GPS pings from one vehicle, packed as (time, lat, lng) doubles"""
+    vehicle = models.ForeignKey(EmergencyVehicle, on_delete=models.CASCADE, related_name='tracks')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    distance_km = models.FloatField(default=0)
+    points = models.BinaryField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['vehicle', 'started_at'], name='track_vehicle_started_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Track of vehicle #{self.vehicle_id} from {self.started_at:%Y-%m-%d %H:%M}"
+
+
 class DispatchRecord(models.Model):
     """Records of emergency dispatches"""
     
@@ -115,5 +187,18 @@ class DispatchRecord(models.Model):
         ('completed', 'Completed'),
     ], default='assigned')
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-assigned_at'], name='dispatch_status_assigned_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Dispatch #{self.id} for Emergency #{self.emergency_request.id}"
+
+class OperatorEvent(models.Model):
+    """A change pushed to live operator dashboards; streams in every worker read past their last id"""
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    payload = models.JSONField()
+    
     def __str__(self):
-        return f"Dispatch #{self.id} for Emergency #{self.emergency_request.id}"
\ No newline at end of file
+        return f"{self.payload.get('type')} event #{self.id}"
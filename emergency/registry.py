@@ -0,0 +1,5 @@
+"""In-memory copy of the emergency type table (see ``smartcity.registry``)"""
+
+from smartcity.registry import ReferenceRegistry
+
+emergency_types = ReferenceRegistry('emergency.EmergencyType')
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from smartcity import fragments
+from .events import emergency_event, dispatch_event, publish_on_commit
+from .models import EmergencyRequest, EmergencyType, EmergencyVehicle, DispatchRecord
+from .registry import emergency_types
+from .spatial import vehicle_index
+
+
+@receiver(post_save, sender=EmergencyType)
+@receiver(post_delete, sender=EmergencyType)
+def emergency_type_changed(sender, **kwargs):
+    """Every process reloads its registry copy on the next lookup"""
+    emergency_types.invalidate()
+    fragments.bump(sender._meta.label_lower, [fragments.ALL])
+
+
+@receiver(post_save, sender=EmergencyVehicle)
+def vehicle_saved(sender, instance, **kwargs):
+    """Keep the spatial index in step with availability and position"""
+    vehicle_index.update(instance)
+    fragments.touch(instance)
+
+
+@receiver(post_delete, sender=EmergencyVehicle)
+def vehicle_deleted(sender, instance, **kwargs):
+    vehicle_index.remove(instance.id)
+    fragments.touch(instance)
+
+
+@receiver(post_save, sender=EmergencyRequest)
+def emergency_saved(sender, instance, created, **kwargs):
+    """Push the emergency to live operator dashboards"""
+    publish_on_commit(lambda: [emergency_event(instance, created=created)])
+
+
+@receiver(post_save, sender=DispatchRecord)
+def dispatch_saved(sender, instance, created, **kwargs):
+    fragments.touch(instance)
+    publish_on_commit(lambda: [dispatch_event(instance, created=created)])
+
+
+
+@receiver(post_delete, sender=DispatchRecord)
+def dispatch_deleted(sender, instance, **kwargs):
+    fragments.touch(instance)
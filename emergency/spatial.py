@@ -0,0 +1,84 @@
+"""
+In-process spatial index of available emergency vehicles.
+
+The index is loaded from the database on first use and then kept up to
+date by the ``EmergencyVehicle`` signals in ``emergency.signals``. Since
+other worker processes can also move vehicles, the whole index is rebuilt
+from scratch every ``REBUILD_INTERVAL`` seconds as a safety net.
+"""
+
+import threading
+import time
+
+from smartcity.geo import GridIndex
+
+REBUILD_INTERVAL = 30  # seconds
+AVERAGE_SPEED_KMH = 40  # used for the rough ETA shown to operators
+MAX_SEARCH_KM = 100  # vehicles further away are no use to an emergency
+
+
+class VehicleIndex:
+    """Grid of available vehicles that have coordinates"""
+
+    def __init__(self, cell_size=0.01):
+        self.grid = GridIndex(cell_size=cell_size)
+        self.lock = threading.Lock()
+        self.loaded_at = None
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > REBUILD_INTERVAL:
+            self.rebuild()
+
+    def rebuild(self):
+        """Reload every available, located vehicle from the database"""
+        from .models import EmergencyVehicle
+
+        rows = EmergencyVehicle.objects.filter(
+            is_available=True,
+            location_lat__isnull=False,
+            location_lng__isnull=False,
+        ).values_list('id', 'location_lat', 'location_lng', 'vehicle_type')
+
+        with self.lock:
+            self.grid.clear()
+            for vehicle_id, lat, lng, vehicle_type in rows:
+                self.grid.insert(vehicle_id, lat, lng, vehicle_type)
+            self.loaded_at = time.monotonic()
+
+    def update(self, vehicle):
+        """Insert, move or drop a vehicle after it was saved"""
+        if self.loaded_at is None:
+            return  # Nothing loaded yet; the first query will read fresh rows
+
+        with self.lock:
+            if vehicle.is_available and vehicle.location_lat is not None and vehicle.location_lng is not None:
+                self.grid.insert(vehicle.id, vehicle.location_lat, vehicle.location_lng, vehicle.vehicle_type)
+            else:
+                self.grid.remove(vehicle.id)
+
+    def remove(self, vehicle_id):
+        with self.lock:
+            self.grid.remove(vehicle_id)
+
+    def nearest(self, lat, lng, k=10, vehicle_type=None):
+        """
+        Return ``[(distance_km, vehicle_id), ...]`` for the ``k`` closest
+        available vehicles within ``MAX_SEARCH_KM``, optionally limited to
+        one ``vehicle_type``.
+        """
+        self._ensure_loaded()
+        predicate = None
+        if vehicle_type:
+            predicate = lambda data: data == vehicle_type  # noqa: E731
+
+        with self.lock:
+            hits = self.grid.nearest(lat, lng, k=k, predicate=predicate, max_km=MAX_SEARCH_KM)
+        return [(distance, vehicle_id) for distance, vehicle_id, _ in hits]
+
+
+vehicle_index = VehicleIndex()
+
+
+def estimate_eta_minutes(distance_km):
+    """Very rough straight-line travel time"""
+    return round(distance_km / AVERAGE_SPEED_KMH * 60)
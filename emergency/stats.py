@@ -0,0 +1,64 @@
+"""
+Operator dashboard statistics.
+
+Every counter on the dashboard comes from one query per table. The result is kept in the shared cache for a few seconds
+so that many operators refreshing during an incident surge share a single
+computation.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import EmergencyRequest, EmergencyVehicle, DispatchRecord
+
+STATS_CACHE_KEY = 'emergency:operator_stats'
+STATS_TTL = 5  # seconds
+
+ACTIVE_EMERGENCY_STATUSES = ['assigned', 'en_route', 'on_scene']
+ACTIVE_DISPATCH_STATUSES = ['assigned', 'en_route', 'on_scene']
+
+
+def count_in_one_query(queryset, **conditions):
+    """Count several filters of ``queryset`` in one conditional aggregate"""
+    return queryset.aggregate(**{
+        name: Count('pk', filter=condition) for name, condition in conditions.items()
+    })
+
+
+def compute_operator_stats():
+    """Run the three queries behind the dashboard counters"""
+    today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    # Only the open rows and today's resolved ones, read through the status indexes
+    stats = count_in_one_query(
+        EmergencyRequest.objects.filter(
+            Q(status__in=['pending', *ACTIVE_EMERGENCY_STATUSES]) | Q(status='resolved', resolved_at__gte=today_start)
+        ),
+        total_pending=Q(status='pending'),
+        active_emergencies=Q(status__in=ACTIVE_EMERGENCY_STATUSES),
+        resolved_today=Q(status='resolved', resolved_at__gte=today_start),
+    )
+    stats.update(count_in_one_query(
+        DispatchRecord.objects.filter(status__in=ACTIVE_DISPATCH_STATUSES),
+        total_active=Q(status__in=ACTIVE_DISPATCH_STATUSES),
+        on_scene=Q(status='on_scene'),
+    ))
+    stats.update(EmergencyVehicle.objects.aggregate(
+        total_vehicles=Count('id'),
+        available_vehicles=Count('id', filter=Q(is_available=True)),
+    ))
+    return stats
+
+
+def get_operator_stats():
+    """Cached snapshot of the operator dashboard counters"""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_operator_stats()
+        cache.set(STATS_CACHE_KEY, stats, STATS_TTL)
+    return stats
+
+
+def invalidate_operator_stats():
+    """Drop the snapshot after an operator action so their next view is exact"""
+    cache.delete(STATS_CACHE_KEY)
@@ -0,0 +1,257 @@
+"""
+GPS telemetry from vehicle devices.
+
+Drivers' devices post pings in batches to the ``telemetry`` view. Pings
+go into an in-process ``TelemetryBuffer`` and no database write happens
+on the request path:
+
+* each vehicle keeps its last ``RING_SIZE`` pings in a ring buffer, the
+  newest of which is its live position;
+* accepted pings are appended to a flat ``array('d')`` of
+  ``time, lat, lng`` triples waiting to be stored;
+* distance travelled is added up ping by ping, so it never needs the
+  stored track again.
+
+Every ``FLUSH_INTERVAL`` seconds (or sooner once ``FLUSH_POINTS`` pings
+are waiting) the waiting arrays become one ``VehicleTrack`` row per
+vehicle, holding the packed doubles (24 bytes a ping). That write and the
+update of every moved vehicle's position are one ``bulk_create`` and one
+``bulk_update``, however many pings arrived. A background thread flushes
+when no new pings come in to do it, and the process flushes on exit. If
+the write fails the pings wait for the next flush, up to
+``MAX_WAITING_POINTS``.
+
+Pings must be finite and timed between ``MAX_PING_AGE`` seconds ago and
+``MAX_CLOCK_SKEW`` seconds from now, so one bad device clock can't make
+every later ping look out of order.
+
+The buffer belongs to the process. Pings accepted but not yet flushed are
+lost if it is killed, at most ``FLUSH_INTERVAL`` seconds' worth.
+"""
+
+import atexit
+import logging
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from smartcity.geo import haversine_km
+
+RING_SIZE = 120  # recent pings kept per vehicle
+FLUSH_INTERVAL = 10  # seconds
+FLUSH_POINTS = 50_000  # waiting pings that trigger an early flush
+MAX_SPEED_KMH = 250  # a faster implied hop is a GPS glitch
+MAX_PINGS_PER_REQUEST = 1000
+MAX_PING_AGE = 6 * 3600  # seconds; devices send what they saved while offline
+MAX_CLOCK_SKEW = 300  # seconds a device clock may run ahead
+MAX_WAITING_POINTS = 10 * FLUSH_POINTS  # kept while the database is unreachable
+
+logger = logging.getLogger(__name__)
+
+
+def pack(points):
+    """Flat ``array('d')`` of ``time, lat, lng`` triples to bytes (little-endian)"""
+    if sys.byteorder == 'big':
+        points = array('d', points)
+        points.byteswap()
+    return points.tobytes()
+
+
+def unpack(data):
+    """``[(time, lat, lng), ...]`` from bytes made by ``pack``"""
+    points = array('d')
+    points.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        points.byteswap()
+    return list(zip(points[0::3], points[1::3], points[2::3]))
+
+
+def _as_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+class VehicleTrace:
+    """What the buffer knows about one vehicle"""
+
+    __slots__ = ('recent', 'waiting', 'waiting_km')
+
+    def __init__(self):
+        self.recent = deque(maxlen=RING_SIZE)  # (time, lat, lng), newest last
+        self.waiting = array('d')
+        self.waiting_km = 0.0
+
+
+class TelemetryBuffer:
+    """Live positions and unsaved tracks of every vehicle reporting to this process"""
+
+    def __init__(self):
+        self.vehicles = {}
+        self.waiting_points = 0
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flusher = None
+
+    def _ensure_flusher(self):
+        """Start the thread that flushes idle buffers (again after a fork, which doesn't copy threads)"""
+        if self.flusher is None or not self.flusher.is_alive():
+            if self.flusher is None:
+                atexit.register(self.flush)
+            self.flusher = threading.Thread(target=self._flush_periodically, name='telemetry-flush', daemon=True)
+            self.flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self.waiting_points and time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+                try:
+                    self.flush()
+                finally:
+                    connection.close()  # This thread's own connection
+
+    def ingest(self, vehicle_id, pings):
+        """
+        Add ``(unix time, lat, lng)`` pings from one vehicle and return how
+        many were accepted. Pings out of range or out of time, not newer
+        than the last accepted one or implying an impossible speed are
+        dropped.
+        """
+        accepted = 0
+        now = time.time()
+        with self.lock:
+            self._ensure_flusher()
+            trace = self.vehicles.get(vehicle_id)
+            if trace is None:
+                trace = self.vehicles[vehicle_id] = VehicleTrace()
+            last = trace.recent[-1] if trace.recent else None
+            for timestamp, lat, lng in sorted(pings):
+                if not all(map(math.isfinite, (timestamp, lat, lng))):
+                    continue
+                if not (now - MAX_PING_AGE <= timestamp <= now + MAX_CLOCK_SKEW):
+                    continue
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                    continue
+                if last is not None:
+                    if timestamp <= last[0]:
+                        continue
+                    km = haversine_km(last[1], last[2], lat, lng)
+                    if km / (timestamp - last[0]) * 3600 > MAX_SPEED_KMH:
+                        continue
+                    trace.waiting_km += km
+                last = (timestamp, lat, lng)
+                trace.recent.append(last)
+                trace.waiting.extend(last)
+                accepted += 1
+            self.waiting_points += accepted
+            due = self.waiting_points >= FLUSH_POINTS or time.monotonic() - self.flushed_at > FLUSH_INTERVAL
+        if due:
+            self.flush()
+        return accepted
+
+    def latest(self, vehicle_id):
+        """Newest ``(unix time, lat, lng)`` of a vehicle, or None"""
+        with self.lock:
+            trace = self.vehicles.get(vehicle_id)
+            return trace.recent[-1] if trace and trace.recent else None
+
+    def recent(self, vehicle_id):
+        with self.lock:
+            trace = self.vehicles.get(vehicle_id)
+            return list(trace.recent) if trace else []
+
+    def unsaved_km(self, vehicle_id):
+        """Distance covered by pings that are not stored yet"""
+        with self.lock:
+            trace = self.vehicles.get(vehicle_id)
+            return trace.waiting_km if trace else 0.0
+
+    def flush(self):
+        """Store every waiting ping; returns how many were written"""
+        if not self.flush_lock.acquire(blocking=False):
+            return 0  # Another thread is already at it
+        try:
+            with self.lock:
+                batch = {}
+                for vehicle_id, trace in self.vehicles.items():
+                    if trace.waiting:
+                        batch[vehicle_id] = (trace.waiting, trace.waiting_km)
+                        trace.waiting, trace.waiting_km = array('d'), 0.0
+                self.waiting_points = 0
+                self.flushed_at = time.monotonic()
+            if batch:
+                try:
+                    write_tracks(batch)
+                except DatabaseError:
+                    logger.exception('Could not store telemetry; keeping it for the next flush')
+                    self._put_back(batch)
+                    return 0
+            return sum(len(points) // 3 for points, _ in batch.values())
+        finally:
+            self.flush_lock.release()
+
+    def _put_back(self, batch):
+        """Return a batch that couldn't be written in front of the pings that arrived since"""
+        with self.lock:
+            for vehicle_id, (points, km) in batch.items():
+                count = len(points) // 3
+                if self.waiting_points + count > MAX_WAITING_POINTS:
+                    continue  # The oldest pings go first when the database stays away
+                trace = self.vehicles.get(vehicle_id)
+                if trace is None:
+                    trace = self.vehicles[vehicle_id] = VehicleTrace()
+                points.extend(trace.waiting)
+                trace.waiting, trace.waiting_km = points, trace.waiting_km + km
+                self.waiting_points += count
+
+    def reset(self):
+        with self.lock:
+            self.vehicles = {}
+            self.waiting_points = 0
+            self.flushed_at = time.monotonic()
+
+
+def write_tracks(batch):
+    """
+    Store ``{vehicle_id: (points, km)}`` as one track row per vehicle and
+    move each vehicle to its last point.
+    """
+    from smartcity import fragments
+    from .models import EmergencyVehicle, VehicleTrack
+    from .spatial import vehicle_index
+
+    now = timezone.now()
+    with transaction.atomic():
+        vehicles = EmergencyVehicle.objects.in_bulk(batch)  # Deleted vehicles' pings are dropped
+        VehicleTrack.objects.bulk_create(
+            VehicleTrack(
+                vehicle_id=vehicle_id, started_at=_as_datetime(points[0]), ended_at=_as_datetime(points[-3]),
+                point_count=len(points) // 3, distance_km=km, points=pack(points),
+            )
+            for vehicle_id, (points, km) in batch.items() if vehicle_id in vehicles
+        )
+        for vehicle_id, vehicle in vehicles.items():
+            points = batch[vehicle_id][0]
+            vehicle.location_lat = Decimal(f'{points[-2]:.6f}')
+            vehicle.location_lng = Decimal(f'{points[-1]:.6f}')
+            vehicle.last_updated = now
+        EmergencyVehicle.objects.bulk_update(
+            vehicles.values(), ['location_lat', 'location_lng', 'last_updated'], batch_size=500,
+        )
+        # bulk_update sends no signals
+        fragments.bump(EmergencyVehicle._meta.label_lower, list(vehicles))
+        transaction.on_commit(lambda: _reindex(vehicle_index, vehicles.values()))
+
+
+def _reindex(index, vehicles):
+    for vehicle in vehicles:
+        index.update(vehicle)
+
+
+telemetry_buffer = TelemetryBuffer()
@@ -1,3 +1,826 @@
-from django.test import TestCase
+import json
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from accounts.models import User
+from dashboard.models import CitizenCounter
+from smartcity import fragments
+from smartcity.benchmarking import simulate_table_stats, full_scans
+from smartcity.geo import GridIndex, haversine_km
+from smartcity.testing import in_another_process
+from . import events
+from .dispatch import VehicleUnavailable, dispatch_vehicle, dispatch_vehicles
+from .models import EmergencyRequest, EmergencyType, EmergencyVehicle, DispatchRecord, OperatorEvent, VehicleTrack
+from .telemetry import telemetry_buffer, unpack
+from .spatial import vehicle_index
+from .stats import invalidate_operator_stats
+
+
+class OperatorDashboardTests(TestCase):
+    """Pin the query count of the operator dashboard"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+        cls.medical = EmergencyType.objects.create(name='Medical', description='Medical', icon='heartbeat')
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):  # Caches the user the way a real login does
+            self.client.force_login(self.operator)
+
+    def create_emergencies(self, count, **kwargs):
+        for i in range(count):
+            EmergencyRequest.objects.create(
+                citizen=self.citizen,
+                emergency_type=self.fire if i % 2 else self.medical,
+                address=f'{i} Main Street',
+                description='Help',
+                contact_number='5550100',
+                **kwargs,
+            )
+
+    def create_dispatches(self, count):
+        start = EmergencyVehicle.objects.count()
+        for i in range(start, start + count):
+            vehicle = EmergencyVehicle.objects.create(
+                vehicle_type='ambulance',
+                vehicle_number=f'AMB-{i:03d}',
+                driver_name='Driver',
+                driver_contact='5550100',
+                is_available=False,
+            )
+            emergency = EmergencyRequest.objects.create(
+                citizen=self.citizen,
+                emergency_type=self.fire,
+                status='assigned',
+                address='Dispatch Street',
+                description='Help',
+                contact_number='5550100',
+            )
+            DispatchRecord.objects.create(emergency_request=emergency, vehicle=vehicle, assigned_by=self.operator)
+
+    def test_query_count_is_constant(self):
+        # Event cursor + 3 aggregates + pending page keys + its rows + active dispatch ids + their rows;
+        # session and user come from the cache
+        self.create_emergencies(3)
+        self.create_dispatches(2)
+        with self.assertNumQueries(8):
+            response = self.client.get('/emergency/operator/')
+        self.assertEqual(response.status_code, 200)
+
+        invalidate_operator_stats()
+        self.create_emergencies(20)
+        self.create_dispatches(10)
+        with self.assertNumQueries(8):
+            self.client.get('/emergency/operator/')
+
+    def test_stats_snapshot_is_shared(self):
+        self.create_emergencies(4)
+        self.client.get('/emergency/operator/')
+        # Counters come from the cached snapshot and rows from the fragment cache on the next refresh
+        with self.assertNumQueries(3):  # event cursor + pending page keys + active dispatch ids
+            response = self.client.get('/emergency/operator/')
+        self.assertEqual(response.context['total_pending'], 4)
+        self.assertEqual(response.context['active_emergencies'], 0)
+
+    def test_changed_rows_are_rendered_again(self):
+        self.create_dispatches(1)
+        self.create_emergencies(1)
+        self.client.get('/emergency/operator/')
+
+        dispatch = DispatchRecord.objects.get()
+        dispatch.status = 'on_scene'
+        dispatch.save()
+        vehicle = dispatch.vehicle
+        vehicle.vehicle_number = 'AMB-RENAMED'
+        vehicle.save()
+        response = self.client.get('/emergency/operator/')
+        self.assertContains(response, 'AMB-RENAMED')
+        self.assertContains(response, '<span class="badge bg-warning">On Scene</span>', html=True)
+
+        # Batch dispatch takes the emergency off the list without a signal
+        emergency = EmergencyRequest.objects.get(status='pending')
+        spare = EmergencyVehicle.objects.create(
+            vehicle_type='ambulance', vehicle_number='AMB-SPARE', driver_name='Driver', driver_contact='5550100',
+        )
+        dispatch_vehicle(emergency.pk, spare.pk, self.operator)
+        response = self.client.get('/emergency/operator/')
+        self.assertNotContains(response, f'id="emergency-row-{emergency.pk}"')
+        self.assertContains(response, 'AMB-SPARE')
+
+    def test_counters(self):
+        self.create_emergencies(3)
+        self.create_emergencies(1, status='resolved')
+        self.create_dispatches(2)
+        EmergencyVehicle.objects.create(
+            vehicle_type='fire_truck', vehicle_number='FIRE-001',
+            driver_name='Driver', driver_contact='5550100',
+        )
+        response = self.client.get('/emergency/operator/')
+        self.assertEqual(response.context['total_pending'], 3)
+        self.assertEqual(response.context['active_emergencies'], 2)
+        self.assertEqual(response.context['resolved_today'], 1)
+        self.assertEqual(response.context['total_active'], 2)
+        self.assertEqual(response.context['total_vehicles'], 3)
+        self.assertEqual(response.context['available_vehicles'], 1)
+
+
+class DispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.operator)
+
+    def emergency(self, status='pending'):
+        return EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, status=status,
+            address='Main Street', description='Help', contact_number='5550100',
+        )
+
+    def vehicle(self, number):
+        return EmergencyVehicle.objects.create(
+            vehicle_type='fire_truck', vehicle_number=number, driver_name='Driver', driver_contact='5550100',
+        )
+
+    def test_dispatch_claims_vehicle(self):
+        emergency, vehicle = self.emergency(), self.vehicle('FIRE-001')
+        dispatch = dispatch_vehicle(emergency.pk, vehicle.pk, self.operator)
+        emergency.refresh_from_db()
+        vehicle.refresh_from_db()
+        self.assertEqual((dispatch.emergency_request_id, dispatch.vehicle_id), (emergency.pk, vehicle.pk))
+        self.assertEqual(emergency.status, 'assigned')
+        self.assertIsNotNone(emergency.assigned_at)
+        self.assertFalse(vehicle.is_available)
+
+    def test_vehicle_is_dispatched_once(self):
+        vehicle = self.vehicle('FIRE-001')
+        dispatch_vehicle(self.emergency().pk, vehicle.pk, self.operator)
+        with self.assertRaises(VehicleUnavailable):
+            dispatch_vehicle(self.emergency().pk, vehicle.pk, self.operator)
+        self.assertEqual(DispatchRecord.objects.count(), 1)
+
+    def test_batch_refuses_only_conflicting_pairs(self):
+        first, second, closed = self.emergency(), self.emergency(), self.emergency('resolved')
+        one, two = self.vehicle('FIRE-001'), self.vehicle('FIRE-002')
+        dispatches, errors = dispatch_vehicles(
+            [(first.pk, one.pk), (second.pk, one.pk), (second.pk, two.pk), (closed.pk, two.pk)], self.operator,
+        )
+        self.assertEqual([(d.emergency_request_id, d.vehicle_id) for d in dispatches], [(first.pk, one.pk), (second.pk, two.pk)])
+        self.assertEqual(set(errors), {1, 3})
+
+    def test_ids_must_be_whole_numbers(self):
+        emergency, vehicle = self.emergency(), self.vehicle('FIRE-001')
+        dispatches, errors = dispatch_vehicles(
+            [(emergency.pk + 0.7, vehicle.pk), (float(emergency.pk), vehicle.pk), (f' {emergency.pk}', vehicle.pk),
+             (str(emergency.pk), str(vehicle.pk))],
+            self.operator,
+        )
+        self.assertEqual(set(errors), {0, 1, 2})
+        self.assertEqual([(d.emergency_request_id, d.vehicle_id) for d in dispatches], [(emergency.pk, vehicle.pk)])
+
+    def test_batch_is_a_fixed_number_of_queries(self):
+        pairs = [(self.emergency().pk, self.vehicle(f'FIRE-{i:03d}').pk) for i in range(21)]
+        dispatch_vehicles(pairs[:1], self.operator)  # Creates the rollup rows
+        counts = []
+        for batch in (pairs[1:6], pairs[6:]):
+            with CaptureQueriesContext(connection) as queries:
+                dispatches, _ = dispatch_vehicles(batch, self.operator)
+            self.assertEqual(len(dispatches), len(batch))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_assign_view_reports_conflict(self):
+        vehicle = self.vehicle('FIRE-001')
+        dispatch_vehicle(self.emergency().pk, vehicle.pk, self.operator)
+        emergency = self.emergency()
+        response = self.client.post(f'/emergency/assign/{emergency.pk}/', {'vehicle_id': vehicle.pk}, follow=True)
+        self.assertContains(response, 'has already been dispatched')
+        emergency.refresh_from_db()
+        self.assertEqual(emergency.status, 'pending')
+
+    def test_batch_endpoint(self):
+        emergency, vehicle = self.emergency(), self.vehicle('FIRE-001')
+        response = self.client.post(
+            '/emergency/dispatch/batch/',
+            json.dumps({'assignments': [
+                {'emergency_id': emergency.pk, 'vehicle_id': vehicle.pk},
+                {'emergency_id': emergency.pk, 'vehicle_id': vehicle.pk},
+            ]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['dispatched']), 1)
+        self.assertEqual([item['index'] for item in response.json()['rejected']], [1])
+
+        # Ids that aren't ids are refused one by one, not with a server error
+        bad = [[1], {'id': 1}, 'one', True, 0, 10 ** 30, None, float('inf'), 2.7, '2.7', '-1', '\u0661']
+        response = self.client.post(
+            '/emergency/dispatch/batch/',
+            json.dumps({'assignments': [{'emergency_id': value, 'vehicle_id': vehicle.pk} for value in bad]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 409)
+        rejected = response.json()['rejected']
+        self.assertEqual([item['index'] for item in rejected], list(range(len(bad))))
+        self.assertEqual(rejected[1]['emergency_id'], {'id': 1})
+        self.assertEqual(rejected[0]['error'], 'Pick an emergency and a vehicle.')
+
+        self.client.force_login(self.citizen)
+        response = self.client.post('/emergency/dispatch/batch/', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class OperatorEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.operator)
+
+    def emergency(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return EmergencyRequest.objects.create(
+                citizen=self.citizen, emergency_type=self.fire, address='Main Street',
+                description='Help', contact_number='5550100', **kwargs,
+            )
+
+    def test_nothing_is_logged_without_open_dashboards(self):
+        self.emergency()
+        self.assertFalse(OperatorEvent.objects.exists())
+
+    def test_events_are_built_only_for_open_dashboards(self):
+        with mock.patch('emergency.signals.emergency_event') as emergency_event:
+            self.emergency()
+            emergency_event.assert_not_called()
+            events.listen()
+            self.emergency()
+            emergency_event.assert_called_once()
+
+    def test_unknown_type_still_saves_and_publishes(self):
+        events.listen()
+        with mock.patch.object(events.emergency_types, 'get', return_value=None):
+            emergency = self.emergency()
+        self.assertTrue(EmergencyRequest.objects.filter(pk=emergency.pk).exists())
+        [(_, event)] = events.read(0)
+        self.assertEqual(event['emergency_type'], f'Type #{self.fire.pk}')
+
+    def test_changes_reach_dashboards_of_other_workers(self):
+        # A dashboard open in another worker makes this one log its changes
+        in_another_process(events.listen)
+        emergency = self.emergency(priority='critical')
+        emergency.status = 'assigned'
+        with self.captureOnCommitCallbacks(execute=True):
+            emergency.save()
+        found = events.read(0)
+        self.assertEqual([(event['type'], event['id'], event['status']) for _, event in found], [
+            ('emergency', emergency.pk, 'pending'), ('emergency', emergency.pk, 'assigned'),
+        ])
+        self.assertTrue(found[0][1]['created'])
+        self.assertEqual(events.read(found[0][0]), found[1:])
+        self.assertEqual(events.cursor(), found[-1][0])
+
+    def test_events_are_rolled_back_with_their_change(self):
+        events.listen()
+        with self.captureOnCommitCallbacks(execute=False):
+            EmergencyRequest.objects.create(
+                citizen=self.citizen, emergency_type=self.fire, address='Main Street',
+                description='Help', contact_number='5550100',
+            )
+        self.assertFalse(OperatorEvent.objects.exists())
+
+    def test_old_events_are_pruned(self):
+        events.listen()
+        OperatorEvent.objects.create(payload={'type': 'emergency'})
+        OperatorEvent.objects.update(created_at=timezone.now() - events.RETENTION - timedelta(minutes=1))
+        fresh = [{'type': 'dispatch', 'id': i} for i in range(events.PRUNE_EVERY)]
+        events.publish(*fresh)
+        self.assertEqual([event for _, event in events.read(0)], fresh)
+
+    def test_poll_returns_events_after_the_cursor(self):
+        response = self.client.get('/emergency/operator/')
+        cursor = response.context['event_cursor']
+        self.assertFalse(response.context['live_stream'])
+        emergency = self.emergency()
+
+        # Served over WSGI, a request for a stream still gets one JSON batch
+        response = self.client.get(f'/emergency/operator/events/?after={cursor}', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual([event['id'] for event in data['events']], [emergency.pk])
+        self.assertEqual(data['stats']['total_pending'], 1)
+
+        data = self.client.get(f"/emergency/operator/events/?after={data['cursor']}").json()
+        self.assertEqual(data['events'], [])
+        self.assertGreater(data['cursor'], cursor)
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/emergency/operator/events/?after=x').status_code, 400)
+        self.client.force_login(self.citizen)
+        self.assertEqual(self.client.get('/emergency/operator/events/').status_code, 403)
+
+    async def test_stream_under_asgi(self):
+        await self.async_client.aforce_login(self.operator)
+        await sync_to_async(events.listen)()
+        emergency = await sync_to_async(self.emergency)()
+        response = await self.async_client.get('/emergency/operator/events/?after=0', headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+            first = (await anext(stream)).decode()
+            event_id = (await sync_to_async(events.cursor)())
+            self.assertTrue(first.startswith(f'id: {event_id}\nevent: emergency\n'))
+            self.assertEqual(json.loads(first.split('data: ')[1])['id'], emergency.pk)
+            self.assertTrue((await anext(stream)).startswith(b'event: stats\n'))
+        finally:
+            await stream.aclose()
+
+
+class GridIndexTests(SimpleTestCase):
+
+    def test_nearest_and_within(self):
+        grid = GridIndex()
+        for key, (lat, lng) in enumerate([(17.40, 78.40), (17.41, 78.40), (17.45, 78.40), (17.60, 78.40)]):
+            grid.insert(key, lat, lng, 'odd' if key % 2 else 'even')
+        self.assertEqual([key for _, key, _ in grid.nearest(17.40, 78.40, k=3)], [0, 1, 2])
+        self.assertEqual([key for _, key, _ in grid.nearest(17.40, 78.40, predicate=lambda data: data == 'odd')], [1, 3])
+        self.assertEqual([key for _, key, _ in grid.nearest(17.40, 78.40, max_km=10)], [0, 1, 2])
+        self.assertEqual([key for _, key, _ in grid.within(17.40, 78.40, 2)], [0, 1])
+        distance, _, _ = grid.nearest(17.40, 78.40, k=2)[1]
+        self.assertAlmostEqual(distance, haversine_km(17.40, 78.40, 17.41, 78.40))
+
+        grid.insert(0, 17.60, 78.41)  # Moved
+        self.assertEqual([key for _, key, _ in grid.nearest(17.40, 78.40, k=1)], [1])
+        grid.remove(1)
+        self.assertNotIn(1, grid)
+        self.assertEqual(len(grid), 3)
+
+    def test_far_and_sparse_points_are_found_quickly(self):
+        grid = GridIndex()
+        grid.insert('far', 0.5, 0.5)
+        started = time.perf_counter()
+        self.assertEqual([key for _, key, _ in grid.nearest(89, 179)], ['far'])
+        self.assertEqual(grid.nearest(89, 179, max_km=100), [])
+        self.assertEqual(grid.within(89, 179, 20000)[0][1], 'far')
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+    def test_bounds_shrink_when_edge_points_leave(self):
+        grid = GridIndex()
+        home = grid._cell(17.405, 78.405)
+        grid.insert('home', 17.405, 78.405)
+        grid.insert('away', 60.0, 120.0)
+        grid.nearest(17.405, 78.405)
+        grid.remove('away')
+        self.assertEqual(grid._max_ring(*home), 0)
+        grid.insert('away', 60.0, 120.0)
+        grid.insert('away', 17.415, 78.405)  # Moved back next door
+        self.assertEqual(grid._max_ring(*home), 1)
+
+
+class AssignVehicleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+        cls.emergency = EmergencyRequest.objects.create(
+            citizen=cls.citizen, emergency_type=cls.fire, address='Main Street', description='Help',
+            contact_number='5550100', location_lat=Decimal('17.400000'), location_lng=Decimal('78.400000'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.operator)
+
+    def vehicle(self, number, vehicle_type='ambulance', lat=None, lng=78.4, **kwargs):
+        return EmergencyVehicle.objects.create(
+            vehicle_type=vehicle_type, vehicle_number=number, driver_name='Driver', driver_contact='5550100',
+            location_lat=lat and Decimal(str(lat)), location_lng=lat and Decimal(str(lng)), **kwargs,
+        )
+
+    def test_available_vehicles_are_ranked_by_distance(self):
+        self.vehicle('AMB-FAR', lat=17.5)
+        self.vehicle('FIRE-NEAR', 'fire_truck', lat=17.41)
+        self.vehicle('AMB-NEAR', lat=17.402)
+        self.vehicle('AMB-BUSY', lat=17.4, is_available=False)
+        self.vehicle('AMB-ELSEWHERE', lat=19.0)  # Beyond the search radius
+        self.vehicle('AMB-UNLOCATED')
+        vehicle_index.rebuild()
+
+        url = f'/emergency/assign/{self.emergency.pk}/'
+        vehicles = self.client.get(url).context['available_vehicles']
+        self.assertEqual(
+            [vehicle.vehicle_number for vehicle in vehicles],
+            ['AMB-NEAR', 'FIRE-NEAR', 'AMB-FAR', 'AMB-UNLOCATED'],
+        )
+        self.assertEqual(vehicles[0].distance_km, 0.22)
+        self.assertEqual(vehicles[2].eta_minutes, 17)
+
+        vehicles = self.client.get(url, {'vehicle_type': 'ambulance'}).context['available_vehicles']
+        self.assertEqual([vehicle.vehicle_number for vehicle in vehicles], ['AMB-NEAR', 'AMB-FAR', 'AMB-UNLOCATED'])
+
+
+class TriageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.operator)
+
+    def emergency(self, priority, minutes_ago=0):
+        emergency = EmergencyRequest.objects.create(
+            citizen=self.citizen, emergency_type=self.fire, priority=priority,
+            address='Main Street', description='Help', contact_number='5550100',
+        )
+        if minutes_ago:
+            emergency.created_at = timezone.now() - timedelta(minutes=minutes_ago)
+            emergency.save()
+        return emergency
+
+    def ranked(self, n=10):
+        response = self.client.get('/emergency/operator/triage/', {'limit': n})
+        return [e['id'] for e in response.json()['emergencies']]
+
+    def test_priority_and_waiting_time(self):
+        medium = self.emergency('medium', minutes_ago=5)
+        high = self.emergency('high')
+        critical = self.emergency('critical')
+        waited = self.emergency('low', minutes_ago=120)  # Long past its grace period
+        self.assertEqual(self.ranked(), [waited.pk, critical.pk, high.pk, medium.pk])
+        self.assertEqual(self.ranked(2), [waited.pk, critical.pk])
+
+    def test_follows_status_and_priority_changes(self):
+        low, medium = self.emergency('low'), self.emergency('medium')
+        low.priority = 'critical'
+        low.save(update_fields=['priority'])
+        self.assertEqual(self.ranked(), [low.pk, medium.pk])
+        low.status = 'assigned'
+        low.save()
+        medium.delete()
+        self.assertEqual(self.ranked(), [])
+
+    def test_sees_rows_written_without_signals(self):
+        # Another process's writes are in the table, not in this one's memory
+        EmergencyRequest.objects.bulk_create([
+            EmergencyRequest(
+                citizen=self.citizen, emergency_type=self.fire, priority=priority,
+                address='Main Street', description='Help', contact_number='5550100',
+            )
+            for priority in ['low', 'critical']
+        ])
+        low, critical = EmergencyRequest.objects.order_by('pk')
+        self.assertEqual(self.ranked(), [critical.pk, low.pk])
+
+    def test_pages_past_the_first(self):
+        emergencies = [self.emergency('medium', minutes_ago=minutes) for minutes in (50, 40, 30, 20, 10)]
+        first = self.client.get('/emergency/operator/triage/?limit=2').json()
+        self.assertEqual([e['id'] for e in first['emergencies']], [e.pk for e in emergencies[:2]])
+        self.assertEqual(first['pending'], 5)
+        second = self.client.get('/emergency/operator/triage/' + first['next']).json()
+        self.assertEqual([e['id'] for e in second['emergencies']], [e.pk for e in emergencies[2:4]])
+        third = self.client.get('/emergency/operator/triage/' + second['next']).json()
+        self.assertEqual([e['id'] for e in third['emergencies']], [emergencies[4].pk])
+        self.assertIsNone(third['next'])
+        back = self.client.get('/emergency/operator/triage/' + third['previous']).json()
+        self.assertEqual([e['id'] for e in back['emergencies']], [e.pk for e in emergencies[2:4]])
+
+    def test_dashboard_and_api_list_in_triage_order(self):
+        medium, critical = self.emergency('medium'), self.emergency('critical')
+        response = self.client.get('/emergency/operator/')
+        rows = [int(re.search(r'emergency-row-(\d+)', row)[1]) for row in response.context['pending_rows']]
+        self.assertEqual(rows, [critical.pk, medium.pk])
+
+        response = self.client.get('/emergency/operator/triage/?limit=1')
+        self.assertEqual(response.json()['pending'], 2)
+        self.assertEqual([e['id'] for e in response.json()['emergencies']], [critical.pk])
+
+        self.client.force_login(self.citizen)
+        self.assertEqual(self.client.get('/emergency/operator/triage/').status_code, 403)
+
+    def test_dashboard_pages_past_the_first(self):
+        emergencies = [self.emergency('medium', minutes_ago=minutes) for minutes in range(30, 0, -1)]
+        response = self.client.get('/emergency/operator/')
+        self.assertEqual(len(response.context['pending_rows']), 25)
+        self.assertTrue(response.context['pending'].has_next)
+        response = self.client.get(f"/emergency/operator/?{response.context['pending'].next_query}")
+        rows = [int(re.search(r'emergency-row-(\d+)', row)[1]) for row in response.context['pending_rows']]
+        self.assertEqual(rows, [e.pk for e in emergencies[25:]])
+
+    def test_dispatch_takes_emergency_off_the_queue(self):
+        emergency = self.emergency('high')
+        vehicle = EmergencyVehicle.objects.create(
+            vehicle_type='ambulance', vehicle_number='AMB-001', driver_name='Driver', driver_contact='5550100',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch_vehicle(emergency.pk, vehicle.pk, self.operator)
+        self.assertEqual(self.ranked(), [])
+
+
+class TelemetryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.driver = User.objects.create_user('driver', password='pass1234', role='vehicle_driver')
+        cls.vehicle = EmergencyVehicle.objects.create(
+            vehicle_type='ambulance', vehicle_number='AMB-001', driver_name='Driver',
+            driver_contact='5550100', driver=cls.driver,
+        )
+
+    def setUp(self):
+        telemetry_buffer.reset()
+        self.addCleanup(telemetry_buffer.reset)  # Nothing left for the background flush
+        self.client.force_login(self.driver)
+        self.start = timezone.now().timestamp() - 60
+
+    def post(self, pings):
+        return self.client.post(
+            '/emergency/vehicles/telemetry/', json.dumps({'pings': pings}), content_type='application/json',
+        )
+
+    def test_distance_is_added_up_per_ping(self):
+        # 0.001 degrees of latitude is ~111 m; one every 5 seconds is ~80 km/h
+        pings = [(self.start + 5 * i, 12.97 + 0.001 * i, 77.59) for i in range(11)]
+        self.assertEqual(telemetry_buffer.ingest(self.vehicle.pk, pings[:6]), 6)
+        self.assertEqual(telemetry_buffer.ingest(self.vehicle.pk, pings[6:]), 5)
+        self.assertAlmostEqual(telemetry_buffer.unsaved_km(self.vehicle.pk), 1.112, places=2)
+        self.assertEqual(telemetry_buffer.latest(self.vehicle.pk), pings[-1])
+
+    def test_glitches_are_dropped(self):
+        telemetry_buffer.ingest(self.vehicle.pk, [(self.start, 12.97, 77.59)])
+        accepted = telemetry_buffer.ingest(self.vehicle.pk, [
+            (self.start - 1, 12.97, 77.59),  # Older than what we have
+            (self.start + 1, 13.50, 77.59),  # ~60 km in a second
+            (self.start + 2, 95.00, 77.59),  # Not a latitude
+            (self.start + 3, 12.9701, 77.59),
+        ])
+        self.assertEqual(accepted, 1)
+        self.assertEqual(len(telemetry_buffer.recent(self.vehicle.pk)), 2)
+
+    def test_pings_out_of_time_are_dropped(self):
+        accepted = telemetry_buffer.ingest(self.vehicle.pk, [
+            (self.start * 1000, 12.97, 77.59),  # Milliseconds
+            (self.start + 86400, 12.97, 77.59),  # Tomorrow
+            (self.start - 86400, 12.97, 77.59),  # Yesterday
+            (float('nan'), 12.97, 77.59),
+            (self.start, float('inf'), 77.59),
+        ])
+        self.assertEqual(accepted, 0)
+        # None of them stops the good pings that follow
+        self.assertEqual(telemetry_buffer.ingest(self.vehicle.pk, [(self.start, 12.97, 77.59)]), 1)
+        self.assertTrue(telemetry_buffer.flusher.is_alive())
+
+    def test_failed_writes_are_kept_for_the_next_flush(self):
+        telemetry_buffer.ingest(self.vehicle.pk, [(self.start + i, 12.97 + 0.0001 * i, 77.59) for i in range(10)])
+        with mock.patch('emergency.telemetry.write_tracks', side_effect=DatabaseError), self.assertLogs('emergency.telemetry'):
+            self.assertEqual(telemetry_buffer.flush(), 0)
+        telemetry_buffer.ingest(self.vehicle.pk, [(self.start + 10, 12.971, 77.59)])
+        self.assertAlmostEqual(telemetry_buffer.unsaved_km(self.vehicle.pk), 0.111, places=2)
+        self.assertEqual(telemetry_buffer.flush(), 11)
+        self.assertEqual(VehicleTrack.objects.get().point_count, 11)
+
+    def test_flush_stores_packed_tracks_and_moves_vehicles(self):
+        pings = [(self.start + i, 12.97 + 0.0001 * i, 77.59) for i in range(20)]
+        telemetry_buffer.ingest(self.vehicle.pk, pings)
+        version_key = fragments.version_key('emergency.emergencyvehicle', self.vehicle.pk)
+        version = cache.get(version_key)
+        with self.assertNumQueries(5):  # savepoint, vehicles, tracks, positions, release
+            self.assertEqual(telemetry_buffer.flush(), 20)
+        # Rows showing the vehicle's position are rendered again
+        self.assertNotEqual(cache.get(version_key), version)
+
+        track = VehicleTrack.objects.get()
+        self.assertEqual((track.point_count, len(bytes(track.points))), (20, 20 * 24))
+        self.assertEqual(unpack(track.points), pings)
+        self.assertAlmostEqual(track.distance_km, 0.211, places=2)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(float(self.vehicle.location_lat), round(pings[-1][1], 6))
+        self.assertEqual(telemetry_buffer.unsaved_km(self.vehicle.pk), 0)
+
+    def test_endpoint_and_driver_dashboard(self):
+        response = self.post([[self.start + 5 * i, 12.97 + 0.001 * i, 77.59] for i in range(10)])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'accepted': 10, 'rejected': 0})
+        telemetry_buffer.flush()
+        self.post([[self.start + 50, 12.98, 77.59]])
+
+        response = self.client.get('/dashboard/driver/')
+        self.assertEqual(response.context['total_distance'], '1.1 km')
+        self.assertContains(response, 'AMB-001')
+
+        self.assertEqual(self.post('not a list').status_code, 400)
+        response = self.client.post(
+            '/emergency/vehicles/telemetry/', '{"pings": [[NaN, 12.97, 77.59]]}', content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post([[10 ** 400, 12.97, 77.59]]).status_code, 400)
+        self.client.force_login(User.objects.create_user('other', password='pass1234', role='vehicle_driver'))
+        self.assertEqual(self.post([]).status_code, 409)
+
+
+class DispatchConcurrencyTests(TransactionTestCase):
+    """Parallel operators racing for the same vehicles never double-book one"""
+
+    WORKERS = 6
+    VEHICLES = 30
+
+    def setUp(self):
+        cache.clear()
+        self.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+        self.vehicles = [
+            EmergencyVehicle.objects.create(
+                vehicle_type='fire_truck', vehicle_number=f'FIRE-{i:03d}', driver_name='Driver', driver_contact='5550100',
+            ).pk
+            for i in range(self.VEHICLES)
+        ]
+        # Twice as many emergencies as vehicles, so every vehicle is wanted twice
+        self.emergencies = [
+            EmergencyRequest.objects.create(
+                citizen=citizen, emergency_type=fire, address='Main Street', description='Help', contact_number='5550100',
+            ).pk
+            for _ in range(self.VEHICLES * 2)
+        ]
+
+    def race(self, operate):
+        failures = []
+
+        def worker(number):
+            try:
+                operate(number)
+            except Exception as error:  # Surface thread failures in the test
+                failures.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+
+        booked = Counter(DispatchRecord.objects.values_list('vehicle_id', flat=True))
+        self.assertEqual(len(booked), self.VEHICLES)
+        self.assertEqual(max(booked.values()), 1)
+        self.assertFalse(EmergencyVehicle.objects.filter(is_available=True).exists())
+
+    def pairs(self, number):
+        # Each worker walks every (emergency, vehicle) combination from a different offset
+        return [
+            (self.emergencies[(i + number) % len(self.emergencies)], self.vehicles[i % self.VEHICLES])
+            for i in range(len(self.emergencies))
+        ]
+
+    def test_single_dispatches(self):
+        def operate(number):
+            for emergency_id, vehicle_id in self.pairs(number):
+                try:
+                    dispatch_vehicle(emergency_id, vehicle_id, self.operator)
+                except VehicleUnavailable:
+                    pass
+        self.race(operate)
+
+    def test_batch_dispatches(self):
+        def operate(number):
+            pairs = self.pairs(number)
+            for start in range(0, len(pairs), 7):
+                dispatch_vehicles(pairs[start:start + 7], self.operator)
+        self.race(operate)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite')
+class IndexUsageTests(TestCase):
+    """Dashboard and listing queries stay on indexes with 5M emergencies and dispatches"""
+
+    SMALL_TABLES = {'emergency_emergencytype', 'emergency_emergencyvehicle'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+        EmergencyRequest.objects.create(
+            citizen=cls.citizen, emergency_type=fire, address='Main Street',
+            description='Help', contact_number='5550100',
+        )
+
+    def setUp(self):
+        cache.clear()
+        simulate_table_stats({
+            'accounts_user': (1_000_000, {}),
+            'emergency_emergencyrequest': (5_000_000, {'status': 6, 'citizen_id': 1_000_000, 'emergency_type_id': 4}),
+            'emergency_dispatchrecord': (5_000_000, {'status': 4, 'vehicle_id': 5_000, 'assigned_by_id': 500}),
+        })
+
+    def assertNoFullScans(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(full_scans(queries.captured_queries, self.SMALL_TABLES), [])
+
+    def test_operator_dashboard(self):
+        self.assertNoFullScans(self.operator, '/emergency/operator/')
+
+    def test_my_emergency_requests(self):
+        self.assertNoFullScans(self.citizen, '/emergency/my-requests/')
+
+
+class CitizenApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = User.objects.create_user('operator', password='pass1234', role='emergency_operator')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.neighbour = User.objects.create_user('neighbour', password='pass1234', role='citizen')
+        cls.fire = EmergencyType.objects.create(name='Fire', description='Fire', icon='fire')
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+
+    def emergency(self, citizen):
+        with self.captureOnCommitCallbacks(execute=True):
+            return EmergencyRequest.objects.create(
+                citizen=citizen, emergency_type=self.fire,
+                address='Main Street', description='Help', contact_number='5550100',
+            )
+
+    def test_unchanged_polls_get_304_after_one_lookup(self):
+        emergency = self.emergency(self.citizen)
+        response = self.client.get('/emergency/api/my-requests/')
+        self.assertEqual(response.status_code, 200)
+        [listed] = response.json()['requests']
+        self.assertEqual((listed['id'], listed['emergency_type'], listed['status']), (emergency.pk, 'Fire', 'pending'))
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):  # The citizen's counter row
+            unchanged = self.client.get('/emergency/api/my-requests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((unchanged.status_code, unchanged['ETag']), (304, etag))
+
+        # Someone else's request leaves this citizen's version alone
+        self.emergency(self.neighbour)
+        self.assertEqual(self.client.get('/emergency/api/my-requests/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Dispatching updates the request in bulk, without signals
+        vehicle = EmergencyVehicle.objects.create(
+            vehicle_type='fire_truck', vehicle_number='FIRE-001', driver_name='Driver', driver_contact='5550100',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch_vehicle(emergency.pk, vehicle.pk, self.operator)
+        changed = self.client.get('/emergency/api/my-requests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['requests'][0]['status'], 'assigned')
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_last_modified_is_the_time_of_the_last_change(self):
+        emergency = self.emergency(self.citizen)
+        # Not while the second of the change is under way: another change could follow in it
+        self.assertFalse(self.client.get('/emergency/api/my-requests/').has_header('Last-Modified'))
+
+        earlier = timezone.now() - timedelta(minutes=5)
+        CitizenCounter.objects.filter(user=self.citizen, domain='emergency').update(changed_at=earlier)
+        last_modified = self.client.get('/emergency/api/my-requests/')['Last-Modified']
+        self.assertEqual(last_modified, http_date(int(earlier.timestamp())))
+        self.assertEqual(self.client.get('/emergency/api/my-requests/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            emergency.status = 'cancelled'
+            emergency.save()
+        self.assertEqual(self.client.get('/emergency/api/my-requests/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_only_citizens_may_poll(self):
+        self.client.force_login(self.operator)
+        self.assertEqual(self.client.get('/emergency/api/my-requests/').status_code, 403)
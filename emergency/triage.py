@@ -0,0 +1,26 @@
+"""
+Triage order of pending emergencies.
+
+Emergencies are ranked by when they fall due: the time they were reported
+plus a grace period for their priority (``RESPONSE_GRACE``). A critical
+call is due at once, so it goes ahead of everything reported before it.
+A low-priority call that has waited longer than its grace period has in
+effect escalated, and it goes ahead of newer high-priority calls. Because
+the due time never changes while a call waits, aging needs no re-keying:
+it is stored on the row (``EmergencyRequest.due_at``) and the queue is an
+index range scan on ``(status, due_at)``, the same in every process.
+"""
+
+from datetime import timedelta
+
+# How long each priority may wait before it ranks with a fresh critical call
+RESPONSE_GRACE = {
+    'critical': timedelta(0),
+    'high': timedelta(minutes=10),
+    'medium': timedelta(minutes=30),
+    'low': timedelta(minutes=60),
+}
+
+
+def due_at(priority, created_at):
+    return created_at + RESPONSE_GRACE.get(priority, RESPONSE_GRACE['medium'])
@@ -7,12 +7,17 @@ urlpatterns = [
     # Citizen URLs
     path('report/', views.citizen_emergency_request, name='report_emergency'),
     path('my-requests/', views.my_emergency_requests, name='my_requests'),
+    path('api/my-requests/', views.my_requests_api, name='my_requests_api'),
     path('detail/<int:request_id>/', views.emergency_detail, name='detail'),
     
     # Operator URLs
     path('operator/', views.operator_dashboard, name='operator_dashboard'),
+    path('operator/triage/', views.triage, name='triage'),
+    path('operator/events/', views.operator_events, name='operator_events'),
     path('assign/<int:emergency_id>/', views.assign_vehicle, name='assign_vehicle'),
+    path('dispatch/batch/', views.dispatch_batch, name='dispatch_batch'),
     path('dispatch/update/<int:dispatch_id>/', views.update_dispatch_status, name='update_dispatch_status'),
+    path('vehicles/telemetry/', views.telemetry, name='telemetry'),
     path('vehicles/', views.manage_vehicles, name='manage_vehicles'),
     path('vehicles/delete/<int:vehicle_id>/', views.delete_vehicle, name='delete_vehicle'),
 ]
\ No newline at end of file
@@ -1,9 +1,41 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
+from django.http import HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
-from django.utils import timezone  # ← FIXED: Added missing import
-from .models import EmergencyRequest, EmergencyType, EmergencyVehicle, DispatchRecord
+from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from dashboard import changes
+from smartcity import fragments
+from smartcity.pagination import keyset_paginate
+from .models import EmergencyRequest, EmergencyVehicle, DispatchRecord
+from .registry import emergency_types
 from .forms import EmergencyRequestForm, EmergencyVehicleForm
+from .spatial import vehicle_index, estimate_eta_minutes
+from .telemetry import MAX_PINGS_PER_REQUEST, telemetry_buffer
+from .stats import get_operator_stats, invalidate_operator_stats, ACTIVE_DISPATCH_STATUSES
+from . import events
+from .events import emergency_event, format_sse
+from .dispatch import DispatchError, dispatch_vehicle, dispatch_vehicles
+
+NEAREST_VEHICLES = 10
+MAX_BATCH_DISPATCHES = 200
+TRIAGE_LIST_SIZE = 25
+MAX_TRIAGE_LIMIT = 200
+KEEPALIVE_SECONDS = 15
+STATS_PUSH_INTERVAL = 5  # seconds between counter refreshes on a live stream
+EVENT_POLL_SECONDS = 5  # how often a dashboard served over WSGI asks for changes
+# What the citizen status API reads of each request
+API_FIELDS = (
+    'citizen_id', 'emergency_type_id', 'priority', 'status', 'address',
+    'created_at', 'updated_at', 'assigned_at', 'resolved_at',
+)
 
 @login_required
 def citizen_emergency_request(request):
@@ -12,29 +44,6 @@ def citizen_emergency_request(request):
         messages.error(request, 'Access denied. Only citizens can report emergencies.')
         return redirect('dashboard:dashboard')
     
-    # Create default emergency types if none exist
-    if not EmergencyType.objects.exists():
-        EmergencyType.objects.create(
-            name='Medical Emergency',
-            description='Medical emergencies including accidents, heart attacks, etc.',
-            icon='heartbeat'
-        )
-        EmergencyType.objects.create(
-            name='Fire',
-            description='Fire incidents in buildings, vehicles, or forests',
-            icon='fire'
-        )
-        EmergencyType.objects.create(
-            name='Accident',
-            description='Road accidents, falls, or other accidents',
-            icon='car-crash'
-        )
-        EmergencyType.objects.create(
-            name='Crime',
-            description='Criminal activities requiring police assistance',
-            icon='shield-alt'
-        )
-    
     if request.method == 'POST':
         form = EmergencyRequestForm(request.POST, user=request.user)
         if form.is_valid():
@@ -49,10 +58,8 @@ def citizen_emergency_request(request):
     else:
         form = EmergencyRequestForm(user=request.user)
     
-    emergency_types = EmergencyType.objects.all()
     return render(request, 'emergency/citizen_request.html', {
         'form': form,
-        'emergency_types': emergency_types,
     })
 
 
@@ -63,17 +70,56 @@ def my_emergency_requests(request):
         messages.error(request, 'Access denied.')
         return redirect('dashboard:dashboard')
     
-    requests = EmergencyRequest.objects.filter(citizen=request.user).order_by('-created_at')
+    requests = keyset_paginate(request, EmergencyRequest.objects.filter(citizen=request.user))
+    emergency_types.attach(requests, 'emergency_type')
     
     return render(request, 'emergency/my_requests.html', {
         'requests': requests,
     })
 
 
+@login_required
+def my_requests_api(request):
+    """A citizen's emergency requests as JSON, newest first; unchanged polls get 304 after one lookup"""
+    if request.user.role != 'citizen':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    etag, last_modified = changes.validators(
+        'emergency', request.user.pk, request.GET.urlencode(), depends=[('emergency.emergencytype', fragments.ALL)],
+    )
+    unchanged = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if unchanged is not None:
+        return changes.stamp(unchanged, etag, last_modified)
+    
+    requests = keyset_paginate(request, EmergencyRequest.objects.filter(citizen=request.user).only(*API_FIELDS))
+    emergency_types.attach(requests, 'emergency_type')
+    return changes.stamp(JsonResponse({
+        'requests': [
+            {
+                'id': emergency.pk,
+                'emergency_type': emergency.emergency_type.name,
+                'priority': emergency.priority,
+                'status': emergency.status,
+                'status_display': emergency.get_status_display(),
+                'address': emergency.address,
+                'created_at': emergency.created_at,
+                'updated_at': emergency.updated_at,
+                'assigned_at': emergency.assigned_at,
+                'resolved_at': emergency.resolved_at,
+                'url': reverse('emergency:detail', args=[emergency.pk]),
+            }
+            for emergency in requests
+        ],
+        'next': f'?{requests.next_query}' if requests.has_next else None,
+        'previous': f'?{requests.previous_query}' if requests.has_previous else None,
+    }), etag, last_modified)
+
+
 @login_required
 def emergency_detail(request, request_id):
     """View details of a specific emergency request"""
     emergency = EmergencyRequest.objects.get(id=request_id)
+    emergency_types.attach([emergency], 'emergency_type')
     
     # Check if user has permission to view this request
     if request.user.role != 'citizen' or emergency.citizen != request.user:
@@ -93,43 +139,143 @@ def operator_dashboard(request):
         messages.error(request, 'Access denied. Only emergency operators can access this page.')
         return redirect('dashboard:dashboard')
     
-    # Get pending emergencies
-    pending_emergencies = EmergencyRequest.objects.filter(status='pending').order_by('-created_at')
-    
-    # Get active dispatches
-    active_dispatches = DispatchRecord.objects.filter(
-        status__in=['assigned', 'en_route', 'on_scene']
-    ).select_related('emergency_request', 'vehicle').order_by('-assigned_at')
+    # Live updates start from the newest change before the snapshot; seeing one twice is harmless
+    events.listen()
+    event_cursor = events.cursor()
     
-    # Get statistics
-    total_pending = pending_emergencies.count()
-    total_active = active_dispatches.count()
-    total_vehicles = EmergencyVehicle.objects.count()
-    available_vehicles = EmergencyVehicle.objects.filter(is_available=True).count()
+    # Pending emergencies in triage order, a page at a time on keys alone.
+    # Rows come from the fragment cache; only changed ones are loaded and rendered
+    pending = _triage_page(request, TRIAGE_LIST_SIZE, EmergencyRequest.objects.only('id', 'due_at'))
+    pending_rows = fragments.render_many(
+        'emergency/includes/pending_row.html', [emergency.pk for emergency in pending],
+        lambda emergency_id: [('emergency.emergencyrequest', emergency_id), ('emergency.emergencytype', fragments.ALL)],
+        _load_emergencies,
+        'emergency',
+    )
     
-    # Calculate status counts
-    active_emergencies = EmergencyRequest.objects.filter(status__in=['assigned', 'en_route', 'on_scene']).count()
-    on_scene = DispatchRecord.objects.filter(status='on_scene').count()
-    resolved_today = EmergencyRequest.objects.filter(
-        status='resolved',
-        resolved_at__date=timezone.now().date()  # ← Now works because timezone is imported
-    ).count()
+    # Active dispatches: ids and vehicles pick the fragments
+    active = DispatchRecord.objects.filter(
+        status__in=ACTIVE_DISPATCH_STATUSES
+    ).order_by('-assigned_at').values_list('id', 'vehicle_id')
+    vehicle_of = dict(active)
+    dispatch_rows = fragments.render_many(
+        'emergency/includes/dispatch_row.html', list(vehicle_of),
+        lambda dispatch_id: [('emergency.dispatchrecord', dispatch_id), ('emergency.emergencyvehicle', vehicle_of[dispatch_id])],
+        lambda dispatch_ids: DispatchRecord.objects.select_related('vehicle').in_bulk(dispatch_ids),
+        'dispatch',
+    )
     
+    # All counters come from one cached aggregate snapshot
     context = {
-        'pending_emergencies': pending_emergencies,
-        'active_dispatches': active_dispatches,
-        'total_pending': total_pending,
-        'total_active': total_active,
-        'total_vehicles': total_vehicles,
-        'available_vehicles': available_vehicles,
-        'active_emergencies': active_emergencies,
-        'on_scene': on_scene,
-        'resolved_today': resolved_today,
+        'pending': pending,
+        'pending_rows': pending_rows,
+        'dispatch_rows': dispatch_rows,
+        'event_cursor': event_cursor,
+        'live_stream': isinstance(request, ASGIRequest),
+        'event_poll_seconds': EVENT_POLL_SECONDS,
+        **get_operator_stats(),
     }
     
     return render(request, 'emergency/operator_dashboard.html', context)
 
 
+@login_required
+def triage(request):
+    """JSON page of pending emergencies, most urgent first"""
+    if request.user.role != 'emergency_operator':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', TRIAGE_LIST_SIZE)), 1), MAX_TRIAGE_LIMIT)
+    except ValueError:
+        limit = TRIAGE_LIST_SIZE
+    
+    emergencies = _triage_page(request, limit, EmergencyRequest.objects.all())
+    emergency_types.attach(emergencies, 'emergency_type')
+    return JsonResponse({
+        'pending': EmergencyRequest.objects.filter(status='pending').count(),
+        'emergencies': [emergency_event(emergency) for emergency in emergencies],
+        'next': f'?{emergencies.next_query}' if emergencies.has_next else None,
+        'previous': f'?{emergencies.previous_query}' if emergencies.has_previous else None,
+    })
+
+
+def _triage_page(request, page_size, queryset):
+    """A page of the pending emergencies in ``queryset``, ordered by when they fall due"""
+    return keyset_paginate(
+        request, queryset.filter(status='pending'), page_size=page_size, field='due_at', descending=False,
+    )
+
+
+def _load_emergencies(emergency_ids):
+    emergencies = EmergencyRequest.objects.in_bulk(emergency_ids)
+    emergency_types.attach(emergencies.values(), 'emergency_type')
+    return emergencies
+
+
+async def operator_events(request):
+    """
+    Emergency and dispatch changes after the event id in ``?after=`` (or
+    a reconnecting stream's ``Last-Event-ID``). Under ASGI a client that
+    accepts ``text/event-stream`` gets a Server-Sent Events stream; every
+    other request gets one JSON batch, so WSGI workers are never held.
+    """
+    user = await request.auser()
+    if not user.is_authenticated or user.role != 'emergency_operator':
+        return HttpResponseForbidden()
+    try:
+        after = max(int(request.headers.get('Last-Event-ID') or request.GET.get('after', 0)), 0)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid event id.'}, status=400)
+    
+    events.listen()
+    if not _streaming(request):
+        found = await sync_to_async(events.read)(after)
+        stats = await sync_to_async(get_operator_stats)()
+        return JsonResponse({
+            'cursor': found[-1][0] if found else after,
+            'events': [event for _, event in found],
+            'stats': stats,
+        })
+    
+    response = StreamingHttpResponse(_operator_event_stream(after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
+
+def _streaming(request):
+    """Whether ``request`` can hold a live stream: served over ASGI to an ``EventSource``"""
+    return isinstance(request, ASGIRequest) and 'text/event-stream' in request.headers.get('Accept', '')
+
+
+async def _operator_event_stream(after):
+    stats_sent_at = 0
+    sent_at = listened_at = time.monotonic()
+    yield 'retry: 3000\n\n'
+    while True:
+        # Keep every worker logging changes while this stream is open
+        if time.monotonic() - listened_at > events.LISTEN_SECONDS / 2:
+            await sync_to_async(events.listen)()
+            listened_at = time.monotonic()
+        
+        found = await sync_to_async(events.read)(after)
+        for event_id, event in found:
+            yield format_sse(event, event_id)
+            after = event_id
+        if found:
+            sent_at = time.monotonic()
+            # Counters ride along at most every few seconds, from the shared snapshot
+            if sent_at - stats_sent_at > STATS_PUSH_INTERVAL:
+                stats = await sync_to_async(get_operator_stats)()
+                yield format_sse({'type': 'stats', **stats})
+                stats_sent_at = sent_at
+        elif time.monotonic() - sent_at > KEEPALIVE_SECONDS:
+            yield ': keepalive\n\n'
+            sent_at = time.monotonic()
+        await asyncio.sleep(events.POLL_INTERVAL)
+
+
 @login_required
 def assign_vehicle(request, emergency_id):
     """Assign a vehicle to an emergency"""
@@ -137,40 +283,117 @@ def assign_vehicle(request, emergency_id):
         messages.error(request, 'Access denied.')
         return redirect('dashboard:dashboard')
     
-    emergency = EmergencyRequest.objects.get(id=emergency_id)
+    if request.method == 'POST':
+        try:
+            dispatch = dispatch_vehicle(emergency_id, request.POST.get('vehicle_id'), request.user)
+        except DispatchError as error:
+            messages.error(request, str(error))
+            return redirect('emergency:assign_vehicle', emergency_id=emergency_id)
+        messages.success(request, f'Vehicle {dispatch.vehicle.vehicle_number} assigned successfully!')
+        return redirect('emergency:operator_dashboard')
     
-    # Get available vehicles
-    available_vehicles = EmergencyVehicle.objects.filter(is_available=True)
+    emergency = EmergencyRequest.objects.get(id=emergency_id)
+    emergency_types.attach([emergency], 'emergency_type')
+    vehicle_type = request.GET.get('vehicle_type', '')
     
-    if request.method == 'POST':
-        vehicle_id = request.POST.get('vehicle_id')
-        vehicle = EmergencyVehicle.objects.get(id=vehicle_id)
-        
-        # Create dispatch record
-        dispatch = DispatchRecord.objects.create(
-            emergency_request=emergency,
-            vehicle=vehicle,
-            assigned_by=request.user,
-            status='assigned'
+    if emergency.location_lat is not None and emergency.location_lng is not None:
+        # Rank the k nearest available vehicles using the in-memory grid
+        nearest = vehicle_index.nearest(
+            emergency.location_lat, emergency.location_lng,
+            k=NEAREST_VEHICLES, vehicle_type=vehicle_type,
         )
+        vehicles_by_id = EmergencyVehicle.objects.in_bulk([vehicle_id for _, vehicle_id in nearest])
+        available_vehicles = []
+        for distance, vehicle_id in nearest:
+            vehicle = vehicles_by_id.get(vehicle_id)
+            if vehicle is None or not vehicle.is_available:
+                continue  # Changed in another process since the index was built
+            vehicle.distance_km = round(distance, 2)
+            vehicle.eta_minutes = estimate_eta_minutes(distance)
+            available_vehicles.append(vehicle)
         
-        # Update emergency status
-        emergency.status = 'assigned'
-        emergency.save()
-        
-        # Mark vehicle as unavailable
-        vehicle.is_available = False
-        vehicle.save()
-        
-        messages.success(request, f'Vehicle {vehicle.vehicle_number} assigned successfully!')
-        return redirect('emergency:operator_dashboard')
+        # Vehicles without coordinates can't be ranked; list them after the ranked ones
+        unlocated = EmergencyVehicle.objects.filter(is_available=True, location_lat__isnull=True)
+        if vehicle_type:
+            unlocated = unlocated.filter(vehicle_type=vehicle_type)
+        available_vehicles.extend(unlocated)
+    else:
+        available_vehicles = EmergencyVehicle.objects.filter(is_available=True)
+        if vehicle_type:
+            available_vehicles = available_vehicles.filter(vehicle_type=vehicle_type)
     
     return render(request, 'emergency/assign_vehicle.html', {
         'emergency': emergency,
         'available_vehicles': available_vehicles,
+        'vehicle_type': vehicle_type,
+        'vehicle_type_choices': EmergencyVehicle.VEHICLE_TYPE_CHOICES,
     })
 
 
+
+@login_required
+@require_POST
+def dispatch_batch(request):
+    """
+    Assign many vehicles in one request. Takes
+    ``{"assignments": [{"emergency_id": 1, "vehicle_id": 2}, ...]}`` and
+    answers with the dispatches made and the pairs that were refused.
+    """
+    if request.user.role != 'emergency_operator':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    try:
+        assignments = json.loads(request.body)['assignments']
+        pairs = [(item['emergency_id'], item['vehicle_id']) for item in assignments]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"assignments": [{"emergency_id", "vehicle_id"}, ...]}.'}, status=400)
+    if len(pairs) > MAX_BATCH_DISPATCHES:
+        return JsonResponse({'error': f'At most {MAX_BATCH_DISPATCHES} assignments per request.'}, status=400)
+    
+    dispatches, errors = dispatch_vehicles(pairs, request.user)
+    return JsonResponse({
+        'dispatched': [
+            {'dispatch_id': dispatch.id, 'emergency_id': dispatch.emergency_request_id, 'vehicle_id': dispatch.vehicle_id}
+            for dispatch in dispatches
+        ],
+        'rejected': [
+            {'index': index, 'emergency_id': pairs[index][0], 'vehicle_id': pairs[index][1], 'error': str(error)}
+            for index, error in sorted(errors.items())
+        ],
+    }, status=200 if dispatches or not errors else 409)
+
+
+def _reject_constant(name):
+    raise ValueError(f'{name} is not a number')
+
+
+@login_required
+@require_POST
+def telemetry(request):
+    """
+    Batched GPS pings from a driver's device for the vehicle assigned to
+    them: ``{"pings": [[unix time, lat, lng], ...]}``. Pings are buffered in
+    memory and stored in bulk (see ``emergency.telemetry``).
+    """
+    if request.user.role != 'vehicle_driver':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    vehicle_id = EmergencyVehicle.objects.filter(driver=request.user).values_list('pk', flat=True).first()
+    if vehicle_id is None:
+        return JsonResponse({'error': 'No vehicle is assigned to you.'}, status=409)
+    
+    try:
+        body = json.loads(request.body, parse_constant=_reject_constant)
+        pings = [(float(t), float(lat), float(lng)) for t, lat, lng in body['pings']]
+    except (ValueError, KeyError, TypeError, OverflowError):
+        return JsonResponse({'error': 'Expected {"pings": [[unix time, lat, lng], ...]}.'}, status=400)
+    if len(pings) > MAX_PINGS_PER_REQUEST:
+        return JsonResponse({'error': f'At most {MAX_PINGS_PER_REQUEST} pings per request.'}, status=400)
+    
+    accepted = telemetry_buffer.ingest(vehicle_id, pings)
+    return JsonResponse({'accepted': accepted, 'rejected': len(pings) - accepted}, status=202)
+
+
 @login_required
 def update_dispatch_status(request, dispatch_id):
     """Update dispatch status (en route, on scene, completed)"""
@@ -198,6 +421,7 @@ def update_dispatch_status(request, dispatch_id):
         if status == 'completed':
             dispatch.vehicle.is_available = True
             dispatch.vehicle.save()
+        invalidate_operator_stats()
         
         messages.success(request, 'Dispatch status updated successfully!')
         return redirect('emergency:operator_dashboard')
@@ -3,6 +3,11 @@ ASGI config for smartcity project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve through this module (e.g. ``uvicorn smartcity.asgi:application``) to
+push operator dashboard updates over a live stream at
+``/emergency/operator/events/``. Under WSGI that long-lived stream would
+tie up a worker thread per operator, so dashboards poll the same URL.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -0,0 +1,92 @@
+"""
+Helpers for the benchmark management commands.
+
+Benchmarks never touch the development database: they run against a
+throwaway test database created the same way ``manage.py test`` does,
+and a throwaway cache.
+"""
+
+import math
+from contextlib import contextmanager
+
+from django.db import connection
+from .testing import isolated_cache
+
+
+@contextmanager
+def isolated_database(keepdb=False, verbosity=0):
+    """
+    Create (and afterwards destroy) a test database for the duration, with
+    a cache of its own so cached sessions and rows of the throwaway
+    database never mix with the real ones.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=keepdb)
+    try:
+        with isolated_cache():
+            yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` for ``q`` in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(math.ceil(q / 100 * len(ordered))) - 1, 0)
+    return ordered[rank]
+
+
+def simulate_table_stats(tables):
+    """
+    Make the SQLite query planner believe tables are large.
+
+    ``tables`` maps a table name to ``(row_count, {column: distinct_values})``.
+    Matching ``sqlite_stat1`` rows are written for the table and each of its
+    indexes, so ``EXPLAIN QUERY PLAN`` shows the plan the same queries would
+    get on a production-sized, ANALYZEd database without inserting the rows.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        for table, (rows, distinct) in tables.items():
+            cursor.execute('DELETE FROM sqlite_stat1 WHERE tbl = %s', [table])
+            cursor.execute('INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (%s, NULL, %s)', [table, str(rows)])
+            cursor.execute(f'PRAGMA index_list("{table}")')
+            for index in [row[1] for row in cursor.fetchall()]:
+                cursor.execute(f'PRAGMA index_info("{index}")')
+                stat, groups = [str(rows)], 1
+                for column in [row[2] for row in cursor.fetchall()]:
+                    groups *= distinct.get(column, rows)
+                    stat.append(str(max(rows // groups, 1)))
+                cursor.execute(
+                    'INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (%s, %s, %s)', [table, index, ' '.join(stat)]
+                )
+        # Reload the statistics into the planner
+        cursor.execute('ANALYZE sqlite_schema')
+
+
+def full_scans(queries, small_tables=(), allow_sorts=True):
+    """
+    Plan steps among captured ``queries`` that read a whole table or index
+    (or, with ``allow_sorts=False``, that sort rows in a temporary b-tree).
+
+    The outer loop of a single-row probe (``LIMIT 1``) and tables listed in
+    ``small_tables`` are ignored.
+    """
+    scans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            single_row = sql.rstrip().endswith('LIMIT 1')
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            for _, parent, _, detail in cursor.fetchall():
+                if not allow_sorts and detail.startswith('USE TEMP B-TREE'):
+                    scans.append((detail, sql))
+                    continue
+                if not detail.startswith('SCAN ') or detail.split()[1] in small_tables:
+                    continue
+                if single_row and parent == 0:
+                    continue
+                scans.append((detail, sql))
+    return scans
@@ -0,0 +1,26 @@
+"""
+The file-based cache workers on one host share when there is no Redis.
+
+Django's ``FileBasedCache`` lists its whole directory on every ``set()``
+to see whether it is over ``MAX_ENTRIES``. Sessions, cached users,
+fragments and registry generations all write through the cache, so
+``FileCache`` only counts the files every ``CULL_EVERY`` writes of a
+process. The directory can run past ``MAX_ENTRIES`` by that many writes
+per worker before it is trimmed.
+"""
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+CULL_EVERY = 500  # writes between checks of the directory size
+
+
+class FileCache(FileBasedCache):
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.writes = 0
+
+    def _cull(self):
+        self.writes += 1
+        if self.writes % CULL_EVERY == 0:
+            super()._cull()
@@ -0,0 +1,195 @@
+"""
+Versioned fragment cache for table rows that look the same to every viewer.
+
+Every cached object has a version token in the shared cache under
+``fragments:version:<model label>:<pk>``. Saves and deletes bump it (the
+model signals call ``bump``), as does code that changes rows with
+``QuerySet.update()``. A whole table can be versioned as one unit under
+the pk ``'*'``; the reference tables are, so renaming a type re-renders
+every row that shows it. The cache has to be shared by every worker
+(``accounts.checks`` refuses a per-process one): a bump is only seen by
+the workers that read the same cache.
+
+``render_many`` keys each fragment by its template, the versions of
+everything it depends on and a global generation, and reads them all with
+two ``get_many`` calls. Only the misses are loaded from the database and
+rendered, so an unchanged row costs neither a query nor a render. A bump
+makes the old fragments unreachable rather than deleting them; they
+expire after ``FRAGMENT_TTL``.
+
+Hits and misses are counted per template in each process and published
+to the shared cache like the query statistics; staff read them at
+``/admin/fragment-stats/``.
+"""
+
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+FRAGMENT_TTL = 60 * 60
+VERSION_TTL = 24 * 60 * 60  # Longer than any fragment built on it
+PUBLISH_INTERVAL = 10  # seconds
+SNAPSHOT_TTL = 60 * 60
+
+GENERATION_KEY = 'fragments:generation'
+PROCESSES_KEY = 'fragments:stats:processes'
+
+ALL = '*'  # pk standing for every row of a model
+
+
+def version_key(label, pk):
+    return f'fragments:version:{label}:{pk}'
+
+
+def _token():
+    return uuid.uuid4().hex[:12]
+
+
+def bump(label, pks):
+    """
+    Give ``pks`` of ``label`` new versions, now and again when the current
+    transaction commits: a fragment rendered in between from rows read
+    before the commit is left under a version nobody asks for.
+    """
+    keys = [version_key(label, pk) for pk in pks]
+    if not keys:
+        return
+
+    def renew():
+        cache.set_many({key: _token() for key in keys}, VERSION_TTL)
+
+    renew()
+    transaction.on_commit(renew)
+
+
+def touch(instance):
+    """``bump`` one saved or deleted model instance"""
+    bump(instance._meta.label_lower, [instance.pk])
+
+
+def invalidate_all():
+    """Orphan every fragment, e.g. after a bulk load that sent no signals"""
+    cache.set(GENERATION_KEY, _token(), None)
+
+
+def _versions(keys):
+    """``{key: token}`` for version ``keys``, creating missing ones"""
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, _token(), VERSION_TTL)  # Unless a writer got there first
+        found.update(cache.get_many(missing))
+    return found
+
+
+def _template_digest(template):
+    # Changing the markup must not serve fragments rendered from the old one
+    return hashlib.md5(template.template.source.encode()).hexdigest()[:8]
+
+
+def render_many(template_name, pks, dependencies, load, context_name):
+    """
+    Render ``template_name`` once per pk in ``pks`` and return the HTML in
+    the same order.
+
+    ``dependencies(pk)`` lists the ``(label, pk)`` versions a fragment is
+    keyed by. ``load(pks)`` returns ``{pk: object}`` for the misses; it is
+    only called if there are any, and pks it leaves out are dropped from
+    the result. Each object is rendered as ``context_name``.
+    """
+    template = get_template(template_name)
+    needs = {pk: dependencies(pk) for pk in pks}
+    versions = _versions([GENERATION_KEY] + sorted({version_key(*dep) for deps in needs.values() for dep in deps}))
+    prefix = f'fragments:{template_name}:{_template_digest(template)}:{versions.get(GENERATION_KEY, "")}'
+    keys = {
+        pk: ':'.join([prefix, str(pk), *(versions.get(version_key(*dep), '') for dep in deps)])
+        for pk, deps in needs.items()
+    }
+
+    fragments = cache.get_many(list(keys.values()))
+    missing = [pk for pk in pks if keys[pk] not in fragments]
+    if missing:
+        objects = load(missing)
+        fresh = {keys[pk]: template.render({context_name: objects[pk]}) for pk in missing if pk in objects}
+        cache.set_many(fresh, FRAGMENT_TTL)
+        fragments.update(fresh)
+    fragment_stats.record(template_name, len(pks) - len(missing), len(missing))
+    return [mark_safe(fragments[keys[pk]]) for pk in pks if keys[pk] in fragments]
+
+
+def render(template_name, pk, dependencies, load, context_name):
+    """One fragment from ``render_many``, or an empty string"""
+    rendered = render_many(template_name, [pk], dependencies, load, context_name)
+    return rendered[0] if rendered else ''
+
+
+class FragmentStats:
+    """Hits and misses per fragment template in this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.published_at = 0.0
+        self.cache_key = f'fragments:stats:{socket.gethostname()}:{os.getpid()}'
+
+    def record(self, template_name, hits, misses):
+        with self.lock:
+            counts = self.counts.setdefault(template_name, Counter())
+            counts['hits'] += hits
+            counts['misses'] += misses
+        if time.monotonic() - self.published_at > PUBLISH_INTERVAL:
+            self.publish()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(counts) for name, counts in self.counts.items()}
+
+    def publish(self):
+        """Copy this process's counts into the shared cache"""
+        self.published_at = time.monotonic()
+        cache.set(self.cache_key, self.snapshot(), SNAPSHOT_TTL)
+        processes = cache.get(PROCESSES_KEY) or []
+        if self.cache_key not in processes:
+            cache.set(PROCESSES_KEY, [*processes, self.cache_key], None)
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+
+fragment_stats = FragmentStats()
+
+
+def report():
+    """``{template: {hits, misses, hit_rate}}`` merged across every process that published"""
+    snapshots = cache.get_many(cache.get(PROCESSES_KEY) or [])
+    snapshots[fragment_stats.cache_key] = fragment_stats.snapshot()  # This process, up to the moment
+    merged = {}
+    for snapshot in snapshots.values():
+        for name, counts in snapshot.items():
+            merged.setdefault(name, Counter()).update(counts)
+    return {
+        name: {
+            'hits': counts['hits'],
+            'misses': counts['misses'],
+            'hit_rate': round(counts['hits'] / max(counts['hits'] + counts['misses'], 1), 3),
+        }
+        for name, counts in sorted(merged.items())
+    }
+
+
+def reset():
+    """Drop every published copy and this process's counts"""
+    processes = cache.get(PROCESSES_KEY) or []
+    cache.delete_many([*processes, PROCESSES_KEY])
+    fragment_stats.reset()
@@ -0,0 +1,167 @@
+"""
+Small geo helpers shared by the apps.
+
+Coordinates are plain WGS84 degrees, the same values stored in the
+``location_lat`` / ``location_lng`` columns.
+"""
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid holding point ids.
+
+    Each id lives in exactly one cell, so moving or removing a point is
+    O(1). Nearest-neighbour queries scan rings of cells outwards from the
+    query point and stop as soon as no unvisited ring can hold anything
+    closer than the current k-th best hit. When the points are sparse,
+    walking on would visit more empty cells than there are occupied ones,
+    so the rest of the occupied cells are checked directly instead.
+    """
+
+    def __init__(self, cell_size=0.01):
+        self.cell_size = cell_size  # degrees, ~1.1 km of latitude
+        self.cells = {}
+        self.points = {}
+        # (min_row, max_row, min_col, max_col) of the occupied cells, or None until next needed
+        self.bounds = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def insert(self, key, lat, lng, data=None):
+        """Add a point, or move it if the key is already indexed"""
+        lat, lng = float(lat), float(lng)
+        cell = self._cell(lat, lng)
+        old = self.points.get(key)
+        if old is not None and old[2] != cell:
+            self._discard(key, old[2])
+        self.points[key] = (lat, lng, cell, data)
+        self.cells.setdefault(cell, set()).add(key)
+        if self.bounds is not None:
+            min_row, max_row, min_col, max_col = self.bounds
+            self.bounds = (min(min_row, cell[0]), max(max_row, cell[0]), min(min_col, cell[1]), max(max_col, cell[1]))
+
+    def remove(self, key):
+        old = self.points.pop(key, None)
+        if old is not None:
+            self._discard(key, old[2])
+
+    def _discard(self, key, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+                if self.bounds is not None and (cell[0] in self.bounds[:2] or cell[1] in self.bounds[2:]):
+                    self.bounds = None  # An edge may have moved in; recomputed on the next query
+
+    def clear(self):
+        self.cells.clear()
+        self.points.clear()
+        self.bounds = None
+
+    def within(self, lat, lng, radius_km, predicate=None):
+        """All ``(distance_km, key, data)`` within ``radius_km``, nearest first"""
+        lat, lng = float(lat), float(lng)
+        row, col = self._cell(lat, lng)
+        hits = []
+        for _, keys in self._rings(row, col, self._rings_for(lat, radius_km)):
+            for key in keys:
+                p_lat, p_lng, _, data = self.points[key]
+                if predicate is not None and not predicate(data):
+                    continue
+                distance = haversine_km(lat, lng, p_lat, p_lng)
+                if distance <= radius_km:
+                    hits.append((distance, key, data))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def nearest(self, lat, lng, k=10, predicate=None, max_km=None):
+        """The ``k`` closest ``(distance_km, key, data)`` tuples, nearest first, none further than ``max_km``"""
+        if not self.points:
+            return []
+        lat, lng = float(lat), float(lng)
+        row, col = self._cell(lat, lng)
+        rings = self._max_ring(row, col)
+        if max_km is not None:
+            rings = min(rings, self._rings_for(lat, max_km))
+        ring_km = self._ring_km(lat)
+
+        hits = []
+        for r, keys in self._rings(row, col, rings):
+            # Anything in ring r or beyond is at least (r - 1) ring widths away
+            if len(hits) >= k and hits[k - 1][0] < (r - 1) * ring_km:
+                break
+            for key in keys:
+                p_lat, p_lng, _, data = self.points[key]
+                if predicate is not None and not predicate(data):
+                    continue
+                distance = haversine_km(lat, lng, p_lat, p_lng)
+                if max_km is None or distance <= max_km:
+                    hits.append((distance, key, data))
+            hits.sort(key=lambda hit: hit[0])
+        return hits[:k]
+
+    def _rings(self, row, col, rings):
+        """
+        ``(r, keys)`` of each ring out to ``rings``. Once the rings walked
+        cover more cells than are occupied, the occupied cells of every
+        remaining ring come at once, as ring r.
+        """
+        for r in range(rings + 1):
+            if r and (2 * r + 1) ** 2 > len(self.cells):
+                yield r, [
+                    key
+                    for (cell_row, cell_col), bucket in self.cells.items()
+                    if r <= max(abs(cell_row - row), abs(cell_col - col)) <= rings
+                    for key in bucket
+                ]
+                return
+            yield r, self._ring_keys(row, col, r)
+
+    def _ring_keys(self, row, col, r):
+        if r == 0:
+            yield from self.cells.get((row, col), ())
+            return
+        for c in range(col - r, col + r + 1):
+            yield from self.cells.get((row - r, c), ())
+            yield from self.cells.get((row + r, c), ())
+        for rr in range(row - r + 1, row + r):
+            yield from self.cells.get((rr, col - r), ())
+            yield from self.cells.get((rr, col + r), ())
+
+    def _max_ring(self, row, col):
+        """Ring count needed to reach every occupied cell"""
+        if self.bounds is None:
+            rows = [cell_row for cell_row, _ in self.cells]
+            cols = [cell_col for _, cell_col in self.cells]
+            self.bounds = (min(rows), max(rows), min(cols), max(cols))
+        min_row, max_row, min_col, max_col = self.bounds
+        return max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+
+    def _ring_km(self, lat):
+        """Width of one ring in km, measured along the (shorter) longitude axis"""
+        return self.cell_size * KM_PER_DEGREE_LAT * max(math.cos(math.radians(min(abs(lat) + 1, 89))), 0.01)
+
+    def _rings_for(self, lat, radius_km):
+        return int(math.ceil(radius_km / self._ring_km(lat))) + 1
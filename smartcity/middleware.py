@@ -0,0 +1,24 @@
+from django.db import connection
+from .querystats import QueryRecorder, query_stats
+
+
+class QueryStatsMiddleware:
+    """
+    Record every request's database work against its resolved view name.
+
+    Goes first in ``MIDDLEWARE`` so session and user lookups are counted.
+    Statements run while a streaming response is being consumed fall
+    outside the request and are not recorded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        query_stats.record(match.view_name if match else 'unresolved', recorder)
+        return response
@@ -0,0 +1,119 @@
+"""
+Keyset (cursor) pagination for newest-first listings.
+
+Pages are ordered by ``(created_at, id)`` descending -- or by another
+timestamp, either way round -- and each link carries the key of the row it
+continues from, so fetching page N is one index
+range seek of ``page_size + 1`` rows -- the same cost as page 1, unlike
+OFFSET which has to walk past every earlier row.
+"""
+
+import base64
+from datetime import datetime
+
+PAGE_SIZE = 25
+
+
+class KeysetPage:
+    """One page of rows plus the query strings for its neighbours"""
+
+    def __init__(self, object_list, next_query=None, previous_query=None, first_query=None):
+        self.object_list = object_list
+        self.next_query = next_query
+        self.previous_query = previous_query
+        self.first_query = first_query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_query is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_query is not None
+
+
+def encode_cursor(direction, obj, field='created_at'):
+    raw = f"{direction}|{getattr(obj, field).isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, timestamp, pk)`` or None for a missing/garbled cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, timestamp, pk = raw.split('|')
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_paginate(request, queryset, param='cursor', page_size=PAGE_SIZE, field='created_at', descending=True):
+    """
+    Return a ``KeysetPage`` of ``queryset`` ordered newest first, or
+    oldest first when ``descending`` is false.
+
+    ``param`` names the query-string parameter holding the cursor, so one
+    view can page several listings independently.
+    """
+    cursor = decode_cursor(request.GET.get(param))
+
+    if cursor is None:
+        order = [f'-{field}', '-pk'] if descending else [field, 'pk']
+        rows = list(queryset.order_by(*order)[:page_size + 1])
+        has_next, has_previous = len(rows) > page_size, False
+        rows = rows[:page_size]
+    elif cursor[0] == 'next':
+        rows = list(_beyond(queryset, field, *cursor[1:], descending)[:page_size + 1])
+        has_next, has_previous = len(rows) > page_size, True
+        rows = rows[:page_size]
+    else:
+        rows = list(_beyond(queryset, field, *cursor[1:], not descending)[:page_size + 1])
+        has_next, has_previous = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+
+    def query_for(direction, obj):
+        params = request.GET.copy()
+        params[param] = encode_cursor(direction, obj, field)
+        return params.urlencode()
+
+    first = request.GET.copy()
+    first.pop(param, None)
+    first_query = first.urlencode() if cursor is not None else None
+
+    if not rows:
+        return KeysetPage(rows, first_query=first_query)
+    return KeysetPage(
+        rows,
+        next_query=query_for('next', rows[-1]) if has_next else None,
+        previous_query=query_for('prev', rows[0]) if has_previous else None,
+        first_query=first_query,
+    )
+
+
+def _beyond(queryset, field, timestamp, pk, descending):
+    """Rows after ``(timestamp, pk)`` in ``(field, pk)`` order, descending or not"""
+    # "<= timestamp" gives the index a range to seek; the exclude breaks ties on id
+    if descending:
+        return (
+            queryset.filter(**{f'{field}__lte': timestamp})
+            .exclude(**{field: timestamp, 'pk__gte': pk})
+            .order_by(f'-{field}', '-pk')
+        )
+    return (
+        queryset.filter(**{f'{field}__gte': timestamp})
+        .exclude(**{field: timestamp, 'pk__lte': pk})
+        .order_by(field, 'pk')
+    )
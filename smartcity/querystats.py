@@ -0,0 +1,213 @@
+"""
+Per-view database statistics collected by ``QueryStatsMiddleware``.
+
+Each request's queries are recorded by a ``QueryRecorder`` installed with
+``connection.execute_wrapper``. Its summary is folded into a rolling
+window (the last ``WINDOW`` requests) per resolved view name, from which
+query count and DB time histograms, the slowest statements and repeated
+statement fingerprints are reported.
+
+The window lives in the serving process. Every ``PUBLISH_INTERVAL``
+seconds a process copies it into the shared cache, where the
+``query_stats`` command and the admin-only ``/admin/query-stats/``
+endpoint merge the copies of every process.
+"""
+
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter, deque
+
+from django.core.cache import cache
+
+WINDOW = 500  # requests kept per view
+SLOW_STATEMENTS = 5  # slowest statements kept per view
+REPEAT_THRESHOLD = 5  # same statement this often in one request looks like N+1
+PUBLISH_INTERVAL = 10  # seconds
+SNAPSHOT_TTL = 60 * 60
+
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+TIME_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+PROCESSES_KEY = 'querystats:processes'
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """``sql`` with literals, parameters and IN lists collapsed"""
+    for pattern, replacement in _LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` timing every statement of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements = []  # (duration_ms, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.total_ms += duration
+            self.statements.append((duration, sql))
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """``{fingerprint: times}`` for statements run at least ``threshold`` times"""
+        counts = Counter(fingerprint(sql) for _, sql in self.statements)
+        return {sql: times for sql, times in counts.items() if times >= threshold}
+
+    def slowest(self, n=SLOW_STATEMENTS):
+        return sorted(self.statements, key=lambda statement: statement[0], reverse=True)[:n]
+
+
+def histogram(values, buckets):
+    """``{"<=bound": count, ..., ">last": count}`` for ``values``"""
+    counts = dict.fromkeys([f'<={bound}' for bound in buckets] + [f'>{buckets[-1]}'], 0)
+    for value in values:
+        for bound in buckets:
+            if value <= bound:
+                counts[f'<={bound}'] += 1
+                break
+        else:
+            counts[f'>{buckets[-1]}'] += 1
+    return counts
+
+
+class ViewStats:
+    """Rolling window of request summaries for one view"""
+
+    def __init__(self, window=WINDOW):
+        self.requests = deque(maxlen=window)  # (queries, db_ms)
+        self.slow = []  # (duration_ms, fingerprint), slowest first
+        self.repeats = {}  # fingerprint -> [requests seen in, most repeats in one request]
+
+    def add(self, recorder):
+        self.requests.append((recorder.count, recorder.total_ms))
+
+        slow = {sql: duration for duration, sql in self.slow}
+        for duration, sql in recorder.slowest():
+            key = fingerprint(sql)
+            slow[key] = max(duration, slow.get(key, 0))
+        self.slow = sorted(((duration, sql) for sql, duration in slow.items()), reverse=True)[:SLOW_STATEMENTS]
+
+        for sql, times in recorder.repeated().items():
+            seen = self.repeats.setdefault(sql, [0, 0])
+            seen[0] += 1
+            seen[1] = max(seen[1], times)
+
+    def snapshot(self):
+        queries = [count for count, _ in self.requests]
+        db_ms = [duration for _, duration in self.requests]
+        return {
+            'requests': len(self.requests),
+            'queries': queries,
+            'db_ms': [round(duration, 3) for duration in db_ms],
+            'slowest': [{'ms': round(duration, 3), 'sql': sql} for duration, sql in self.slow],
+            'repeated': [
+                {'sql': sql, 'requests': seen, 'max_repeats': most}
+                for sql, (seen, most) in sorted(self.repeats.items(), key=lambda item: -item[1][1])
+            ],
+        }
+
+
+class QueryStats:
+    """Every view's window in this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.published_at = 0.0
+        self.cache_key = f'querystats:{socket.gethostname()}:{os.getpid()}'
+
+    def record(self, view_name, recorder):
+        with self.lock:
+            self.views.setdefault(view_name, ViewStats()).add(recorder)
+        if time.monotonic() - self.published_at > PUBLISH_INTERVAL:
+            self.publish()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: stats.snapshot() for name, stats in self.views.items()}
+
+    def publish(self):
+        """Copy this process's windows into the shared cache"""
+        self.published_at = time.monotonic()
+        cache.set(self.cache_key, self.snapshot(), SNAPSHOT_TTL)
+        processes = cache.get(PROCESSES_KEY) or []
+        if self.cache_key not in processes:
+            cache.set(PROCESSES_KEY, [*processes, self.cache_key], None)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+query_stats = QueryStats()
+
+
+def collect():
+    """Raw per-view windows merged across every process that published"""
+    merged = {}
+    snapshots = cache.get_many(cache.get(PROCESSES_KEY) or [])
+    snapshots[query_stats.cache_key] = query_stats.snapshot()  # This process, up to the moment
+    for snapshot in snapshots.values():
+        for name, stats in snapshot.items():
+            view = merged.setdefault(name, {'requests': 0, 'queries': [], 'db_ms': [], 'slowest': [], 'repeated': []})
+            view['requests'] += stats['requests']
+            view['queries'] += stats['queries']
+            view['db_ms'] += stats['db_ms']
+            view['slowest'] += stats['slowest']
+            view['repeated'] += stats['repeated']
+    return merged
+
+
+def report():
+    """Summary per view: histograms, means, slowest statements and likely N+1s"""
+    summary = {}
+    for name, view in sorted(collect().items()):
+        requests = view['requests'] or 1
+        slowest = {}
+        for statement in view['slowest']:
+            slowest[statement['sql']] = max(statement['ms'], slowest.get(statement['sql'], 0))
+        repeated = {}
+        for statement in view['repeated']:
+            seen = repeated.setdefault(statement['sql'], {'sql': statement['sql'], 'requests': 0, 'max_repeats': 0})
+            seen['requests'] += statement['requests']
+            seen['max_repeats'] = max(seen['max_repeats'], statement['max_repeats'])
+        summary[name] = {
+            'requests': view['requests'],
+            'mean_queries': round(sum(view['queries']) / requests, 1),
+            'max_queries': max(view['queries'], default=0),
+            'mean_db_ms': round(sum(view['db_ms']) / requests, 2),
+            'queries_histogram': histogram(view['queries'], QUERY_BUCKETS),
+            'db_ms_histogram': histogram(view['db_ms'], TIME_BUCKETS_MS),
+            'slowest': [
+                {'ms': ms, 'sql': sql}
+                for sql, ms in sorted(slowest.items(), key=lambda item: -item[1])[:SLOW_STATEMENTS]
+            ],
+            'repeated': sorted(repeated.values(), key=lambda seen: -seen['max_repeats']),
+        }
+    return summary
+
+
+def reset():
+    """Drop every published copy and this process's windows (other processes start again from theirs)"""
+    processes = cache.get(PROCESSES_KEY) or []
+    cache.delete_many([*processes, PROCESSES_KEY])
+    query_stats.reset()
@@ -0,0 +1,151 @@
+"""
+Process-local registries for small reference tables.
+
+``EmergencyType`` and ``UtilityType`` have a handful of rows that almost
+never change but are read on nearly every page. A registry loads the
+whole table once and serves lookups, form choices and related-object
+access from memory. Saves and deletes set a new generation token in the
+shared cache. Every process looks at the token at most every
+``CHECK_INTERVAL`` seconds and reloads its copy when it has moved, and
+reloads it after ``RELOAD_INTERVAL`` seconds whatever the token says, so
+a change the token missed (an eviction, a write without signals) is
+picked up too. A pk sent by a client that the copy lacks may be a row
+another worker just added, so forms reload a copy older than
+``MISS_RELOAD_INTERVAL`` before refusing it.
+"""
+
+import threading
+import time
+import uuid
+
+from django import forms
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+CHECK_INTERVAL = 1  # seconds between looks at the shared generation
+RELOAD_INTERVAL = 5 * 60
+MISS_RELOAD_INTERVAL = 5
+
+
+class ReferenceRegistry:
+
+    def __init__(self, model_label):
+        self.model_label = model_label
+        self.cache_key = f'registry:{model_label}:generation'
+        self.lock = threading.Lock()
+        self.rows = None
+        self.generation = None
+        self.loaded_at = self.checked_at = 0.0
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def invalidate(self):
+        """Called from ``post_save``/``post_delete`` receivers of the model"""
+        def renew():
+            # A fresh token rather than a counter: after an eviction a counter could come back to a value seen before
+            cache.set(self.cache_key, uuid.uuid4().hex, None)
+            with self.lock:
+                self.rows = None
+
+        # Again on commit, or a worker reloading in between would keep the old rows under the new token
+        renew()
+        transaction.on_commit(renew)
+
+    def _load(self, max_age=RELOAD_INTERVAL):
+        now = time.monotonic()
+        rows, generation = self.rows, self.generation
+        if rows is not None and now - self.checked_at >= CHECK_INTERVAL:
+            generation = cache.get(self.cache_key)
+            self.checked_at = now
+        if rows is None or generation != self.generation or now - self.loaded_at > max_age:
+            generation = cache.get(self.cache_key)
+            rows = {obj.pk: obj for obj in self.model.objects.order_by('pk')}
+            with self.lock:
+                self.rows, self.generation = rows, generation
+                self.loaded_at = self.checked_at = now
+        return rows
+
+    def all(self):
+        return list(self._load().values())
+
+    def get(self, pk):
+        return self._load().get(pk)
+
+    def find(self, pk):
+        """``get`` for a pk a client sent, which may be a row added since this copy was loaded"""
+        obj = self.get(pk)
+        if obj is None:
+            obj = self._load(max_age=MISS_RELOAD_INTERVAL).get(pk)
+        return obj
+
+    def attach(self, objects, field_name):
+        """
+        Fill the ``field_name`` foreign key of each object from the registry,
+        so templates can follow it without a query. Returns ``objects``.
+        """
+        rows = self._load()
+        for obj in objects:
+            field = obj._meta.get_field(field_name)
+            related = rows.get(getattr(obj, field.attname))
+            if related is not None:
+                field.set_cached_value(obj, related)
+        return objects
+
+
+class RegistryChoiceIterator(forms.models.ModelChoiceIterator):
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.registry.all():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.registry.all()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.registry.all())
+
+
+class RegistryChoiceField(forms.ModelChoiceField):
+    """``ModelChoiceField`` that renders and validates from a registry"""
+
+    iterator = RegistryChoiceIterator
+
+    def __init__(self, registry, **kwargs):
+        self.registry = registry
+        super().__init__(queryset=None, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            obj = self.registry.find(int(value))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+
+class RegistryFormMixin:
+    """
+    For model forms with ``RegistryChoiceField`` fields: the field has
+    already checked the row exists, so the model's own foreign key check
+    (one query per field) is skipped.
+    """
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        exclude.update(
+            name for name, field in self.fields.items() if isinstance(field, RegistryChoiceField)
+        )
+        return exclude
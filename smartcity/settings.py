@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per-view query counts, DB time, slow statements and N+1 fingerprints
+    'smartcity.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,10 +85,57 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent
+            # dispatches queue up (for up to ``timeout`` seconds) instead of
+            # failing with "database is locked" when a read turns into a write
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file rather than shared memory, so threaded tests see real locking
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+# Sessions, cached users, fragment versions, registry generations and
+# the other invalidation tokens only work if every worker process sees the
+# same cache, so a process-local backend is refused (see accounts.checks).
+# Deployments set REDIS_URL (Django's Redis backend needs the ``redis``
+# package); without it, workers on one host share a cache directory.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            # FileBasedCache that doesn't list the directory on every write
+            'BACKEND': 'smartcity.cache.FileCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'var' / 'cache'),
+            # Room for a version and a fragment per row on screen (smartcity.fragments)
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
+# Tests get a cache directory of their own, never the one above or Redis,
+# whose clear() would log every user out (see smartcity.testing)
+TEST_RUNNER = 'smartcity.testing.IsolatedCacheRunner'
+
+# Sessions and users are read from the cache and written through to the
+# database, so an authenticated request needs no queries to identify its
+# user (see accounts.backends)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
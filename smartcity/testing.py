@@ -0,0 +1,59 @@
+"""
+Helpers for tests that stand in for more than one worker process, and
+for keeping tests and benchmarks out of the cache the app itself uses.
+"""
+
+import multiprocessing
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+@contextmanager
+def isolated_cache():
+    """
+    A throwaway cache directory as the default cache for the duration.
+    It is file based, so forked processes share it like real workers do,
+    and clearing it touches nothing outside.
+    """
+    directory = tempfile.mkdtemp(prefix='smartcity-cache-')
+    try:
+        with override_settings(CACHES={
+            'default': {
+                'BACKEND': 'smartcity.cache.FileCache',
+                'LOCATION': directory,
+                'OPTIONS': {'MAX_ENTRIES': 20000},
+            },
+        }):
+            yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    """Test runner whose tests never see the deployment's cache"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache = isolated_cache()
+        self.cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
+
+
+def in_another_process(function, *args):
+    """
+    Run ``function(*args)`` in a forked process, the way another worker
+    would, and wait for it. Only the cache should be touched there: the
+    forked database connection belongs to the test's transaction.
+    """
+    process = multiprocessing.get_context('fork').Process(target=function, args=args)
+    process.start()
+    process.join()
+    if process.exitcode:
+        raise RuntimeError(f'{function.__name__} failed in the other process (exit code {process.exitcode})')
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
+from . import views
 
 urlpatterns = [
+    path('admin/query-stats/', views.query_stats, name='query_stats'),
+    path('admin/fragment-stats/', views.fragment_stats, name='fragment_stats'),
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('dashboard/', include('dashboard.urls')),
@@ -0,0 +1,288 @@
+"""
+Per-route latency, query and memory measurements.
+
+``ROUTES`` lists every page in the accounts, dashboard, emergency and
+utilities URLconfs together with the role that uses it and how to build
+its URL from seeded data. ``measure_routes`` requests each one through
+the test client and ``check_budgets`` compares the results against the
+budgets stored in ``BUDGETS_FILE``. The ``benchmark_views`` command runs
+this against generated databases of increasing size.
+"""
+
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.urls import get_resolver, reverse
+from django.utils.http import urlencode
+from .benchmarking import percentile
+
+BUDGETS_FILE = Path(settings.BASE_DIR) / 'benchmarks' / 'view_budgets.json'
+
+BENCHMARKED_APPS = ('accounts', 'dashboard', 'emergency', 'utilities')
+
+# The POST-only endpoints have their own benchmarks (``benchmark_dispatch``,
+# ``benchmark_telemetry``) or query-count tests (bulk complaint actions)
+UNBENCHMARKED = {
+    'emergency:dispatch_batch', 'emergency:telemetry', 'utilities:bulk_update',
+}
+
+
+class Route:
+    """One URL name, who requests it and the response it should get"""
+
+    def __init__(self, name, role=None, kwargs=None, status=200, fresh=None, query=None):
+        self.name = name
+        self.role = role
+        self.kwargs = kwargs or (lambda data: {})
+        self.status = status
+        # Query string parameters, for pages such as search that show nothing without them
+        self.query = query
+        # Called before every request for views that consume what they act on
+        self.fresh = fresh
+
+    def url(self, data, client):
+        if self.fresh:
+            self.fresh(data, client)
+        url = reverse(self.name, kwargs=self.kwargs(data))
+        return f'{url}?{urlencode(self.query(data))}' if self.query else url
+
+
+def _new_vehicle(data, client):
+    from emergency.models import EmergencyVehicle
+    data['vehicle'] = EmergencyVehicle.objects.create(
+        vehicle_type='ambulance', vehicle_number=f'BENCH-{time.perf_counter_ns() % 10 ** 12}',
+        driver_name='Bench Driver', driver_contact='9000000000',
+    )
+
+
+def _login_again(data, client):
+    client.force_login(data['users']['citizen'])
+
+
+ROUTES = [
+    Route('accounts:login'),
+    Route('accounts:register'),
+    Route('accounts:profile', 'citizen', status=302),
+    Route('accounts:logout', 'citizen', status=302, fresh=_login_again),
+
+    Route('dashboard:dashboard', 'citizen', status=302),
+    Route('dashboard:citizen', 'citizen'),
+    Route('dashboard:gov', 'government_authority'),
+    Route('dashboard:heatmap', 'government_authority',
+          query=lambda data: {'layer': 'complaint', 'zoom': 13, 'window': '30d'}),
+    Route('dashboard:export', 'government_authority',
+          query=lambda data: {'dataset': 'complaints', 'format': 'csv', 'gzip': 'on'}),
+    Route('dashboard:utility', 'utility_officer'),
+    Route('dashboard:emergency', 'emergency_operator'),
+    Route('dashboard:driver', 'vehicle_driver'),
+
+    Route('emergency:report_emergency', 'citizen'),
+    Route('emergency:my_requests', 'citizen'),
+    Route('emergency:my_requests_api', 'citizen'),
+    Route('emergency:detail', 'citizen', lambda data: {'request_id': data['emergency'].pk}),
+    Route('emergency:operator_dashboard', 'emergency_operator'),
+    Route('emergency:triage', 'emergency_operator'),
+    # Under the test client this is the polled JSON batch, not the stream
+    Route('emergency:operator_events', 'emergency_operator'),
+    Route('emergency:assign_vehicle', 'emergency_operator',
+          lambda data: {'emergency_id': data['pending_emergency'].pk}),
+    Route('emergency:update_dispatch_status', 'emergency_operator',
+          lambda data: {'dispatch_id': data['dispatch'].pk}),
+    Route('emergency:manage_vehicles', 'emergency_operator'),
+    Route('emergency:delete_vehicle', 'emergency_operator',
+          lambda data: {'vehicle_id': data['vehicle'].pk}, status=302, fresh=_new_vehicle),
+
+    Route('utilities:submit_complaint', 'citizen'),
+    Route('utilities:my_complaints', 'citizen'),
+    Route('utilities:my_complaints_api', 'citizen'),
+    Route('utilities:detail', 'citizen', lambda data: {'complaint_id': data['complaint'].complaint_id}),
+    Route('utilities:officer_dashboard', 'utility_officer'),
+    Route('utilities:search', 'utility_officer',
+          query=lambda data: {'q': data['complaint'].title.split()[0], 'status': 'pending'}),
+    Route('utilities:assign_complaint', 'utility_officer',
+          lambda data: {'complaint_id': data['pending_complaint'].pk}),
+    Route('utilities:update_complaint_status', 'utility_officer',
+          lambda data: {'complaint_id': data['assigned_complaint'].pk}),
+]
+
+
+def route_names():
+    """Every named URL of the benchmarked apps, as ``namespace:name``"""
+    names = set()
+    for pattern in get_resolver().url_patterns:
+        if getattr(pattern, 'namespace', None) in BENCHMARKED_APPS:
+            names.update(f'{pattern.namespace}:{child.name}' for child in pattern.url_patterns if child.name)
+    return names
+
+
+def seed_route_data():
+    """
+    Pick (or create) the users and rows the routes need from an already
+    populated database, preferring the busiest citizen and officer.
+    """
+    from django.db.models import Count
+    from accounts.models import User
+    from emergency.models import EmergencyRequest, EmergencyVehicle, DispatchRecord
+    from emergency.registry import emergency_types
+    from utilities.models import Complaint
+    from utilities.registry import utility_types
+
+    def user(role):
+        found = User.objects.filter(role=role).order_by('pk').first()
+        return found or User.objects.create_user(f'bench_{role}', password='bench', role=role)
+
+    # The filer of the newest complaint with a comment thread and the officer with the most assignments
+    threaded = Complaint.objects.filter(updates__isnull=False).order_by('-pk').select_related('citizen').first()
+    citizen = threaded.citizen if threaded else user('citizen')
+    officer = (
+        User.objects.filter(role='utility_officer')
+        .annotate(open=Count('assigned_complaints')).order_by('-open').first()
+    ) or user('utility_officer')
+    users = {
+        'citizen': citizen,
+        'utility_officer': officer,
+        'emergency_operator': user('emergency_operator'),
+        'government_authority': user('government_authority'),
+        'vehicle_driver': user('vehicle_driver'),
+    }
+
+    def complaint(**filters):
+        return Complaint.objects.filter(**filters).order_by('-pk').first() or Complaint.objects.create(**{
+            'citizen': citizen, 'utility_type': utility_types.all()[0], 'title': 'Benchmark',
+            'description': 'Benchmark', 'address': 'Benchmark Street', **filters,
+        })
+
+    def emergency(**filters):
+        return EmergencyRequest.objects.filter(**filters).order_by('-pk').first() or EmergencyRequest.objects.create(**{
+            'citizen': citizen, 'emergency_type': emergency_types.all()[0], 'description': 'Benchmark',
+            'address': 'Benchmark Street', 'contact_number': '9000000000', **filters,
+        })
+
+    data = {
+        'users': users,
+        'complaint': threaded or complaint(citizen=citizen),
+        'pending_complaint': complaint(status='pending', assigned_officer=None),
+        'assigned_complaint': complaint(assigned_officer=officer, status='in_progress'),
+        'emergency': emergency(citizen=citizen),
+        'pending_emergency': emergency(status='pending'),
+    }
+    if not EmergencyVehicle.objects.filter(driver=users['vehicle_driver']).exists():
+        _new_vehicle(data, None)
+        EmergencyVehicle.objects.filter(pk=data['vehicle'].pk).update(driver=users['vehicle_driver'])
+    data['dispatch'] = DispatchRecord.objects.order_by('-pk').first()
+    if data['dispatch'] is None:
+        _new_vehicle(data, None)
+        data['dispatch'] = DispatchRecord.objects.create(
+            emergency_request=data['emergency'], vehicle=data['vehicle'],
+            assigned_by=users['emergency_operator'],
+        )
+    return data
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that only counts, without the debug cursor's bookkeeping"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _consume(response):
+    """Read a streamed body the way a client would, so its queries, time and memory are measured"""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+        response.close()
+
+
+def measure_route(route, data, repeat=10):
+    """
+    Request ``route`` ``repeat`` times after one warm-up request.
+
+    Returns p50/p95 latency in milliseconds, the highest query count seen
+    and the peak Python memory allocated while serving one request.
+    """
+    client = Client()
+    if route.role:
+        client.force_login(data['users'][route.role])
+
+    timings, queries = [], 0
+    for attempt in range(repeat + 1):
+        url = route.url(data, client)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = client.get(url)
+            _consume(response)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != route.status:
+            raise AssertionError(f'{route.name} returned {response.status_code}, expected {route.status}')
+        if attempt:
+            timings.append(elapsed)
+            queries = max(queries, counter.count)
+
+    url = route.url(data, client)
+    tracemalloc.start()
+    try:
+        _consume(client.get(url))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': queries,
+        'memory_kb': round(peak / 1024, 1),
+    }
+
+
+def measure_routes(data, repeat=10, routes=ROUTES):
+    return {route.name: measure_route(route, data, repeat) for route in routes}
+
+
+def load_budgets(path=BUDGETS_FILE):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_budgets(results, path=BUDGETS_FILE, headroom=2.0):
+    """
+    Store budgets from ``results`` (worst case over every measured size).
+    Query counts are kept exact; latency and memory get ``headroom``.
+    """
+    budgets = {}
+    for measurements in results:
+        for name, measured in measurements.items():
+            budget = budgets.setdefault(name, {'queries': 0, 'p95_ms': 0.0, 'memory_kb': 0.0})
+            budget['queries'] = max(budget['queries'], measured['queries'])
+            budget['p95_ms'] = max(budget['p95_ms'], round(measured['p95_ms'] * headroom, 1))
+            budget['memory_kb'] = max(budget['memory_kb'], round(measured['memory_kb'] * headroom, 1))
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(dict(sorted(budgets.items())), indent=2) + '\n')
+    return budgets
+
+
+def check_budgets(measurements, budgets, metrics=('queries', 'p95_ms', 'memory_kb')):
+    """``(route, metric, measured, budget)`` for every metric over its budget"""
+    failures = []
+    for name, measured in measurements.items():
+        budget = budgets.get(name)
+        if budget is None:
+            failures.append((name, 'budget', None, None))
+            continue
+        for metric in metrics:
+            if measured[metric] > budget[metric]:
+                failures.append((name, metric, measured[metric], budget[metric]))
+    return failures
@@ -0,0 +1,19 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from . import fragments, querystats
+
+
+@staff_member_required
+def query_stats(request):
+    """Per-view query statistics from every process, for staff only"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        querystats.reset()
+    return JsonResponse(querystats.report(), json_dumps_params={'indent': 2})
+
+
+@staff_member_required
+def fragment_stats(request):
+    """Fragment cache hits and misses per template from every process, for staff only"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        fragments.reset()
+    return JsonResponse(fragments.report(), json_dumps_params={'indent': 2})
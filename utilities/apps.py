@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class UtilitiesConfig(AppConfig):
     name = 'utilities'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(signals.restore_search_triggers, sender=self)
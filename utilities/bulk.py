@@ -0,0 +1,107 @@
+"""
+Bulk officer actions on many complaints at once.
+
+After a storm an officer may claim or close hundreds of complaints. Each
+action here runs in one transaction: it locks and reads the selected
+complaints the officer may act on, changes them with a single UPDATE and
+adds their notes with one ``bulk_create``. The timestamps ``save()``
+would fill in are set the same way, only where they are still empty.
+Because ``QuerySet.update()`` sends no signals, everything the signals
+would do is done here: the transitions go through
+``dashboard.transitions`` (rollups, citizen counters and change versions,
+response-time sketches, fragment versions), and duplicates follow their
+parent and the incident index drops what closed.
+"""
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from dashboard.transitions import apply_transitions, fields
+from smartcity import fragments
+from .duplicates import follow, incident_index, OPEN_STATUSES
+from .models import Complaint, ComplaintUpdate
+
+MAX_COMPLAINTS = 500  # per action
+
+# status -> timestamp ``Complaint.save`` fills in the first time a complaint reaches it
+STATUS_TIMESTAMPS = {'assigned': 'assigned_at', 'resolved': 'resolved_at', 'escalated': 'escalated_at'}
+
+# What an officer may set: everything but going back to pending
+OFFICER_STATUSES = [(value, label) for value, label in Complaint.STATUS_CHOICES if value != 'pending']
+
+def _locked(queryset):
+    """The rows of ``queryset`` that ``apply_transitions`` reads, and ``duplicate_count``, locked"""
+    return list(
+        queryset.select_for_update().order_by('pk')
+        .values(*fields(Complaint), 'duplicate_count')
+    )
+
+
+def _transition(rows, status, now, **values):
+    """Move ``rows`` (as read by ``_locked``) to ``status`` and account for it"""
+    ids = [row['id'] for row in rows]
+    timestamp = STATUS_TIMESTAMPS.get(status)
+    if timestamp:
+        values[timestamp] = Coalesce(timestamp, Value(now))
+    Complaint.objects.filter(pk__in=ids).update(status=status, updated_at=now, **values)
+
+    new_rows = [{**row, 'status': status, 'updated_at': now} for row in rows]
+    if timestamp:
+        for row in new_rows:
+            row[timestamp] = row.get(timestamp) or now
+    apply_transitions(Complaint, rows, new_rows)
+    if status not in OPEN_STATUSES:
+        # No longer an incident new reports can be linked to
+        transaction.on_commit(lambda: [incident_index.remove(complaint_id) for complaint_id in ids])
+    parents = [row['id'] for row in rows if row['duplicate_count']]
+    if parents:
+        follow(Complaint.objects.filter(pk__in=parents))
+
+
+def _note(officer, ids, text):
+    if text:
+        ComplaintUpdate.objects.bulk_create(
+            [ComplaintUpdate(complaint_id=complaint_id, updated_by=officer, update_text=text) for complaint_id in ids],
+            batch_size=MAX_COMPLAINTS,
+        )
+
+
+def claim(officer, ids, note='', now=None):
+    """
+    Assign the pending, unclaimed ``ids`` to ``officer``; returns the ids
+    claimed. Duplicates are left alone: they follow their parent.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = _locked(Complaint.objects.filter(
+            pk__in=ids, status='pending', assigned_officer__isnull=True, parent__isnull=True,
+        ))
+        if not rows:
+            return []
+        _transition(rows, 'assigned', now, assigned_officer=officer)
+        claimed = [row['id'] for row in rows]
+        _note(officer, claimed, note)
+    return claimed
+
+
+def change_status(officer, ids, status, note='', now=None):
+    """Set ``status`` on the ``ids`` assigned to ``officer``; returns the ids changed"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = _locked(Complaint.objects.filter(pk__in=ids, assigned_officer=officer).exclude(status=status))
+        if not rows:
+            return []
+        _transition(rows, status, now)
+        changed = [row['id'] for row in rows]
+        _note(officer, changed, note)
+    return changed
+
+
+def add_note(officer, ids, note):
+    """Add the same note to each of the ``ids`` assigned to ``officer``; returns the ids noted"""
+    with transaction.atomic():
+        noted = list(Complaint.objects.filter(pk__in=ids, assigned_officer=officer).order_by('pk').values_list('id', flat=True))
+        _note(officer, noted, note)
+        fragments.bump(Complaint._meta.label_lower, noted)
+    return noted
@@ -0,0 +1,197 @@
+"""
+Duplicate complaint detection at submission.
+
+One burst main brings in hundreds of reports of the same thing. A new
+complaint with a location is checked against the open complaints of its
+utility type filed within ``DUPLICATE_WINDOW`` and no more than
+``DUPLICATE_RADIUS_KM`` away. If there is one, it is linked to it as its
+``parent`` instead of becoming a work item of its own:
+
+* it takes the parent's status and timestamps, and keeps following them
+  (``follow``), so its citizen sees the incident progress;
+* it stays off the officers' queues, which only list complaints without
+  a parent;
+* the parent's ``duplicate_count`` shows officers how many reports the
+  incident drew.
+
+Candidates come from ``IncidentIndex``, a grid per utility type of open
+complaints without a parent. The grid cells are larger than the radius,
+so a lookup reads a fixed block of cells around the point however many
+complaints the city has. Like the vehicle index, it is loaded on first
+use, kept current by the ``Complaint`` signals in ``utilities.signals``
+and rebuilt every ``REBUILD_INTERVAL`` seconds to pick up changes made by
+other processes. A candidate is re-read and locked before it is linked
+to, and its ``duplicate_count`` only changes with ``F()`` updates: saving
+a complaint writes the count back as whatever its row holds.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from dashboard.transitions import apply_transitions, fields
+from smartcity import fragments
+from smartcity.geo import GridIndex
+
+DUPLICATE_RADIUS_KM = 0.3
+DUPLICATE_WINDOW = timedelta(days=3)
+OPEN_STATUSES = ('pending', 'assigned', 'in_progress', 'escalated')
+REBUILD_INTERVAL = 30  # seconds
+
+# What a duplicate copies from its parent
+FOLLOWED_FIELDS = ('status', 'assigned_at', 'resolved_at', 'escalated_at', 'resolution_notes')
+
+
+def is_incident(complaint):
+    """Whether a complaint can take duplicates"""
+    return (
+        complaint.parent_id is None and complaint.status in OPEN_STATUSES
+        and complaint.location_lat is not None and complaint.location_lng is not None
+    )
+
+
+class IncidentIndex:
+    """Grid per utility type of open complaints without a parent, with their creation times"""
+
+    def __init__(self, cell_size=0.005):
+        self.cell_size = cell_size  # degrees, ~550 m of latitude
+        self.grids = {}
+        self.types = {}  # complaint id -> utility type id, to find its grid
+        self.lock = threading.Lock()
+        self.loaded_at = None
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > REBUILD_INTERVAL:
+            self.rebuild()
+
+    def rebuild(self):
+        """Reload the open incidents filed within ``DUPLICATE_WINDOW``"""
+        from .models import Complaint
+
+        rows = Complaint.objects.filter(
+            status__in=OPEN_STATUSES,
+            created_at__gte=timezone.now() - DUPLICATE_WINDOW,
+            parent__isnull=True,
+            location_lat__isnull=False,
+            location_lng__isnull=False,
+        ).values_list('id', 'utility_type_id', 'location_lat', 'location_lng', 'created_at')
+
+        grids, types = {}, {}
+        for complaint_id, type_id, lat, lng, created_at in rows.iterator():
+            grid = grids.get(type_id)
+            if grid is None:
+                grid = grids[type_id] = GridIndex(cell_size=self.cell_size)
+            grid.insert(complaint_id, lat, lng, created_at.timestamp())
+            types[complaint_id] = type_id
+        with self.lock:
+            self.grids, self.types = grids, types
+            self.loaded_at = time.monotonic()
+
+    def update(self, complaint):
+        """Add, move or drop a complaint after it was saved"""
+        if self.loaded_at is None:
+            return  # Nothing loaded yet; the first lookup will read fresh rows
+
+        with self.lock:
+            self._remove(complaint.id)
+            if is_incident(complaint):
+                grid = self.grids.get(complaint.utility_type_id)
+                if grid is None:
+                    grid = self.grids[complaint.utility_type_id] = GridIndex(cell_size=self.cell_size)
+                grid.insert(complaint.id, complaint.location_lat, complaint.location_lng, complaint.created_at.timestamp())
+                self.types[complaint.id] = complaint.utility_type_id
+
+    def remove(self, complaint_id):
+        with self.lock:
+            self._remove(complaint_id)
+
+    def _remove(self, complaint_id):
+        type_id = self.types.pop(complaint_id, None)
+        if type_id is not None:
+            self.grids[type_id].remove(complaint_id)
+
+    def find(self, utility_type_id, lat, lng, now=None):
+        """Ids of incidents of the type within the radius and window of a point, nearest first"""
+        self._ensure_loaded()
+        cutoff = ((now or timezone.now()) - DUPLICATE_WINDOW).timestamp()
+        with self.lock:
+            grid = self.grids.get(utility_type_id)
+            if grid is None:
+                return []
+            hits = grid.within(lat, lng, DUPLICATE_RADIUS_KM, predicate=lambda created: created >= cutoff)
+        return [complaint_id for _, complaint_id, _ in hits]
+
+
+incident_index = IncidentIndex()
+
+
+def find_parent(complaint):
+    """The open incident a new complaint duplicates, or None"""
+    from .models import Complaint
+
+    if complaint.location_lat is None or complaint.location_lng is None:
+        return None
+    candidates = incident_index.find(complaint.utility_type_id, complaint.location_lat, complaint.location_lng)
+    if not candidates:
+        return None
+    # The index may lag behind other processes; take the nearest that is still open
+    current = Complaint.objects.filter(
+        pk__in=candidates, status__in=OPEN_STATUSES, parent__isnull=True,
+    ).in_bulk()
+    for complaint_id in candidates:
+        if complaint_id in current:
+            return current[complaint_id]
+        incident_index.remove(complaint_id)
+    return None
+
+
+def submit(complaint):
+    """
+    Save a new complaint, linked to the incident it duplicates if there is
+    one; returns that parent or None.
+    """
+    from .models import Complaint
+
+    parent = find_parent(complaint)
+    with transaction.atomic():
+        if parent is not None:
+            # Locked until the duplicate is in, so the incident can't close in between
+            parent = Complaint.objects.select_for_update().filter(
+                pk=parent.pk, status__in=OPEN_STATUSES, parent__isnull=True,
+            ).first()
+        if parent is not None:
+            complaint.parent = parent
+            for field in FOLLOWED_FIELDS:
+                setattr(complaint, field, getattr(parent, field))
+        complaint.save()
+        if parent is not None:
+            Complaint.objects.filter(pk=parent.pk).update(duplicate_count=F('duplicate_count') + 1)
+            fragments.bump(Complaint._meta.label_lower, [parent.pk])
+    return parent
+
+
+def follow(parents):
+    """
+    Copy the status and timestamps of ``parents`` to their duplicates with
+    one UPDATE per parent that changed. ``parents`` are saved complaints
+    with duplicates; returns how many duplicates changed.
+    """
+    from .models import Complaint
+
+    changed = 0
+    with transaction.atomic():
+        for parent in parents:
+            values = {field: getattr(parent, field) for field in FOLLOWED_FIELDS}
+            behind = Complaint.objects.filter(parent=parent).exclude(**values)
+            rows = list(behind.values(*fields(Complaint)))
+            if not rows:
+                continue
+            now = timezone.now()
+            Complaint.objects.filter(pk__in=[row['id'] for row in rows]).update(updated_at=now, **values)
+            # QuerySet.update() sends no signals
+            apply_transitions(Complaint, rows, [{**row, **values, 'updated_at': now} for row in rows])
+            changed += len(rows)
+    return changed
@@ -0,0 +1,100 @@
+"""
+Escalation of complaints left unresolved past their SLA.
+
+How long a complaint may stay open depends on its utility type and
+priority: an ``EscalationRule`` for that type wins over a rule without a
+type, which wins over ``DEFAULT_SLA_HOURS``. Each sweep reads the overdue
+complaints of every (type, priority) pair as index range scans of
+``complaint_status_sla_idx`` and escalates them with one UPDATE and one
+bulk insert of notes, however many there are. Duplicates of another
+complaint are never escalated themselves; they follow their parent.
+
+The ``escalate_complaints`` command runs sweeps in a loop.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User
+from dashboard.transitions import apply_transitions, fields
+from .duplicates import follow
+from .models import Complaint, ComplaintUpdate, EscalationRule
+from .registry import utility_types
+
+DEFAULT_SLA_HOURS = {'high': 24, 'medium': 72, 'low': 168}
+
+ESCALATABLE_STATUSES = ['pending', 'assigned', 'in_progress']
+
+BATCH_SIZE = 1000
+
+
+def sla_hours():
+    """``{(utility_type_id, priority): hours}`` for every utility type"""
+    rules = {(rule.utility_type_id, rule.priority): rule.hours for rule in EscalationRule.objects.all()}
+    return {
+        (utility_type.id, priority): rules.get((utility_type.id, priority), rules.get((None, priority), DEFAULT_SLA_HOURS[priority]))
+        for utility_type in utility_types.all()
+        for priority, _ in Complaint.PRIORITY_CHOICES
+    }
+
+
+def overdue(now, limit=BATCH_SIZE, sla=None):
+    """
+    Up to ``limit`` open complaints past their SLA at ``now``, as rows of
+    ``dashboard.transitions.fields(Complaint)`` plus the ``hours`` they
+    had. They come in index order rather than oldest first; a sweep takes
+    them all anyway.
+    """
+    rows = []
+    for (type_id, priority), hours in (sla or sla_hours()).items():
+        if len(rows) >= limit:
+            break
+        late = (
+            Complaint.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=ESCALATABLE_STATUSES, utility_type_id=type_id, priority=priority,
+                created_at__lt=now - timedelta(hours=hours), parent__isnull=True,
+            )
+            .order_by()
+            .values(*fields(Complaint))[:limit - len(rows)]
+        )
+        rows.extend({**row, 'hours': hours} for row in late)
+    return rows
+
+
+def escalate(now=None, limit=BATCH_SIZE):
+    """
+    Escalate up to ``limit`` overdue complaints to the government
+    authorities and return how many were escalated. Like
+    ``Complaint.escalate_to_authority``, nothing happens while there is no
+    authority account to escalate to.
+    """
+    now = now or timezone.now()
+    authority = User.objects.filter(role='government_authority').order_by('pk').first()
+    if authority is None:
+        return 0
+    sla = sla_hours()
+
+    with transaction.atomic():
+        rows = overdue(now, limit, sla)
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        Complaint.objects.filter(pk__in=ids).update(
+            status='escalated', priority='high', escalated_at=now, updated_at=now,
+        )
+        # QuerySet.update() sends no signals
+        apply_transitions(Complaint, rows, [{**row, 'status': 'escalated', 'updated_at': now} for row in rows])
+        ComplaintUpdate.objects.bulk_create(
+            (
+                ComplaintUpdate(
+                    complaint_id=row['id'], updated_by=authority,
+                    update_text=f'Escalated automatically: still {row["status"].replace("_", " ")} after the {row["hours"]} hour resolution deadline.',
+                )
+                for row in rows
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        follow(Complaint.objects.filter(pk__in=ids, duplicate_count__gt=0))
+    return len(rows)
@@ -1,9 +1,20 @@
+from datetime import date
+
 from django import forms
+from smartcity.registry import RegistryChoiceField, RegistryFormMixin
+from .bulk import MAX_COMPLAINTS, OFFICER_STATUSES
 from .models import Complaint, UtilityType
+from .registry import utility_types
 
-class ComplaintForm(forms.ModelForm):
+class ComplaintForm(RegistryFormMixin, forms.ModelForm):
     """Form for citizens to submit utility complaints"""
     
+    # Choices and validation come from the in-memory registry, not a query
+    utility_type = RegistryChoiceField(
+        utility_types,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    
     class Meta:
         model = Complaint
         fields = [
@@ -21,7 +32,6 @@ class ComplaintForm(forms.ModelForm):
             'location_lat': forms.HiddenInput(),
             'location_lng': forms.HiddenInput(),
             'priority': forms.Select(attrs={'class': 'form-control'}),
-            'utility_type': forms.Select(attrs={'class': 'form-control'}),
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'address': forms.Textarea(attrs={'rows': 2, 'class': 'form-control'}),
             'landmark': forms.TextInput(attrs={'class': 'form-control'}),
@@ -43,4 +53,96 @@ class ComplaintForm(forms.ModelForm):
         if not address:
             self.add_error('address', 'Address is required.')
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class ComplaintSearchForm(forms.Form):
+    """Search box and filters of the complaint search page"""
+    
+    q = forms.CharField(
+        required=False,
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Search title, description, address, updates…'}),
+    )
+    status = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Any status')] + Complaint.STATUS_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    utility_type = RegistryChoiceField(
+        utility_types,
+        required=False,
+        empty_label='Any type',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    since = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    until = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    
+    # Searches run up to the start of the day after ``until``, which must exist
+    EARLIEST_DATE = date(1900, 1, 1)
+    LATEST_DATE = date(2999, 12, 31)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        for name in ('since', 'until'):
+            day = cleaned_data.get(name)
+            if day and not self.EARLIEST_DATE <= day <= self.LATEST_DATE:
+                self.add_error(name, f'Pick a date between {self.EARLIEST_DATE.year} and {self.LATEST_DATE.year}.')
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since > until:
+            self.add_error('until', 'The end date is before the start date.')
+        return cleaned_data
+
+
+class ComplaintIdsField(forms.Field):
+    """Ids of the ticked complaints; which of them may be changed is up to the action"""
+    
+    widget = forms.MultipleHiddenInput
+    
+    MAX_ID = 2 ** 63 - 1  # largest primary key a database integer column holds
+    
+    def to_python(self, value):
+        try:
+            ids = [int(pk) for pk in value or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Invalid complaint selection.')
+        if not all(0 < pk <= self.MAX_ID for pk in ids):
+            raise forms.ValidationError('Invalid complaint selection.')
+        return ids
+    
+    def validate(self, value):
+        if self.required and not value:
+            raise forms.ValidationError('Select at least one complaint.')
+
+
+class BulkComplaintForm(forms.Form):
+    """One action on the complaints ticked on the officer dashboard"""
+    
+    ACTIONS = [('claim', 'Assign to me'), ('status', 'Change status'), ('note', 'Add note')]
+    
+    action = forms.ChoiceField(choices=ACTIONS)
+    complaints = ComplaintIdsField()
+    status = forms.ChoiceField(
+        required=False,
+        choices=[('', 'New status…')] + OFFICER_STATUSES,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}),
+    )
+    notes = forms.CharField(
+        required=False,
+        max_length=2000,
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Note for every selected complaint'}),
+    )
+    
+    def clean_complaints(self):
+        complaints = self.cleaned_data['complaints']
+        if len(complaints) > MAX_COMPLAINTS:
+            raise forms.ValidationError(f'Select at most {MAX_COMPLAINTS} complaints at a time.')
+        return complaints
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == 'status' and not cleaned_data.get('status'):
+            self.add_error('status', 'Choose the new status.')
+        if action == 'note' and not cleaned_data.get('notes', '').strip():
+            self.add_error('notes', 'Write the note to add.')
+        return cleaned_data
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from accounts.models import User
+from smartcity.benchmarking import isolated_database
+from utilities.models import Complaint, UtilityType
+from utilities.sequences import reserve_complaint_ids
+
+
+class Command(BaseCommand):
+    help = 'Measure complaint insert throughput as the complaint table grows (uses a throwaway database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='0,100000,1000000,3000000',
+                            help='Comma separated table sizes to measure at')
+        parser.add_argument('--samples', type=int, default=1000,
+                            help='Complaints saved through Complaint.save() at each size')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows per bulk_create when growing the table')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+
+        with isolated_database():
+            citizen = User.objects.create_user(username='bench_citizen', password='bench', role='citizen')
+            water = UtilityType.objects.create(
+                name='Water Supply', description='Benchmark', department='Water Department', icon='tint'
+            )
+
+            self.stdout.write(f'{"rows":>12} {"inserts/s":>12} {"count() ms":>12}')
+            for size in sizes:
+                self.grow_table(citizen, water, size, options['batch_size'])
+                rate = self.measure_inserts(citizen, water, options['samples'])
+
+                # What the old ID scheme paid on every single insert
+                started = time.perf_counter()
+                Complaint.objects.count()
+                count_ms = (time.perf_counter() - started) * 1000
+
+                self.stdout.write(f'{Complaint.objects.count():>12} {rate:>12.0f} {count_ms:>12.2f}')
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark complete'))
+
+    def grow_table(self, citizen, utility_type, size, batch_size):
+        """Bulk insert filler complaints until the table holds ``size`` rows"""
+        missing = size - Complaint.objects.count()
+        while missing > 0:
+            batch = min(batch_size, missing)
+            ids = reserve_complaint_ids('FIL', batch)
+            Complaint.objects.bulk_create(
+                Complaint(
+                    citizen=citizen,
+                    utility_type=utility_type,
+                    complaint_id=complaint_id,
+                    title='Filler complaint',
+                    description='Benchmark filler row',
+                    address='Benchmark Street',
+                )
+                for complaint_id in ids
+            )
+            missing -= batch
+
+    def measure_inserts(self, citizen, utility_type, samples):
+        """Insert ``samples`` complaints one by one through the normal save path"""
+        started = time.perf_counter()
+        for _ in range(samples):
+            Complaint(
+                citizen=citizen,
+                utility_type=utility_type,
+                title='Benchmark complaint',
+                description='Benchmark row',
+                address='Benchmark Street',
+            ).save()
+        return samples / (time.perf_counter() - started)
@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from smartcity.benchmarking import isolated_database, percentile
+from utilities.models import Complaint
+from utilities.registry import utility_types
+from utilities.search import search
+
+
+class Command(BaseCommand):
+    help = 'Measure complaint search latency on a generated city (uses a throwaway database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.01, help='generate_city_data scale to measure at')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            started = time.perf_counter()
+            call_command('generate_city_data', scale=options['scale'], stdout=StringIO())
+            self.stdout.write(f'City generated and indexed in {time.perf_counter() - started:.1f}s '
+                              f'({Complaint.objects.count():,} complaints)\n')
+
+            sample = Complaint.objects.order_by('-pk').first()
+            water = next(utility_type for utility_type in utility_types.all() if utility_type.name == 'Water Supply')
+            month_ago = timezone.now() - timedelta(days=30)
+            queries = [
+                ('one common word', 'water', {}),
+                ('common word, filtered', 'water', {'status': 'pending', 'since': month_ago}),
+                ('two words', 'pressure church', {}),
+                ('prefix', 'spare par*', {}),
+                ('update text, one type', 'crew dispatched', {'utility_type': water.pk}),
+                ('street address', sample.address, {}),
+                ('second page', 'road', {'offset': 25}),
+                ('no match', 'earthquake', {}),
+            ]
+
+            self.stdout.write(f'{"query":<26} {"results":>8} {"p50 ms":>8} {"p95 ms":>8}')
+            for label, text, filters in queries:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    results = search(text, **filters)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'{label:<26} {len(results):>8} {percentile(timings, 50):>8.2f} {percentile(timings, 95):>8.2f}'
+                )
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark complete'))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from utilities.escalation import BATCH_SIZE, escalate
+
+
+class Command(BaseCommand):
+    help = 'Escalate complaints left unresolved past their SLA, every --interval seconds until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Complaints escalated per transaction')
+        parser.add_argument('--once', action='store_true', help='Run a single sweep and exit')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.monotonic()
+                escalated = self.sweep(options['batch_size'])
+                elapsed = time.monotonic() - started
+                if escalated or options['once']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'⬆️  Escalated {escalated} complaint(s) in {elapsed * 1000:.0f} ms'
+                    ))
+                if options['once']:
+                    return
+                time.sleep(max(options['interval'] - elapsed, 0))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⚠️  Escalation stopped'))
+
+    def sweep(self, batch_size):
+        """Escalate in batches until nothing overdue is left"""
+        total = 0
+        while True:
+            escalated = escalate(limit=batch_size)
+            total += escalated
+            if escalated < batch_size:
+                return total
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0003_complaintsequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['assigned_officer', 'status', '-created_at'], name='complaint_officer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['assigned_officer', 'status', 'resolved_at'], name='complaint_officer_resolved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['citizen', '-created_at'], name='complaint_citizen_created_idx'),
+        ),
+    ]
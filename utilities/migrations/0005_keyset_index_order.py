@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0004_dashboard_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='complaint',
+            name='complaint_officer_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='complaint',
+            name='complaint_citizen_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['assigned_officer', 'status', 'created_at'], name='complaint_officer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['citizen', 'created_at'], name='complaint_citizen_created_idx'),
+        ),
+    ]
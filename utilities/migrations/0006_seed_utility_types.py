@@ -0,0 +1,30 @@
+from django.db import migrations
+
+DEFAULT_TYPES = [
+    ('Water Supply', 'Water supply issues including leaks, low pressure, contamination', 'Water Department', 'tint'),
+    ('Electricity', 'Power outages, electrical faults, billing issues', 'Electricity Board', 'bolt'),
+    ('Garbage Management', 'Garbage collection, waste disposal, cleanliness issues', 'Municipal Corporation', 'trash'),
+    ('Road Maintenance', 'Potholes, road damage, street lighting issues', 'Public Works', 'road'),
+]
+
+
+def seed_utility_types(apps, schema_editor):
+    """Default types, previously created on the first complaint form view"""
+    UtilityType = apps.get_model('utilities', 'UtilityType')
+    if UtilityType.objects.exists():
+        return
+    UtilityType.objects.bulk_create(
+        UtilityType(name=name, description=description, department=department, icon=icon)
+        for name, description, department, icon in DEFAULT_TYPES
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0005_keyset_index_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_utility_types, migrations.RunPython.noop),
+    ]
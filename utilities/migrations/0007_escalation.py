@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0006_seed_utility_types'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscalationRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.CharField(choices=[('high', 'High'), ('medium', 'Medium'), ('low', 'Low')], max_length=20)),
+                ('hours', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', 'utility_type', 'priority', 'created_at'], name='complaint_status_sla_idx'),
+        ),
+        migrations.AddField(
+            model_name='escalationrule',
+            name='utility_type',
+            field=models.ForeignKey(blank=True, help_text='Leave empty for a rule that applies to every utility type', null=True, on_delete=django.db.models.deletion.CASCADE, to='utilities.utilitytype'),
+        ),
+        migrations.AddConstraint(
+            model_name='escalationrule',
+            constraint=models.UniqueConstraint(fields=('utility_type', 'priority'), name='escalation_rule_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='escalationrule',
+            constraint=models.UniqueConstraint(condition=models.Q(('utility_type__isnull', True)), fields=('priority',), name='escalation_default_rule_unique'),
+        ),
+    ]
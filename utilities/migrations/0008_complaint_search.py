@@ -0,0 +1,94 @@
+from django.db import migrations
+
+# The index as this migration creates it, frozen here so later changes to
+# utilities.search can't change what an old migration does
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS utilities_complaint_fts USING fts5(
+        title, description, address, landmark, updates,
+        tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+
+    """CREATE TRIGGER IF NOT EXISTS utilities_complaint_fts_insert AFTER INSERT ON utilities_complaint BEGIN
+        INSERT INTO utilities_complaint_fts(rowid, title, description, address, landmark, updates)
+        VALUES (new.id, new.title, new.description, new.address, new.landmark, '');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS utilities_complaint_fts_update
+    AFTER UPDATE OF title, description, address, landmark ON utilities_complaint
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description
+      OR old.address IS NOT new.address OR old.landmark IS NOT new.landmark BEGIN
+        UPDATE utilities_complaint_fts SET title = new.title, description = new.description,
+                                           address = new.address, landmark = new.landmark
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS utilities_complaint_fts_delete AFTER DELETE ON utilities_complaint BEGIN
+        DELETE FROM utilities_complaint_fts WHERE rowid = old.id;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS utilities_complaintupdate_fts_insert AFTER INSERT ON utilities_complaintupdate BEGIN
+        UPDATE utilities_complaint_fts SET updates = updates || ' ' || new.update_text WHERE rowid = new.complaint_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS utilities_complaintupdate_fts_update
+    AFTER UPDATE OF update_text, complaint_id ON utilities_complaintupdate
+    WHEN old.update_text IS NOT new.update_text OR old.complaint_id IS NOT new.complaint_id BEGIN
+        UPDATE utilities_complaint_fts SET updates = coalesce((SELECT group_concat(update_text, ' ')
+            FROM utilities_complaintupdate WHERE complaint_id = old.complaint_id), '') WHERE rowid = old.complaint_id;
+        UPDATE utilities_complaint_fts SET updates = coalesce((SELECT group_concat(update_text, ' ')
+            FROM utilities_complaintupdate WHERE complaint_id = new.complaint_id), '') WHERE rowid = new.complaint_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS utilities_complaintupdate_fts_delete AFTER DELETE ON utilities_complaintupdate BEGIN
+        UPDATE utilities_complaint_fts SET updates = coalesce((SELECT group_concat(update_text, ' ')
+            FROM utilities_complaintupdate WHERE complaint_id = old.complaint_id), '') WHERE rowid = old.complaint_id;
+    END""",
+]
+
+TRIGGERS = [
+    'utilities_complaint_fts_insert', 'utilities_complaint_fts_update', 'utilities_complaint_fts_delete',
+    'utilities_complaintupdate_fts_insert', 'utilities_complaintupdate_fts_update',
+    'utilities_complaintupdate_fts_delete',
+]
+
+POPULATE_SQL = """
+    INSERT INTO utilities_complaint_fts(rowid, title, description, address, landmark, updates)
+    SELECT c.id, c.title, c.description, c.address, c.landmark,
+           coalesce((SELECT group_concat(update_text, ' ') FROM utilities_complaintupdate WHERE complaint_id = c.id), '')
+    FROM utilities_complaint c
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 index over complaints and their updates, filled from the existing rows (SQLite with FTS5 only)"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pragma_compile_options WHERE compile_options = 'ENABLE_FTS5'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'utilities_complaint_fts'")
+        created = cursor.fetchone() is None
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        if created:
+            cursor.execute(POPULATE_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute('DROP TABLE IF EXISTS utilities_complaint_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0007_escalation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0008_complaint_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='duplicate_count',
+            field=models.PositiveIntegerField(default=0, help_text='Duplicates linked to this complaint'),
+        ),
+        migrations.AddField(
+            model_name='complaint',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Open complaint this one was filed as a duplicate of', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='utilities.complaint'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+from django.db import migrations
+import utilities.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utilities', '0010_heatmap_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='complaint',
+            name='duplicate_count',
+            field=utilities.models.DuplicateCountField(default=0, help_text='Duplicates linked to this complaint'),
+        ),
+    ]
@@ -1,6 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from accounts.models import User
+from .registry import utility_types
+
+class DuplicateCountField(models.PositiveIntegerField):
+    """A count that only moves with ``F()`` updates: saving an existing row writes it back as itself"""
+
+    def pre_save(self, model_instance, add):
+        # An update keeps whatever the row holds, so a copy loaded before the last
+        # duplicate arrived can't write an older count back. A save that finds its
+        # row deleted inserts it again, with the count this copy has
+        if add:
+            return super().pre_save(model_instance, add)
+        return F(self.attname)
 
 class UtilityType(models.Model):
     """Types of utility issues (water, electricity, garbage, etc.)"""
@@ -64,6 +77,17 @@ class Complaint(models.Model):
         limit_choices_to={'role': 'utility_officer'}
     )
     
+    # Duplicate reports of one incident follow its first report
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates',
+        help_text="Open complaint this one was filed as a duplicate of",
+    )
+    duplicate_count = DuplicateCountField(default=0, help_text="Duplicates linked to this complaint")
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -80,15 +104,31 @@ class Complaint(models.Model):
         help_text="Rate 1-5 after resolution"
     )
     
+    class Meta:
+        indexes = [
+            # created_at is ascending so a backwards scan yields (created_at, id) DESC for keyset pages
+            # Officer dashboard: their open complaints, unclaimed ones (assigned_officer IS NULL)
+            # and what they resolved today
+            models.Index(fields=['assigned_officer', 'status', 'created_at'], name='complaint_officer_status_idx'),
+            models.Index(fields=['assigned_officer', 'status', 'resolved_at'], name='complaint_officer_resolved_idx'),
+            # Citizen's own complaints
+            models.Index(fields=['citizen', 'created_at'], name='complaint_citizen_created_idx'),
+            # Escalation sweep: open complaints of one type and priority created before a cutoff.
+            # Not a partial index on the open statuses: SQLite can't match one against bound parameters
+            models.Index(fields=['status', 'utility_type', 'priority', 'created_at'], name='complaint_status_sla_idx'),
+            # Heatmap snapshots re-read what changed since their last refresh
+            models.Index(fields=['updated_at'], name='complaint_updated_idx'),
+        ]
+    
     def __str__(self):
         return f"Complaint {self.complaint_id} - {self.title}"
     
     def save(self, *args, **kwargs):
-        # Generate complaint ID if not exists
+        # Generate complaint ID if not exists (numbers come from a per-prefix sequence)
         if not self.complaint_id:
-            prefix = self.utility_type.name[:3].upper()
-            count = Complaint.objects.count() + 1
-            self.complaint_id = f"{prefix}-{count:06d}"
+            from .sequences import next_complaint_id
+            utility_type = utility_types.get(self.utility_type_id) or self.utility_type
+            self.complaint_id = next_complaint_id(utility_type.name[:3].upper())
         
         # Update timestamps
         if self.status == 'assigned' and not self.assigned_at:
@@ -98,7 +138,9 @@ class Complaint(models.Model):
         if self.status == 'escalated' and not self.escalated_at:
             self.escalated_at = timezone.now()
         
-        super().save(*args, **kwargs)
+        # post_save receivers (the citizen's counters) commit or roll back with the row
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
     
     def escalate_to_authority(self):
         """Escalate unresolved complaint to government authority"""
@@ -121,4 +163,39 @@ class ComplaintUpdate(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Update for {self.complaint.complaint_id}"
\ No newline at end of file
+        return f"Update for {self.complaint.complaint_id}"
+
+
+class EscalationRule(models.Model):
+    """Hours a complaint may stay unresolved before it is escalated"""
+    utility_type = models.ForeignKey(
+        UtilityType,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        help_text="Leave empty for a rule that applies to every utility type",
+    )
+    priority = models.CharField(max_length=20, choices=Complaint.PRIORITY_CHOICES)
+    hours = models.PositiveIntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['utility_type', 'priority'], name='escalation_rule_unique'),
+            # NULLs never collide in the constraint above
+            models.UniqueConstraint(
+                fields=['priority'], condition=models.Q(utility_type__isnull=True), name='escalation_default_rule_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        utility_type = utility_types.get(self.utility_type_id) if self.utility_type_id else None
+        return f"{utility_type or 'Any type'} / {self.priority}: {self.hours}h"
+
+
+class ComplaintSequence(models.Model):
+    """Next unreserved complaint number for each complaint ID prefix"""
+    prefix = models.CharField(max_length=10, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.prefix} -> {self.next_value}"
\ No newline at end of file
@@ -0,0 +1,5 @@
+"""In-memory copy of the utility type table (see ``smartcity.registry``)"""
+
+from smartcity.registry import ReferenceRegistry
+
+utility_types = ReferenceRegistry('utilities.UtilityType')
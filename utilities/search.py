@@ -0,0 +1,294 @@
+"""
+Full-text search over complaints.
+
+On SQLite the ``utilities_complaint_fts`` FTS5 table holds one document
+per complaint, keyed by the complaint's id: its title, description,
+address, landmark and the text of every update posted on it. Triggers on
+both tables keep it in step. They run inside the writing statement, so
+``bulk_create``, ``QuerySet.update()`` and raw SQL are covered as well as
+``save()``, and nothing has to be rebuilt after a bulk load.
+``rebuild()`` is there for repairs.
+
+Migration ``0008_complaint_search`` creates the table and triggers from its
+own copy of the schema. ``install()`` runs after every ``migrate`` to put
+back the triggers: SQLite drops a table's triggers when a later migration
+rebuilds the table to alter it.
+
+A search reads the newest ``RANK_WINDOW`` matches that pass the status,
+utility type and date filters, in the order the index stores them, with
+every match highlighted. They are ranked here by BM25 (a title match
+weighs most, an update least) and only the page asked for is loaded.
+SQLite's own ``bm25()`` is not used: it counts every row holding each
+word first, which takes longer the larger the table. Reading a window
+costs the same at millions of complaints, whether the words are common
+or rare; older matches are found by narrowing the dates, and results say
+when the window filled up (``Results.truncated``) so the page can tell the
+user. Filters are
+checked while the matches are read, so one that few of them pass makes
+the window slower to fill.
+
+``search()`` hides which backend answers. Databases without FTS5 fall
+back to unranked substring matching, newest first.
+"""
+
+import re
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+from .models import Complaint
+
+FTS_TABLE = 'utilities_complaint_fts'
+COLUMNS = ('title', 'description', 'address', 'landmark', 'updates')
+WEIGHTS = (10.0, 4.0, 2.0, 2.0, 1.0)  # a title match weighs most, an update least
+BM25_K1, BM25_B = 1.2, 0.75
+MAX_TERMS = 8
+RANK_WINDOW = 500  # newest matches ranked per search
+SNIPPET_TOKENS = 16
+
+# Markers snippet() puts around matched words; swapped for <mark> after escaping
+_OPEN, _CLOSE = '\x02', '\x03'
+
+
+class Results(list):
+    """Complaints found by ``search()``; ``truncated`` if older matches were left out of the ranking"""
+    truncated = False
+
+
+def terms(text):
+    """
+    ``(word, prefix)`` pairs of a search box entry, at most ``MAX_TERMS``;
+    a word typed with a trailing ``*`` is a prefix.
+    """
+    return [(word, bool(star)) for word, star in re.findall(r'(\w+)(\*?)', text.lower())][:MAX_TERMS]
+
+
+def match_expression(text):
+    """
+    FTS5 query for ``text``: every word must occur. Each word is quoted, so
+    user input can never be read as FTS5 syntax. '' if there are no words.
+
+    Words match their stem ("leaking" finds "leaks"). Prefixes are opt-in:
+    FTS5 merges the whole list of rows of every word a prefix covers before
+    it can skip to the ones being ranked, which makes them the slow kind of
+    query on a large table.
+    """
+    return ' '.join(f'"{word}"*' if prefix else f'"{word}"' for word, prefix in terms(text))
+
+
+def highlight(snippet):
+    """Escape a snippet and mark the words that matched"""
+    return mark_safe(escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+@lru_cache(maxsize=None)
+def fts_available(vendor):
+    """Whether the index exists on the default database (checked once per process)"""
+    if vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _score(matches, lengths, average_lengths):
+    """
+    BM25 of one row from the matches and length (in words) of each column:
+    each match raises the score less than the one before, matches in short
+    text count for more and ``WEIGHTS`` scale the columns. No frequency
+    across the table goes in; it would only weigh the words of an
+    all-words search against each other.
+    """
+    score = 0.0
+    for count, length, average, weight in zip(matches, lengths, average_lengths, WEIGHTS):
+        if count:
+            score += weight * count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+    return score
+
+
+def _snippet(columns):
+    """A few words around the first match outside the title (which is shown anyway)"""
+    for text in columns[1:]:
+        words = text.split()
+        first = next((i for i, word in enumerate(words) if _OPEN in word), None)
+        if first is not None:
+            start = max(first - SNIPPET_TOKENS // 3, 0)
+            shown = words[start:start + SNIPPET_TOKENS]
+            return highlight(('… ' if start else '') + ' '.join(shown) + (' …' if start + SNIPPET_TOKENS < len(words) else ''))
+    return escape(Truncator(columns[1]).words(SNIPPET_TOKENS))
+
+
+def _fts_search(text, status, utility_type, since, until, limit, offset):
+    conditions, params = [], []
+    for condition, value in (('c.status = %s', status), ('c.utility_type_id = %s', utility_type),
+                             ('c.created_at >= %s', since), ('c.created_at < %s', until)):
+        if value:
+            conditions.append(condition)
+            params.append(connection.ops.adapt_datetimefield_value(value) if 'created_at' in condition else value)
+    where = ''.join(f' AND {condition}' for condition in conditions)
+    highlighted = ', '.join(f'highlight({FTS_TABLE}, {column}, char(2), char(3))' for column in range(len(COLUMNS)))
+    with connection.cursor() as cursor:
+        # CROSS JOIN has the index drive the join: it reads matches newest
+        # first without sorting and stops once the window is full
+        cursor.execute(
+            f'SELECT {FTS_TABLE}.rowid, {highlighted} '
+            f'FROM {FTS_TABLE} CROSS JOIN {Complaint._meta.db_table} c ON c.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s{where} ORDER BY {FTS_TABLE}.rowid DESC LIMIT {RANK_WINDOW}',
+            [match_expression(text), *params],
+        )
+        window = {row[0]: row[1:] for row in cursor.fetchall()}
+    results = Results()
+    results.truncated = len(window) >= RANK_WINDOW
+    if not window:
+        return results
+
+    lengths = {pk: [len(text.split()) for text in columns] for pk, columns in window.items()}
+    average_lengths = [max(sum(column) / len(window), 1) for column in zip(*lengths.values())]
+    scores = {
+        pk: _score([text.count(_OPEN) for text in columns], lengths[pk], average_lengths)
+        for pk, columns in window.items()
+    }
+    # Newer first among equals
+    page = sorted(scores, key=lambda pk: (scores[pk], pk), reverse=True)[offset:offset + limit]
+    complaints = Complaint.objects.in_bulk(page)
+    for pk in page:
+        complaint = complaints[pk]
+        complaint.score = round(scores[pk], 3)
+        complaint.snippet = _snippet(window[pk])
+        results.append(complaint)
+    return results
+
+
+def _contains_search(text, status, utility_type, since, until, limit, offset):
+    queryset = Complaint.objects.all()
+    for word, _ in terms(text):
+        queryset = queryset.filter(
+            Q(title__icontains=word) | Q(description__icontains=word) | Q(address__icontains=word)
+            | Q(landmark__icontains=word) | Q(updates__update_text__icontains=word)
+        )
+    filters = {'status': status, 'utility_type_id': utility_type, 'created_at__gte': since, 'created_at__lt': until}
+    queryset = queryset.filter(**{lookup: value for lookup, value in filters.items() if value})
+    results = Results(queryset.distinct().order_by('-created_at', '-id')[offset:offset + limit])
+    for complaint in results:
+        complaint.snippet = escape(complaint.description[:200])
+        complaint.score = None
+    return results
+
+
+def search(text, status=None, utility_type=None, since=None, until=None, limit=25, offset=0):
+    """
+    Complaints matching every word of ``text``, best match first among the
+    newest ``RANK_WINDOW``, each with its ``score`` and a highlighted
+    ``snippet``, as ``Results``. ``utility_type`` is a type id;
+    ``since`` and ``until`` bound ``created_at`` (until is exclusive).
+    """
+    if not terms(text):
+        return Results()
+    backend = _fts_search if fts_available(connection.vendor) else _contains_search
+    return backend(text, status, utility_type, since, until, limit, offset)
+
+
+def rebuild():
+    """Refill the index from the complaint and update tables; returns how many complaints it holds"""
+    if not fts_available(connection.vendor):
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(POPULATE_SQL)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+# Schema
+
+# Recomputes the update text of one complaint (``{id}`` is old or new.complaint_id)
+_UPDATES_OF = (
+    "coalesce((SELECT group_concat(update_text, ' ') FROM utilities_complaintupdate WHERE complaint_id = {id}), '')"
+)
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, address, landmark, updates,
+        tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS utilities_complaint_fts_insert AFTER INSERT ON utilities_complaint BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, address, landmark, updates)
+        VALUES (new.id, new.title, new.description, new.address, new.landmark, '');
+    END""",
+    # save() writes every column; only a changed text is worth re-indexing
+    f"""CREATE TRIGGER IF NOT EXISTS utilities_complaint_fts_update
+    AFTER UPDATE OF title, description, address, landmark ON utilities_complaint
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description
+      OR old.address IS NOT new.address OR old.landmark IS NOT new.landmark BEGIN
+        UPDATE {FTS_TABLE} SET title = new.title, description = new.description,
+                               address = new.address, landmark = new.landmark
+        WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS utilities_complaint_fts_delete AFTER DELETE ON utilities_complaint BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS utilities_complaintupdate_fts_insert AFTER INSERT ON utilities_complaintupdate BEGIN
+        UPDATE {FTS_TABLE} SET updates = updates || ' ' || new.update_text WHERE rowid = new.complaint_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS utilities_complaintupdate_fts_update
+    AFTER UPDATE OF update_text, complaint_id ON utilities_complaintupdate
+    WHEN old.update_text IS NOT new.update_text OR old.complaint_id IS NOT new.complaint_id BEGIN
+        UPDATE {FTS_TABLE} SET updates = {_UPDATES_OF.format(id='old.complaint_id')} WHERE rowid = old.complaint_id;
+        UPDATE {FTS_TABLE} SET updates = {_UPDATES_OF.format(id='new.complaint_id')} WHERE rowid = new.complaint_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS utilities_complaintupdate_fts_delete AFTER DELETE ON utilities_complaintupdate BEGIN
+        UPDATE {FTS_TABLE} SET updates = {_UPDATES_OF.format(id='old.complaint_id')} WHERE rowid = old.complaint_id;
+    END""",
+]
+
+TRIGGERS = [
+    'utilities_complaint_fts_insert', 'utilities_complaint_fts_update', 'utilities_complaint_fts_delete',
+    'utilities_complaintupdate_fts_insert', 'utilities_complaintupdate_fts_update',
+    'utilities_complaintupdate_fts_delete',
+]
+
+POPULATE_SQL = f"""
+    INSERT INTO {FTS_TABLE}(rowid, title, description, address, landmark, updates)
+    SELECT c.id, c.title, c.description, c.address, c.landmark, {_UPDATES_OF.format(id='c.id')}
+    FROM utilities_complaint c
+"""
+
+
+def install(connection, create=True):
+    """
+    Create the index and its triggers on ``connection`` where missing;
+    False if it is not SQLite or SQLite was built without FTS5. With
+    ``create=False`` only the triggers of an existing index are restored.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pragma_compile_options WHERE compile_options = 'ENABLE_FTS5'")
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        created = cursor.fetchone() is None
+        if created and not create:
+            return False
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        if created:
+            cursor.execute(POPULATE_SQL)
+    fts_available.cache_clear()
+    return True
+
+
+def uninstall(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    fts_available.cache_clear()
@@ -0,0 +1,113 @@
+"""
+Complaint ID allocation.
+
+Each prefix ("WAT", "ELE", ...) has a row in ``ComplaintSequence`` holding
+the next unreserved number. A worker process reserves numbers in blocks
+with a single conditional ``UPDATE`` and then hands them out from memory,
+so generating an ID is O(1) and two writers can never get the same number.
+
+Numbers left in a block when a process exits, or when the transaction
+that took a number from it rolls back, are simply skipped, so IDs are
+unique and increasing per process but not gap-free.
+"""
+
+import os
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+
+BLOCK_SIZE = 50
+
+
+def format_complaint_id(prefix, value):
+    return f"{prefix}-{value:06d}"
+
+
+def _initial_value(prefix):
+    """First number for a prefix that has no sequence row yet"""
+    from .models import Complaint
+
+    # Continue after any IDs issued before the sequence table existed
+    last_id = Complaint.objects.filter(
+        complaint_id__startswith=f"{prefix}-"
+    ).order_by(Length('complaint_id').desc(), '-complaint_id').values_list('complaint_id', flat=True).first()
+
+    if last_id:
+        try:
+            return int(last_id.rsplit('-', 1)[1]) + 1
+        except ValueError:
+            pass
+    return 1
+
+
+def reserve_block(prefix, size):
+    """
+    Reserve ``size`` consecutive numbers for ``prefix`` and return the first.
+    """
+    from .models import ComplaintSequence
+
+    with transaction.atomic():
+        updated = ComplaintSequence.objects.filter(prefix=prefix).update(next_value=F('next_value') + size)
+        if not updated:
+            start = _initial_value(prefix)
+            try:
+                with transaction.atomic():
+                    ComplaintSequence.objects.create(prefix=prefix, next_value=start + size)
+                return start
+            except IntegrityError:
+                # Another writer created the row first
+                ComplaintSequence.objects.filter(prefix=prefix).update(next_value=F('next_value') + size)
+        return ComplaintSequence.objects.get(prefix=prefix).next_value - size
+
+
+class SequenceAllocator:
+    """Hands out reserved numbers from per-prefix in-memory blocks"""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks = {}
+        self.lock = threading.RLock()
+        self.pid = os.getpid()
+
+    def next_value(self, prefix):
+        with self.lock:
+            if os.getpid() != self.pid:
+                # Forked worker: blocks belong to the parent process
+                self.blocks = {}
+                self.pid = os.getpid()
+
+            block = self.blocks.pop(prefix, None)
+            if block is None:
+                start = reserve_block(prefix, self.block_size)
+                block = (start, start + self.block_size)
+
+            value, end = block
+            if value + 1 < end:
+                remainder = (value + 1, end)
+                # Only keep the rest of the block once the caller's transaction
+                # commits, so a block reserved in a transaction that rolls back
+                # isn't handed out after its UPDATE is undone. A rollback drops
+                # the rest of the block either way: numbers reserved in an
+                # earlier transaction are never handed out, and gaps like
+                # that are expected.
+                transaction.on_commit(lambda: self._keep(prefix, remainder))
+            return value
+
+    def _keep(self, prefix, block):
+        with self.lock:
+            self.blocks.setdefault(prefix, block)
+
+
+allocator = SequenceAllocator()
+
+
+def next_complaint_id(prefix):
+    return format_complaint_id(prefix, allocator.next_value(prefix))
+
+
+def reserve_complaint_ids(prefix, count):
+    """Reserve ``count`` IDs in one round trip, e.g. for ``bulk_create``"""
+    start = reserve_block(prefix, count)
+    return [format_complaint_id(prefix, value) for value in range(start, start + count)]
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from smartcity import fragments
+from .duplicates import follow, incident_index
+from .models import Complaint, ComplaintUpdate, UtilityType
+from .registry import utility_types
+
+
+@receiver(post_save, sender=UtilityType)
+@receiver(post_delete, sender=UtilityType)
+def utility_type_changed(sender, **kwargs):
+    """Every process reloads its registry copy on the next lookup"""
+    utility_types.invalidate()
+    fragments.bump(sender._meta.label_lower, [fragments.ALL])
+
+
+@receiver(post_save, sender=Complaint)
+def complaint_saved(sender, instance, **kwargs):
+    """Keep the incident index current and carry the complaint's progress to its duplicates"""
+    incident_index.update(instance)
+    if vars(instance).get('duplicate_count'):
+        follow([instance])
+
+
+@receiver(post_delete, sender=Complaint)
+def complaint_deleted(sender, instance, **kwargs):
+    incident_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=ComplaintUpdate)
+@receiver(post_delete, sender=ComplaintUpdate)
+def complaint_update_changed(sender, instance, **kwargs):
+    """The comment thread is part of the complaint's fragments"""
+    fragments.bump(Complaint._meta.label_lower, [instance.complaint_id])
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    """Re-create search triggers dropped when a migration rebuilt the complaint tables"""
+    from django.db import connections
+    from .search import install
+    install(connections[using], create=False)
@@ -1,3 +1,761 @@
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import User
+from dashboard import counters, rollups
+from smartcity import fragments, registry
+from smartcity.benchmarking import simulate_table_stats, full_scans
+from smartcity.pagination import PAGE_SIZE, encode_cursor
+from smartcity.testing import in_another_process
+from . import bulk
+from .duplicates import find_parent, incident_index, submit
+from .escalation import escalate, overdue
+from .forms import ComplaintForm
+from .models import Complaint, ComplaintSequence, ComplaintUpdate, EscalationRule, UtilityType
+from .registry import utility_types
+from .search import match_expression, rebuild, search
+from .sequences import reserve_complaint_ids
+
+
+class ComplaintIdTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.water = UtilityType.objects.create(name='Water Supply', description='Water', department='Water Department')
+
+    def create_complaint(self, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen,
+            utility_type=self.water,
+            title='Leak',
+            description='Pipe leak',
+            address='1 Main Street',
+            **kwargs,
+        )
+
+    def test_ids_are_unique_and_increasing(self):
+        ids = [self.create_complaint().complaint_id for _ in range(5)]
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(ids, sorted(ids))
+        self.assertTrue(all(complaint_id.startswith('WAT-') for complaint_id in ids))
+
+    def test_sequence_continues_after_existing_ids(self):
+        self.create_complaint(complaint_id='WAT-000041')
+        self.assertEqual(self.create_complaint().complaint_id, 'WAT-000042')
+
+    def test_bulk_reservation(self):
+        first = reserve_complaint_ids('ELE', 3)
+        second = reserve_complaint_ids('ELE', 2)
+        self.assertEqual(first + second, ['ELE-000001', 'ELE-000002', 'ELE-000003', 'ELE-000004', 'ELE-000005'])
+        self.assertEqual(ComplaintSequence.objects.get(prefix='ELE').next_value, 6)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite')
+class IndexUsageTests(TestCase):
+    """Officer and citizen listings stay on indexes with 5M complaints"""
+
+    SMALL_TABLES = {'utilities_utilitytype'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        water = UtilityType.objects.create(name='Water Supply', description='Water', department='Water Department')
+        Complaint.objects.create(
+            citizen=cls.citizen, utility_type=water, title='Leak',
+            description='Pipe leak', address='1 Main Street',
+        )
+
+    def setUp(self):
+        simulate_table_stats({
+            'accounts_user': (1_000_000, {}),
+            'utilities_complaint': (5_000_000, {
+                'status': 6, 'citizen_id': 1_000_000, 'assigned_officer_id': 200, 'utility_type_id': 4,
+            }),
+        })
+
+    def assertNoFullScans(self, user, url, allow_sorts=True):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(full_scans(queries.captured_queries, self.SMALL_TABLES, allow_sorts), [])
+
+    def test_officer_dashboard(self):
+        self.assertNoFullScans(self.officer, '/utilities/officer/')
+
+    def test_my_complaints(self):
+        self.assertNoFullScans(self.citizen, '/utilities/my-complaints/', allow_sorts=False)
+        cursor = encode_cursor('next', Complaint.objects.get())
+        self.assertNoFullScans(self.citizen, f'/utilities/my-complaints/?cursor={cursor}', allow_sorts=False)
+
+    def test_escalation_sweep(self):
+        with CaptureQueriesContext(connection) as queries:
+            overdue(timezone.now())
+        self.assertEqual(full_scans(queries.captured_queries, self.SMALL_TABLES | {'utilities_escalationrule'}, False), [])
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        water = UtilityType.objects.create(name='Water Supply', description='Water', department='Water Department')
+        for i in range(60):
+            Complaint.objects.create(
+                citizen=cls.citizen, utility_type=water, title=f'Complaint {i}',
+                description='Pipe leak', address='1 Main Street',
+            )
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):  # Caches the user the way a real login does
+            self.client.force_login(self.citizen)
+
+    def test_pages_cover_every_row_once_at_constant_cost(self):
+        seen = []
+        query = ''
+        while query is not None:
+            with self.assertNumQueries(1):  # one page
+                page = self.client.get(f'/utilities/my-complaints/?{query}').context['complaints']
+            self.assertLessEqual(len(page), PAGE_SIZE)
+            seen.extend(complaint.title for complaint in page)
+            query = page.next_query
+        self.assertEqual(seen, [f'Complaint {i}' for i in reversed(range(60))])
+
+    def test_previous_page(self):
+        first = self.client.get('/utilities/my-complaints/').context['complaints']
+        second = self.client.get(f'/utilities/my-complaints/?{first.next_query}').context['complaints']
+        back = self.client.get(f'/utilities/my-complaints/?{second.previous_query}').context['complaints']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous)
+
+    def test_garbled_cursor_falls_back_to_first_page(self):
+        page = self.client.get('/utilities/my-complaints/?cursor=not-a-cursor').context['complaints']
+        self.assertEqual(page.object_list[0].title, 'Complaint 59')
+
+
+class UtilityTypeRegistryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+
+    def setUp(self):
+        utility_types.all()
+
+    def test_default_types_are_seeded(self):
+        self.assertEqual(
+            [utility_type.name for utility_type in utility_types.all()],
+            ['Water Supply', 'Electricity', 'Garbage Management', 'Road Maintenance'],
+        )
+
+    def test_form_renders_and_validates_without_queries(self):
+        water = UtilityType.objects.get(name='Water Supply')
+        utility_types.all()
+        with self.assertNumQueries(0):
+            html = ComplaintForm().as_p()
+            form = ComplaintForm({'utility_type': water.pk, 'title': 'Leak', 'description': 'Pipe leak',
+                                  'priority': 'medium', 'address': '1 Main Street'})
+            self.assertTrue(form.is_valid(), form.errors)
+        self.assertIn('Road Maintenance', html)
+        self.assertEqual(form.cleaned_data['utility_type'], water)
+        self.assertFalse(ComplaintForm({'utility_type': 999}).is_valid())
+
+    def test_changes_invalidate_the_registry(self):
+        UtilityType.objects.create(name='Street Lights', description='Lights', department='Public Works')
+        self.assertIn('Street Lights', [utility_type.name for utility_type in utility_types.all()])
+        UtilityType.objects.filter(name='Street Lights').get().delete()
+        self.assertNotIn('Street Lights', [utility_type.name for utility_type in utility_types.all()])
+
+    def test_types_added_by_another_worker_are_seen(self):
+        UtilityType.objects.bulk_create([UtilityType(name='Street Lights', description='Lights', department='Public Works')])
+        lights = UtilityType.objects.get(name='Street Lights')
+
+        # A client may send the new type before this worker was told about it
+        form = ComplaintForm({'utility_type': lights.pk, 'title': 'Dark', 'description': 'Lamp out',
+                              'priority': 'medium', 'address': '1 Main Street'})
+        utility_types.loaded_at -= registry.MISS_RELOAD_INTERVAL
+        self.assertTrue(form.is_valid(), form.errors)
+
+        # A rename in another worker reaches this one through the shared generation
+        UtilityType.objects.filter(pk=lights.pk).update(name='Street Lighting')
+        in_another_process(utility_types.invalidate)
+        utility_types.checked_at -= registry.CHECK_INTERVAL
+        self.assertEqual(utility_types.get(lights.pk).name, 'Street Lighting')
+
+    def test_listing_follows_types_from_the_registry(self):
+        for utility_type in utility_types.all():
+            Complaint.objects.create(
+                citizen=self.citizen, utility_type=utility_type, title='Issue',
+                description='Broken', address='1 Main Street',
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        with self.assertNumQueries(1):  # one page
+            response = self.client.get('/utilities/my-complaints/')
+        self.assertContains(response, 'fa-road')
+
+
+class EscalationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.authority = User.objects.create_user('authority', password='pass1234', role='government_authority')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+        cls.roads = UtilityType.objects.get(name='Road Maintenance')
+
+    def setUp(self):
+        cache.clear()
+
+    def complaint(self, hours_old, utility_type=None, **kwargs):
+        complaint = Complaint.objects.create(
+            citizen=self.citizen, utility_type=utility_type or self.water, title='Leak',
+            description='Pipe leak', address='1 Main Street', **kwargs,
+        )
+        Complaint.objects.filter(pk=complaint.pk).update(created_at=timezone.now() - timedelta(hours=hours_old))
+        return complaint
+
+    def test_rules_by_type_and_priority(self):
+        EscalationRule.objects.create(priority='medium', hours=10)
+        EscalationRule.objects.create(utility_type=self.roads, priority='medium', hours=100)
+        water = self.complaint(12)
+        road = self.complaint(12, self.roads)
+        low = self.complaint(12, priority='low')  # Default of 168 hours
+        self.assertEqual(escalate(), 1)
+
+        water.refresh_from_db()
+        self.assertEqual((water.status, water.priority), ('escalated', 'high'))
+        self.assertIsNotNone(water.escalated_at)
+        self.assertEqual(Complaint.objects.filter(pk__in=[road.pk, low.pk], status='pending').count(), 2)
+        self.assertEqual(ComplaintUpdate.objects.get().complaint, water)
+
+    def test_closed_complaints_are_left_alone(self):
+        self.complaint(500, status='resolved')
+        self.complaint(500, status='escalated')
+        self.assertEqual(escalate(), 0)
+
+    def test_nothing_happens_without_an_authority(self):
+        self.complaint(500)
+        User.objects.filter(role='government_authority').delete()
+        self.assertEqual(escalate(), 0)
+
+    def test_batches_keep_rollups_in_step(self):
+        for hours_old in range(100, 107):
+            self.complaint(hours_old, status='in_progress')
+        rollups.rebuild(['complaint'])  # Backdating bypassed the signals
+        self.assertEqual(escalate(limit=5), 5)
+        self.assertEqual(escalate(limit=5), 2)
+        self.assertEqual(escalate(limit=5), 0)
+        self.assertEqual(ComplaintUpdate.objects.count(), 7)
+        self.assertEqual(rollups.drift('complaint'), {})
+
+    def test_query_count_does_not_grow_with_the_backlog(self):
+        def complaint_queries(queries):
+            # Rollup rows depend on how many hours are involved, not how many complaints
+            return [query for query in queries if 'utilities_complaint' in query['sql']]
+
+        self.complaint(500)
+        with CaptureQueriesContext(connection) as few:
+            escalate()
+        for hours_old in range(500, 530):
+            self.complaint(hours_old, self.roads)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(escalate(), 30)
+        # One read per (type, priority) rule, the update, the notes and the parents with duplicates
+        sla_pairs = len(utility_types.all()) * len(Complaint.PRIORITY_CHOICES)
+        self.assertEqual(len(complaint_queries(few)), sla_pairs + 3)
+        self.assertEqual(len(complaint_queries(many)), sla_pairs + 3)
+
+
+class FragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.admin = User.objects.create_user('admin', password='pass1234', is_staff=True, is_superuser=True)
+        cls.water = UtilityType.objects.get(name='Water Supply')
+
+    def setUp(self):
+        cache.clear()
+        fragments.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.officer)
+
+    def create_complaint(self, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen, utility_type=self.water, title='Leak',
+            description='Pipe leak', address='1 Main Street', **kwargs,
+        )
+
+    def test_unchanged_rows_skip_queries_and_rendering(self):
+        for _ in range(5):
+            self.create_complaint()
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get('/utilities/officer/')
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get('/utilities/officer/')
+        # Keys, counts and nothing else: the page of complaints is never loaded whole
+        self.assertEqual(len(warm), len(cold) - 1)
+        self.assertEqual(len(response.context['pending_rows']), 5)
+        self.assertEqual(fragments.report()['utilities/includes/pending_complaint_row.html'],
+                         {'hits': 5, 'misses': 5, 'hit_rate': 0.5})
+
+    def test_bumps_in_another_worker_re_render_the_row(self):
+        complaint = self.create_complaint(assigned_officer=self.officer, status='assigned')
+        self.client.get('/utilities/officer/')
+
+        # Another worker changes the complaint; only its version bump reaches this one
+        Complaint.objects.filter(pk=complaint.pk).update(status='in_progress')
+        in_another_process(fragments.bump, Complaint._meta.label_lower, [complaint.pk])
+        self.assertContains(self.client.get('/utilities/officer/'), 'In Progress')
+
+    def test_saves_re_render_just_their_row(self):
+        complaint, other = self.create_complaint(), self.create_complaint()
+        complaint.assigned_officer = self.officer
+        complaint.save()
+        self.client.get('/utilities/officer/')
+
+        complaint.status = 'in_progress'
+        complaint.save()
+        response = self.client.get('/utilities/officer/')
+        self.assertContains(response, 'In Progress')
+        self.assertEqual(fragments.report()['utilities/includes/assigned_complaint_row.html']['misses'], 2)
+
+        # Escalation changes rows with one UPDATE and bumps their versions itself
+        Complaint.objects.update(created_at=timezone.now() - timedelta(days=30))
+        User.objects.create_user('gov', password='pass1234', role='government_authority')
+        self.assertEqual(escalate(), 2)
+        response = self.client.get('/utilities/officer/')
+        self.assertContains(response, 'Escalated')
+
+    def test_comment_thread_follows_new_updates(self):
+        complaint = self.create_complaint()
+        ComplaintUpdate.objects.create(complaint=complaint, updated_by=self.officer, update_text='On our way')
+        self.client.get(f'/utilities/detail/{complaint.complaint_id}/')
+        with self.assertNumQueries(1):  # The complaint; its thread is cached
+            self.client.get(f'/utilities/detail/{complaint.complaint_id}/')
+
+        ComplaintUpdate.objects.create(complaint=complaint, updated_by=self.officer, update_text='Fixed the pipe')
+        response = self.client.get(f'/utilities/detail/{complaint.complaint_id}/')
+        self.assertContains(response, 'Fixed the pipe')
+        self.assertContains(response, 'On our way')
+
+    def test_renaming_a_type_re_renders_its_rows(self):
+        self.create_complaint()
+        self.client.get('/utilities/officer/')
+        self.water.name = 'Water Board'
+        self.water.save()
+        self.assertContains(self.client.get('/utilities/officer/'), 'Water Board')
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get('/admin/fragment-stats/').status_code, 302)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/admin/fragment-stats/').status_code, 200)
+
+
+class ComplaintSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+        cls.power = UtilityType.objects.get(name='Electricity')
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.officer)
+
+    def create_complaint(self, title, description='Reported by a resident', utility_type=None, **kwargs):
+        return Complaint.objects.create(
+            citizen=self.citizen, utility_type=utility_type or self.water, title=title,
+            description=description, address='1 Main Street', **kwargs,
+        )
+
+    def found(self, text, **filters):
+        return [complaint.pk for complaint in search(text, **filters)]
+
+    def test_index_follows_writes(self):
+        complaint = self.create_complaint('Burst pipe')
+        self.assertEqual(self.found('burst'), [complaint.pk])
+
+        complaint.title = 'Flooded basement'
+        complaint.save()
+        self.assertEqual(self.found('burst'), [])
+        self.assertEqual(self.found('flooded'), [complaint.pk])
+
+        # Updates are indexed with their complaint, also when created in bulk
+        ComplaintUpdate.objects.bulk_create([
+            ComplaintUpdate(complaint=complaint, updated_by=self.officer, update_text='Valve replaced'),
+        ])
+        self.assertEqual(self.found('valve'), [complaint.pk])
+        complaint.updates.all().delete()
+        self.assertEqual(self.found('valve'), [])
+
+        complaint.delete()
+        self.assertEqual(self.found('flooded'), [])
+
+    def test_title_matches_rank_first_and_words_stem(self):
+        mentioned = self.create_complaint('Low pressure', description='Probably a leaking main')
+        titled = self.create_complaint('Leaks near the school')
+        self.assertEqual(self.found('leak'), [titled.pk, mentioned.pk])
+        self.assertEqual(self.found('leaking school'), [titled.pk])
+
+    def test_filters(self):
+        old = self.create_complaint('Street light out', utility_type=self.power)
+        Complaint.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        new = self.create_complaint('Street light flickering', utility_type=self.power, status='resolved')
+        self.create_complaint('Street flooding')
+
+        self.assertCountEqual(self.found('street light'), [old.pk, new.pk])
+        self.assertEqual(self.found('street', status='resolved'), [new.pk])
+        self.assertCountEqual(self.found('street', utility_type=self.power.pk), [old.pk, new.pk])
+        self.assertEqual(self.found('light', until=timezone.now() - timedelta(days=1)), [old.pk])
+
+    def test_only_the_newest_matches_are_ranked(self):
+        oldest, older, newest = [self.create_complaint(f'Pothole {n}') for n in range(3)]
+        Complaint.objects.filter(pk=oldest.pk).update(created_at=timezone.now() - timedelta(days=60))
+        with mock.patch('utilities.search.RANK_WINDOW', 2):
+            self.assertCountEqual(self.found('pothole'), [older.pk, newest.pk])
+            # Filters apply before the window, so narrowing the dates reaches older complaints
+            self.assertEqual(self.found('pothole', until=timezone.now() - timedelta(days=30)), [oldest.pk])
+            self.assertTrue(search('pothole').truncated)
+            self.assertFalse(search('pothole', until=timezone.now() - timedelta(days=30)).truncated)
+            # The page says so
+            response = self.client.get('/utilities/search/', {'q': 'pothole'})
+            self.assertContains(response, 'Only the newest 2 matches are ranked.')
+
+    def test_search_syntax_in_input_is_taken_literally(self):
+        complaint = self.create_complaint('Garbage left uncollected')
+        self.assertEqual(match_expression('title: "garbage OR col*'), '"title" "garbage" "or" "col"*')
+        self.assertEqual(self.found('NOT garbage'), [])
+        self.assertEqual(self.found('garb'), [])
+        self.assertEqual(self.found('garb*'), [complaint.pk])
+
+    def test_rebuild_restores_a_damaged_index(self):
+        complaint = self.create_complaint('Broken meter')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM utilities_complaint_fts')
+        self.assertEqual(self.found('meter'), [])
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual(self.found('meter'), [complaint.pk])
+
+    def test_view_ranks_then_loads_one_page(self):
+        self.create_complaint('Sewage overflow', description='<b>Sewage</b> on the road')
+        with self.assertNumQueries(2):  # The ranked window, then the page of complaints
+            response = self.client.get('/utilities/search/', {'q': 'sewage', 'status': 'pending'})
+        self.assertEqual(len(response.context['results']), 1)
+        self.assertContains(response, '&lt;b&gt;<mark>Sewage</mark>&lt;/b&gt; on the road')
+
+        # Dates at the ends of the calendar are refused rather than overflowing
+        response = self.client.get('/utilities/search/', {'q': 'sewage', 'since': '0001-01-01', 'until': '9999-12-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results'], [])
+        self.assertEqual(set(response.context['form'].errors), {'since', 'until'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        self.assertRedirects(self.client.get('/utilities/search/', {'q': 'sewage'}), '/dashboard/',
+                             fetch_redirect_response=False)
+
+
+class DuplicateComplaintTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.neighbour = User.objects.create_user('neighbour', password='pass1234', role='citizen')
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+        cls.power = UtilityType.objects.get(name='Electricity')
+
+    def setUp(self):
+        cache.clear()
+        incident_index.rebuild()
+        self.incident = self.report(self.citizen, 12.9716, 77.5946)
+
+    def report(self, citizen, lat, lng, utility_type=None):
+        complaint = Complaint(
+            citizen=citizen, utility_type=utility_type or self.water, title='Burst main',
+            description='Water everywhere', address='MG Road', location_lat=lat, location_lng=lng,
+        )
+        submit(complaint)
+        return complaint
+
+    def test_nearby_report_is_linked_to_the_open_incident(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.neighbour)
+        response = self.client.post('/utilities/submit/', {
+            'utility_type': self.water.pk, 'title': 'Pipe burst', 'description': 'Road flooded',
+            'priority': 'high', 'address': 'MG Road', 'location_lat': '12.9725', 'location_lng': '77.5950',
+        })
+        self.assertRedirects(response, '/utilities/my-complaints/', fetch_redirect_response=False)
+        duplicate = Complaint.objects.get(citizen=self.neighbour)
+        self.assertEqual(duplicate.parent, self.incident)
+        self.incident.refresh_from_db()
+        self.assertEqual(self.incident.duplicate_count, 1)
+
+        # Officers see the incident once
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.officer)
+        response = self.client.get('/utilities/officer/')
+        self.assertEqual(response.context['total_pending'], 1)
+        self.assertContains(response, '+1 report')
+
+    def test_saving_a_stale_copy_keeps_the_duplicate_count(self):
+        stale = Complaint.objects.get(pk=self.incident.pk)
+        self.report(self.neighbour, 12.9720, 77.5946)
+        stale.status = 'in_progress'
+        stale.save()
+        self.incident.refresh_from_db()
+        self.assertEqual((self.incident.status, self.incident.duplicate_count), ('in_progress', 1))
+
+    def test_saving_a_deleted_complaint_inserts_it_again(self):
+        self.report(self.neighbour, 12.9720, 77.5946)
+        self.incident.refresh_from_db()
+        Complaint.objects.filter(pk=self.incident.pk).delete()
+        self.incident.save()
+        restored = Complaint.objects.get(pk=self.incident.pk)
+        self.assertEqual((restored.complaint_id, restored.duplicate_count), (self.incident.complaint_id, 1))
+
+    def test_incident_closed_after_the_lookup_takes_no_duplicate(self):
+        found = find_parent(Complaint(utility_type=self.water, location_lat=12.9720, location_lng=77.5946))
+        Complaint.objects.filter(pk=self.incident.pk).update(status='resolved')
+        with mock.patch('utilities.duplicates.find_parent', return_value=found):
+            complaint = self.report(self.neighbour, 12.9720, 77.5946)
+        self.assertIsNone(complaint.parent_id)
+        self.assertEqual(complaint.status, 'pending')
+        self.assertEqual(Complaint.objects.get(pk=self.incident.pk).duplicate_count, 0)
+
+    def test_only_open_nearby_incidents_of_the_type_match(self):
+        def parent(lat, lng, utility_type=None):
+            return find_parent(Complaint(utility_type=utility_type or self.water, location_lat=lat, location_lng=lng))
+
+        self.assertEqual(parent(12.9720, 77.5946), self.incident)
+        self.assertIsNone(parent(12.9760, 77.5946))  # ~490 m north
+        self.assertIsNone(parent(12.9720, 77.5946, self.power))
+        self.assertIsNone(parent(None, None))
+
+        self.incident.status = 'resolved'
+        self.incident.save()
+        self.assertIsNone(parent(12.9720, 77.5946))
+
+    def test_lookup_is_served_from_the_index(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(incident_index.find(self.water.pk, 12.9720, 77.5946), [self.incident.pk])
+        # Incidents filed before the window are not matched
+        self.assertEqual(incident_index.find(self.water.pk, 12.9720, 77.5946, now=timezone.now() + timedelta(days=4)), [])
+
+    def test_duplicates_follow_their_parent(self):
+        duplicate = self.report(self.neighbour, 12.9718, 77.5947)
+        self.assertEqual(duplicate.parent_id, self.incident.pk)
+
+        incident = Complaint.objects.get(pk=self.incident.pk)
+        incident.assigned_officer = self.officer
+        incident.status = 'in_progress'
+        incident.save()
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, 'in_progress')
+        self.assertIsNone(duplicate.assigned_officer_id)  # Not a work item of its own
+
+        incident.status = 'resolved'
+        incident.resolution_notes = 'Main repaired'
+        incident.save()
+        duplicate.refresh_from_db()
+        self.assertEqual((duplicate.status, duplicate.resolution_notes), ('resolved', 'Main repaired'))
+        self.assertEqual(duplicate.resolved_at, incident.resolved_at)
+        self.assertEqual(counters.for_citizen(self.neighbour)['complaint']['resolved'], 1)
+        self.assertEqual(counters.drift('complaint'), {})
+
+    def test_escalation_carries_to_duplicates(self):
+        duplicate = self.report(self.neighbour, 12.9718, 77.5947)
+        Complaint.objects.update(created_at=timezone.now() - timedelta(days=30))
+        User.objects.create_user('gov', password='pass1234', role='government_authority')
+        self.assertEqual(escalate(), 1)  # The incident, not each report of it
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, 'escalated')
+        self.assertEqual(ComplaintUpdate.objects.count(), 1)
+
+
+class BulkActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.other = User.objects.create_user('other', password='pass1234', role='utility_officer')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+
+    def setUp(self):
+        cache.clear()
+        incident_index.rebuild()
+
+    def create_complaints(self, count, **kwargs):
+        return [
+            Complaint.objects.create(
+                citizen=self.citizen, utility_type=self.water, title=f'Leak {n}',
+                description='Pipe leak', address='1 Main Street', **kwargs,
+            )
+            for n in range(count)
+        ]
+
+    def test_claim_takes_only_unclaimed_incidents(self):
+        mine, taken = self.create_complaints(2)
+        taken.assigned_officer, taken.status = self.other, 'assigned'
+        taken.save()
+        duplicate = Complaint.objects.create(
+            citizen=self.citizen, utility_type=self.water, title='Leak', description='Pipe leak',
+            address='1 Main Street', parent=mine,
+        )
+
+        claimed = bulk.claim(self.officer, [mine.pk, taken.pk, duplicate.pk], note='Crew on the way')
+        self.assertEqual(claimed, [mine.pk])
+        mine.refresh_from_db()
+        self.assertEqual((mine.status, mine.assigned_officer), ('assigned', self.officer))
+        self.assertIsNotNone(mine.assigned_at)
+        self.assertEqual(list(mine.updates.values_list('update_text', flat=True)), ['Crew on the way'])
+        self.assertEqual(Complaint.objects.get(pk=taken.pk).assigned_officer, self.other)
+        self.assertEqual(rollups.drift('complaint'), {})
+        self.assertEqual(counters.drift('complaint'), {})
+
+    def test_status_change_sets_timestamps_once(self):
+        complaints = self.create_complaints(3, assigned_officer=self.officer, status='assigned')
+        assigned_at = Complaint.objects.get(pk=complaints[0].pk).assigned_at
+        foreign = self.create_complaints(1, assigned_officer=self.other, status='assigned')[0]
+
+        changed = bulk.change_status(self.officer, [c.pk for c in complaints] + [foreign.pk], 'resolved', 'Main repaired')
+        self.assertEqual(sorted(changed), sorted(c.pk for c in complaints))
+        resolved = Complaint.objects.get(pk=complaints[0].pk)
+        self.assertEqual(resolved.status, 'resolved')
+        self.assertEqual(resolved.assigned_at, assigned_at)
+        self.assertIsNotNone(resolved.resolved_at)
+        self.assertEqual(Complaint.objects.get(pk=foreign.pk).status, 'assigned')
+        self.assertEqual(ComplaintUpdate.objects.filter(update_text='Main repaired').count(), 3)
+        self.assertEqual(counters.for_citizen(self.citizen)['complaint']['resolved'], 3)
+        self.assertEqual(rollups.drift('complaint'), {})
+
+        # Reopening keeps the first resolution time, as save() would
+        bulk.change_status(self.officer, [resolved.pk], 'in_progress')
+        bulk.change_status(self.officer, [resolved.pk], 'resolved')
+        self.assertEqual(Complaint.objects.get(pk=resolved.pk).resolved_at, resolved.resolved_at)
+
+    def test_closing_an_incident_carries_to_its_duplicates(self):
+        incident = Complaint(
+            citizen=self.citizen, utility_type=self.water, title='Burst main', description='Water everywhere',
+            address='MG Road', location_lat=12.9716, location_lng=77.5946,
+        )
+        submit(incident)
+        duplicate = Complaint(
+            citizen=self.citizen, utility_type=self.water, title='Burst main', description='Flooded',
+            address='MG Road', location_lat=12.9717, location_lng=77.5946,
+        )
+        submit(duplicate)
+        bulk.claim(self.officer, [incident.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.change_status(self.officer, [incident.pk], 'resolved')
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, 'resolved')
+        self.assertIsNotNone(duplicate.resolved_at)
+        self.assertEqual(incident_index.find(self.water.pk, 12.9716, 77.5946), [])
+
+    def test_query_count_does_not_grow_with_the_selection(self):
+        def queries(count):
+            complaints = self.create_complaints(count)
+            with CaptureQueriesContext(connection) as captured:
+                bulk.claim(self.officer, [c.pk for c in complaints], note='Storm damage')
+            return len(captured)
+
+        queries(5)  # Creates the rollup rows for 'assigned'
+        self.assertEqual(queries(5), queries(50))
+
+    def test_dashboard_form(self):
+        complaints = self.create_complaints(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.officer)
+        self.assertContains(self.client.get('/utilities/officer/'), 'form="pending-bulk-form"', count=2)
+
+        response = self.client.post('/utilities/officer/bulk/', {'action': 'claim', 'complaints': [c.pk for c in complaints]})
+        self.assertRedirects(response, '/utilities/officer/', fetch_redirect_response=False)
+        self.assertEqual(Complaint.objects.filter(assigned_officer=self.officer).count(), 2)
+
+        response = self.client.post('/utilities/officer/bulk/', {'action': 'status', 'complaints': [complaints[0].pk]})
+        self.assertEqual(Complaint.objects.get(pk=complaints[0].pk).status, 'assigned')  # No status chosen
+        response = self.client.post('/utilities/officer/bulk/', {
+            'action': 'note', 'complaints': [c.pk for c in complaints], 'notes': 'Parts ordered',
+        })
+        self.assertEqual(ComplaintUpdate.objects.filter(update_text='Parts ordered').count(), 2)
+
+        for bad in ('99999999999999999999999', '-1', '0', 'x'):
+            response = self.client.post('/utilities/officer/bulk/', {'action': 'claim', 'complaints': [bad]}, follow=True)
+            self.assertContains(response, 'Invalid complaint selection.')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+        self.client.post('/utilities/officer/bulk/', {'action': 'claim', 'complaints': [complaints[0].pk]})
+        self.assertEqual(ComplaintUpdate.objects.count(), 2)
+
+
+class CitizenApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.citizen = User.objects.create_user('citizen', password='pass1234', role='citizen')
+        cls.officer = User.objects.create_user('officer', password='pass1234', role='utility_officer')
+        cls.water = UtilityType.objects.get(name='Water Supply')
+
+    def setUp(self):
+        cache.clear()
+        incident_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.citizen)
+
+    def poll(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/utilities/api/my-complaints/', params, **headers)
+
+    def test_changes_made_in_bulk_or_to_types_change_the_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint = Complaint.objects.create(
+                citizen=self.citizen, utility_type=self.water, title='Leak',
+                description='Pipe leak', address='1 Main Street',
+            )
+        response = self.poll()
+        [listed] = response.json()['complaints']
+        self.assertEqual((listed['complaint_id'], listed['department']), (complaint.complaint_id, 'Water Department'))
+        etag = response['ETag']
+        self.assertEqual(self.poll(etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.claim(self.officer, [complaint.pk])
+        response = self.poll(etag)
+        self.assertEqual((response.status_code, response.json()['complaints'][0]['status']), (200, 'assigned'))
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.water.name = 'Water Mains'
+            self.water.save()
+        response = self.poll(etag)
+        self.assertEqual((response.status_code, response.json()['complaints'][0]['utility_type']), (200, 'Water Mains'))
 
-# Create your tests here.
+    def test_pages_have_their_own_etags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(PAGE_SIZE + 1):
+                Complaint.objects.create(
+                    citizen=self.citizen, utility_type=self.water, title=f'Leak {n}',
+                    description='Pipe leak', address=f'{n} Main Street',
+                )
+        first = self.poll()
+        self.assertEqual(len(first.json()['complaints']), PAGE_SIZE)
+        cursor = first.json()['next'].split('cursor=')[1]
+        second = self.poll(first['ETag'], cursor=cursor)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.json()['complaints']), 1)
@@ -1,10 +1,28 @@
+from datetime import datetime, time, timedelta
+
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.db.models import Q
+from django.http import JsonResponse
+from django.urls import reverse
 from django.utils import timezone 
-from .models import Complaint, UtilityType, ComplaintUpdate
-from .forms import ComplaintForm
+from django.utils.cache import get_conditional_response
+from dashboard import changes
+from smartcity import fragments
+from smartcity.pagination import keyset_paginate
+from . import bulk, duplicates, search
+from .models import Complaint, ComplaintUpdate
+from .registry import utility_types
+from .forms import BulkComplaintForm, ComplaintForm, ComplaintSearchForm
+
+SEARCH_PAGE_SIZE = 25
+# What the citizen status API reads of each complaint
+API_FIELDS = (
+    'citizen_id', 'complaint_id', 'utility_type_id', 'title', 'priority', 'status', 'address',
+    'created_at', 'updated_at', 'assigned_at', 'resolved_at', 'escalated_at', 'parent_id',
+)
 
 @login_required
 def citizen_submit_complaint(request):
@@ -13,51 +31,30 @@ def citizen_submit_complaint(request):
         messages.error(request, 'Access denied. Only citizens can report complaints.')
         return redirect('dashboard:dashboard')
     
-    # Create default utility types if none exist
-    if not UtilityType.objects.exists():
-        UtilityType.objects.create(
-            name='Water Supply',
-            description='Water supply issues including leaks, low pressure, contamination',
-            department='Water Department',
-            icon='tint'
-        )
-        UtilityType.objects.create(
-            name='Electricity',
-            description='Power outages, electrical faults, billing issues',
-            department='Electricity Board',
-            icon='bolt'
-        )
-        UtilityType.objects.create(
-            name='Garbage Management',
-            description='Garbage collection, waste disposal, cleanliness issues',
-            department='Municipal Corporation',
-            icon='trash'
-        )
-        UtilityType.objects.create(
-            name='Road Maintenance',
-            description='Potholes, road damage, street lighting issues',
-            department='Public Works',
-            icon='road'
-        )
-    
     if request.method == 'POST':
         form = ComplaintForm(request.POST, user=request.user)
         if form.is_valid():
             complaint = form.save(commit=False)
             complaint.citizen = request.user
-            complaint.save()
+            parent = duplicates.submit(complaint)
             
-            messages.success(request, f'Complaint submitted successfully! Complaint ID: {complaint.complaint_id}')
+            if parent is not None:
+                messages.success(
+                    request,
+                    f'Complaint submitted successfully! Complaint ID: {complaint.complaint_id}. '
+                    f'It matches complaint {parent.complaint_id} reported nearby, which is already being handled; '
+                    f'yours will follow its progress.'
+                )
+            else:
+                messages.success(request, f'Complaint submitted successfully! Complaint ID: {complaint.complaint_id}')
             return redirect('utilities:my_complaints')
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
         form = ComplaintForm(user=request.user)
     
-    utility_types = UtilityType.objects.all()
     return render(request, 'utilities/citizen_submit_complaint.html', {
         'form': form,
-        'utility_types': utility_types,
     })
 
 
@@ -68,17 +65,60 @@ def my_complaints(request):
         messages.error(request, 'Access denied.')
         return redirect('dashboard:dashboard')
     
-    complaints = Complaint.objects.filter(citizen=request.user).order_by('-created_at')
+    complaints = keyset_paginate(request, Complaint.objects.filter(citizen=request.user))
+    utility_types.attach(complaints, 'utility_type')
     
     return render(request, 'utilities/my_complaints.html', {
         'complaints': complaints,
     })
 
 
+@login_required
+def my_complaints_api(request):
+    """A citizen's complaints as JSON, newest first; unchanged polls get 304 after one lookup"""
+    if request.user.role != 'citizen':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    etag, last_modified = changes.validators(
+        'complaint', request.user.pk, request.GET.urlencode(), depends=[('utilities.utilitytype', fragments.ALL)],
+    )
+    unchanged = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if unchanged is not None:
+        return changes.stamp(unchanged, etag, last_modified)
+    
+    complaints = keyset_paginate(request, Complaint.objects.filter(citizen=request.user).only(*API_FIELDS))
+    utility_types.attach(complaints, 'utility_type')
+    return changes.stamp(JsonResponse({
+        'complaints': [
+            {
+                'complaint_id': complaint.complaint_id,
+                'title': complaint.title,
+                'utility_type': complaint.utility_type.name,
+                'department': complaint.utility_type.department,
+                'priority': complaint.priority,
+                'status': complaint.status,
+                'status_display': complaint.get_status_display(),
+                'address': complaint.address,
+                'created_at': complaint.created_at,
+                'updated_at': complaint.updated_at,
+                'assigned_at': complaint.assigned_at,
+                'resolved_at': complaint.resolved_at,
+                'escalated_at': complaint.escalated_at,
+                'is_duplicate': complaint.parent_id is not None,
+                'url': reverse('utilities:detail', args=[complaint.complaint_id]),
+            }
+            for complaint in complaints
+        ],
+        'next': f'?{complaints.next_query}' if complaints.has_next else None,
+        'previous': f'?{complaints.previous_query}' if complaints.has_previous else None,
+    }), etag, last_modified)
+
+
 @login_required
 def complaint_detail(request, complaint_id):
     """View details of a specific complaint"""
-    complaint = Complaint.objects.get(complaint_id=complaint_id)
+    complaint = Complaint.objects.select_related('parent').get(complaint_id=complaint_id)
+    utility_types.attach([complaint], 'utility_type')
     
     # Check if user has permission to view this complaint
     if request.user.role != 'citizen' or complaint.citizen != request.user:
@@ -86,11 +126,17 @@ def complaint_detail(request, complaint_id):
             messages.error(request, 'Access denied.')
             return redirect('dashboard:dashboard')
     
-    updates = complaint.updates.all().order_by('-created_at')
+    # The thread is only read and rendered again after the complaint or a comment changed
+    updates_thread = fragments.render(
+        'utilities/includes/complaint_updates.html', complaint.pk,
+        lambda pk: [('utilities.complaint', pk)],
+        lambda pks: {complaint.pk: complaint.updates.select_related('updated_by').order_by('-created_at')},
+        'updates',
+    )
     
     return render(request, 'utilities/complaint_detail.html', {
         'complaint': complaint,
-        'updates': updates,
+        'updates_thread': updates_thread,
     })
 
 
@@ -106,13 +152,14 @@ def officer_dashboard(request):
     assigned_complaints = Complaint.objects.filter(
         assigned_officer=request.user,
         status__in=['pending', 'assigned', 'in_progress', 'escalated']
-    ).order_by('-created_at')
+    )
     
-    # Get pending complaints (not assigned to anyone)
+    # Get pending complaints (not assigned to anyone; duplicates follow their parent instead)
     pending_complaints = Complaint.objects.filter(
         status='pending',
-        assigned_officer__isnull=True
-    ).order_by('-created_at')
+        assigned_officer__isnull=True,
+        parent__isnull=True,
+    )
     
     # Get statistics
     total_assigned = assigned_complaints.count()
@@ -121,20 +168,89 @@ def officer_dashboard(request):
     resolved_today = Complaint.objects.filter(
         assigned_officer=request.user,
         status='resolved',
-        resolved_at__date=timezone.now().date()
+        resolved_at__gte=timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
     ).count()
     
+    # Each listing pages independently on keys alone; rows come from the fragment cache
+    assigned_complaints = keyset_paginate(request, assigned_complaints.only('id', 'created_at'), param='assigned_cursor')
+    pending_complaints = keyset_paginate(request, pending_complaints.only('id', 'created_at'), param='pending_cursor')
+    
     context = {
         'assigned_complaints': assigned_complaints,
         'pending_complaints': pending_complaints,
+        'assigned_rows': _complaint_rows('utilities/includes/assigned_complaint_row.html', assigned_complaints),
+        'pending_rows': _complaint_rows('utilities/includes/pending_complaint_row.html', pending_complaints),
         'total_assigned': total_assigned,
         'total_pending': total_pending,
         'in_progress': in_progress,
         'resolved_today': resolved_today,
+        'bulk_form': BulkComplaintForm(),
     }
     
     return render(request, 'utilities/officer_dashboard.html', context)
 
+
+@login_required
+def search_complaints(request):
+    """Ranked full-text search over complaints and their updates"""
+    if request.user.role not in ['utility_officer', 'government_authority']:
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard:dashboard')
+    
+    form = ComplaintSearchForm(request.GET or None)
+    results, page, has_next, truncated = [], 1, False, False
+    if form.is_valid() and form.cleaned_data['q']:
+        data = form.cleaned_data
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        # One extra row tells whether there is a next page without counting every match
+        results = search.search(
+            data['q'],
+            status=data['status'] or None,
+            utility_type=data['utility_type'].pk if data['utility_type'] else None,
+            since=_day_start(data['since']) if data['since'] else None,
+            # Dates are whole days, so the search stops where the day after starts
+            until=_day_start(data['until'] + timedelta(days=1)) if data['until'] else None,
+            limit=SEARCH_PAGE_SIZE + 1,
+            offset=(page - 1) * SEARCH_PAGE_SIZE,
+        )
+        has_next, truncated = len(results) > SEARCH_PAGE_SIZE, results.truncated
+        results = results[:SEARCH_PAGE_SIZE]
+        utility_types.attach(results, 'utility_type')
+    
+    query = request.GET.copy()
+    query.pop('page', None)
+    return render(request, 'utilities/search.html', {
+        'form': form,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+        'truncated': truncated,
+        'rank_window': search.RANK_WINDOW,
+        'query_string': query.urlencode(),
+    })
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _complaint_rows(template_name, page):
+    """Rendered rows of a page of complaints, loading only the ones not cached"""
+    def load(pks):
+        complaints = Complaint.objects.in_bulk(pks)
+        utility_types.attach(complaints.values(), 'utility_type')
+        return complaints
+    
+    return fragments.render_many(
+        template_name, [complaint.pk for complaint in page],
+        lambda pk: [('utilities.complaint', pk), ('utilities.utilitytype', fragments.ALL)],
+        load, 'comp',
+    )
+
+
 @login_required
 def assign_complaint(request, complaint_id):
     """Assign complaint to an officer"""
@@ -143,6 +259,7 @@ def assign_complaint(request, complaint_id):
         return redirect('dashboard:dashboard')
     
     complaint = Complaint.objects.get(id=complaint_id)
+    utility_types.attach([complaint], 'utility_type')
     
     if request.method == 'POST':
         # Assign to current officer
@@ -166,6 +283,7 @@ def update_complaint_status(request, complaint_id):
         return redirect('dashboard:dashboard')
     
     complaint = Complaint.objects.get(id=complaint_id)
+    utility_types.attach([complaint], 'utility_type')
     
     # Verify officer is assigned to this complaint
     if complaint.assigned_officer != request.user:
@@ -193,4 +311,37 @@ def update_complaint_status(request, complaint_id):
     
     return render(request, 'utilities/update_complaint_status.html', {
         'complaint': complaint,
-    })
\ No newline at end of file
+    })
+
+
+@login_required
+@require_POST
+def bulk_update_complaints(request):
+    """Claim, change the status of or add a note to the complaints ticked on the officer dashboard"""
+    if request.user.role != 'utility_officer':
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard:dashboard')
+    
+    form = BulkComplaintForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            messages.error(request, errors[0])
+        return redirect('utilities:officer_dashboard')
+    
+    data = form.cleaned_data
+    selected, notes = data['complaints'], data['notes'].strip()
+    if data['action'] == 'claim':
+        done = bulk.claim(request.user, selected, notes)
+        summary = f'{len(done)} complaint(s) assigned to you.'
+    elif data['action'] == 'status':
+        done = bulk.change_status(request.user, selected, data['status'], notes)
+        summary = f'{len(done)} complaint(s) moved to {dict(bulk.OFFICER_STATUSES)[data["status"]]}.'
+    else:
+        done = bulk.add_note(request.user, selected, notes)
+        summary = f'Note added to {len(done)} complaint(s).'
+    
+    messages.success(request, summary)
+    if len(done) < len(selected):
+        messages.warning(request, f'{len(selected) - len(done)} selected complaint(s) were skipped: '
+                                  'already claimed, not assigned to you or already in that status.')
+    return redirect('utilities:officer_dashboard')